@@ -62,6 +62,141 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '127.0.0.1,localhost').split(',')
 DATA_UPLOAD_MAX_MEMORY_SIZE = 15 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 15 * 1024 * 1024
 
+# ============================================================
+# RAG PERFORMANCE
+# ============================================================
+# In-process LRU cache of loaded session FAISS indexes (per worker).
+RAG_INDEX_CACHE_MAX_ENTRIES = int(os.getenv('RAG_INDEX_CACHE_MAX_ENTRIES', '32'))
+RAG_INDEX_CACHE_MAX_MB = int(os.getenv('RAG_INDEX_CACHE_MAX_MB', '512'))
+RAG_INDEX_CACHE_TTL = int(os.getenv('RAG_INDEX_CACHE_TTL', '1800'))
+
+# On-disk caches shared by all workers (embeddings, ...).
+RAG_CACHE_DIR = Path(os.getenv('RAG_CACHE_DIR', BASE_DIR / 'cache'))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '1024'))
+
+# Web search results, query embeddings and intent decisions are shared by all workers
+# through a second on-disk cache, each with its own TTL in seconds (0 disables one).
+# RAG_SHARED_CACHE_BACKEND: disk, memory (per process) or none.
+RAG_SHARED_CACHE_BACKEND = os.getenv('RAG_SHARED_CACHE_BACKEND', 'disk')
+RAG_SHARED_CACHE_MAX_MB = int(os.getenv('RAG_SHARED_CACHE_MAX_MB', '256'))
+WEB_SEARCH_CACHE_TTL = int(os.getenv('WEB_SEARCH_CACHE_TTL', '3600'))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv('QUERY_EMBEDDING_CACHE_TTL', str(7 * 86400)))
+INTENT_CACHE_TTL = int(os.getenv('INTENT_CACHE_TTL', '86400'))
+
+# Ingestion embeds chunks in batches; EMBEDDING_WORKERS > 1 fans batches out
+# to a process pool (each worker loads its own copy of the model).
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_WORKERS = int(os.getenv('EMBEDDING_WORKERS', '0'))
+
+# Loaders stream chunks to the embedder through a queue of at most this many
+# row/page groups, so large spreadsheets and PDFs are never held in memory whole.
+INGESTION_QUEUE_SIZE = int(os.getenv('INGESTION_QUEUE_SIZE', '64'))
+# Embedded chunks are written out as an index segment every this many chunks, so
+# memory stays bounded however large the upload is.
+INGESTION_SEGMENT_CHUNKS = int(os.getenv('INGESTION_SEGMENT_CHUNKS', '20000'))
+
+# PDFs are extracted page by page, in-process by default; PDF_WORKERS > 1
+# processes ranges of PDF_PAGES_PER_TASK pages in a process pool instead
+# (worth it for large scanned PDFs, at the cost of one process per worker). Pages with fewer than
+# PDF_MIN_TEXT_CHARS characters of text layer are rasterized at PDF_OCR_DPI
+# and OCRed with Tesseract.
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '0'))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '4'))
+PDF_MIN_TEXT_CHARS = int(os.getenv('PDF_MIN_TEXT_CHARS', '20'))
+PDF_OCR_DPI = int(os.getenv('PDF_OCR_DPI', '300'))
+
+# URL sources: up to MAX_URLS_PER_UPLOAD per upload, fetched over a pooled HTTP
+# session with at most URL_FETCH_PER_HOST concurrent requests per host. Bodies over
+# URL_FETCH_MAX_MB are dropped. Pages sent with an ETag or Last-Modified are kept on
+# disk (up to URL_CACHE_MAX_MB) so re-fetching an unchanged page is a 304.
+MAX_URLS_PER_UPLOAD = int(os.getenv('MAX_URLS_PER_UPLOAD', '20'))
+URL_FETCH_MAX_MB = int(os.getenv('URL_FETCH_MAX_MB', '20'))
+URL_FETCH_TIMEOUT = int(os.getenv('URL_FETCH_TIMEOUT', '15'))
+URL_FETCH_PER_HOST = int(os.getenv('URL_FETCH_PER_HOST', '4'))
+URL_FETCH_POOL_SIZE = int(os.getenv('URL_FETCH_POOL_SIZE', '16'))
+URL_CACHE_MAX_MB = int(os.getenv('URL_CACHE_MAX_MB', '256'))
+
+# Tesseract settings for images and scanned pages. Results are cached on disk
+# by image content, so re-uploaded images are not OCRed again.
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+OCR_PSM = int(os.getenv('OCR_PSM', '3'))
+OCR_CACHE_MAX_MB = int(os.getenv('OCR_CACHE_MAX_MB', '256'))
+
+# Only needed when Poppler / Tesseract are not on PATH.
+POPPLER_PATH = os.getenv('POPPLER_PATH') or None
+TESSERACT_CMD = os.getenv('TESSERACT_CMD') or None
+
+# Uploads append delta segments to a session index; once there are more than
+# this many deltas they are merged into a new base segment in the background.
+FAISS_MAX_DELTA_SEGMENTS = int(os.getenv('FAISS_MAX_DELTA_SEGMENTS', '8'))
+
+# Index type by session size: exact flat up to FAISS_FLAT_MAX_VECTORS, HNSW up
+# to FAISS_HNSW_MAX_VECTORS, IVF beyond. FAISS_QUANTIZATION (none, sq8, pq)
+# compresses the vectors of HNSW/IVF indexes. Rebuilds happen on compaction.
+FAISS_FLAT_MAX_VECTORS = int(os.getenv('FAISS_FLAT_MAX_VECTORS', '20000'))
+FAISS_HNSW_MAX_VECTORS = int(os.getenv('FAISS_HNSW_MAX_VECTORS', '200000'))
+FAISS_QUANTIZATION = os.getenv('FAISS_QUANTIZATION', 'none')
+FAISS_IVF_NPROBE = int(os.getenv('FAISS_IVF_NPROBE', '16'))
+FAISS_HNSW_EF_SEARCH = int(os.getenv('FAISS_HNSW_EF_SEARCH', '64'))
+
+# How session indexes are loaded: 'heap' reads them into each process, 'mmap' maps
+# the vectors and chunks read-only so all workers share them through the OS page cache.
+FAISS_LOAD_MODE = os.getenv('FAISS_LOAD_MODE', 'heap').lower()
+
+# Chat intent is classified locally from embeddings; the router LLM is only
+# consulted when the CHAT/QUERY similarity margin is below this threshold.
+INTENT_ROUTER_MIN_MARGIN = float(os.getenv('INTENT_ROUTER_MIN_MARGIN', '0.04'))
+INTENT_ROUTER_LLM_FALLBACK = os.getenv('INTENT_ROUTER_LLM_FALLBACK', 'True') == 'True'
+
+# Chat turns fetch history, classify intent and retrieve context concurrently.
+# With SPECULATIVE_WEB_SEARCH, sessions without documents start the web search
+# before the intent is known (wasted on small talk, faster for questions).
+CHAT_STAGE_WORKERS = int(os.getenv('CHAT_STAGE_WORKERS', '32'))
+SPECULATIVE_WEB_SEARCH = os.getenv('SPECULATIVE_WEB_SEARCH', 'False') == 'True'
+
+# Per-user request limits (requests per period in seconds) for the chat and upload
+# endpoints; 0 disables a limit. Hits are logged in a SQLite file shared by every
+# worker process on the host, so the limit holds across gunicorn workers.
+CHAT_RATE_LIMIT = int(os.getenv('CHAT_RATE_LIMIT', '15'))
+CHAT_RATE_LIMIT_PERIOD = int(os.getenv('CHAT_RATE_LIMIT_PERIOD', '60'))
+UPLOAD_RATE_LIMIT = int(os.getenv('UPLOAD_RATE_LIMIT', '10'))
+UPLOAD_RATE_LIMIT_PERIOD = int(os.getenv('UPLOAD_RATE_LIMIT_PERIOD', '60'))
+RATE_LIMIT_DB = Path(os.getenv('RATE_LIMIT_DB', RAG_CACHE_DIR / 'ratelimit.sqlite3'))
+
+# Threads that generate LLM titles for new chats after the stream closes.
+CHAT_BACKGROUND_WORKERS = int(os.getenv('CHAT_BACKGROUND_WORKERS', '2'))
+
+# Serve /api/chat/ from the async view. Only useful under an ASGI server
+# (e.g. `uvicorn ChatBot.asgi:application`); under WSGI the stream is consumed
+# synchronously anyway.
+ASYNC_CHAT = os.getenv('ASYNC_CHAT', 'False') == 'True'
+
+# Hybrid retrieval: each of the vector and BM25 keyword searches contributes its top
+# HYBRID_CANDIDATES chunks, fused with reciprocal rank fusion (constant HYBRID_RRF_K).
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+
+# Prompt packing: retrieval offers CONTEXT_CANDIDATES chunks, of which at most
+# CONTEXT_MAX_CHUNKS diverse ones (MMR weight CONTEXT_MMR_LAMBDA; chunks sharing at least
+# CONTEXT_DUPLICATE_THRESHOLD of their word shingles count as duplicates) share
+# CONTEXT_TOKEN_BUDGET estimated tokens with the conversation history, which is
+# guaranteed CONTEXT_HISTORY_SHARE of it.
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_HISTORY_SHARE = float(os.getenv('CONTEXT_HISTORY_SHARE', '0.3'))
+CONTEXT_CANDIDATES = int(os.getenv('CONTEXT_CANDIDATES', '10'))
+CONTEXT_MAX_CHUNKS = int(os.getenv('CONTEXT_MAX_CHUNKS', '5'))
+CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.8'))
+
+# Background ingestion. Set INGESTION_INLINE_WORKERS=False when running
+# `python manage.py ingestion_worker` as a separate process.
+INGESTION_INLINE_WORKERS = os.getenv('INGESTION_INLINE_WORKERS', 'True') == 'True'
+INGESTION_WORKER_THREADS = int(os.getenv('INGESTION_WORKER_THREADS', '2'))
+INGESTION_POLL_INTERVAL = int(os.getenv('INGESTION_POLL_INTERVAL', '5'))
+# A running job's worker renews its lease every third of INGESTION_JOB_LEASE seconds;
+# jobs whose lease expired (the worker died) are queued again.
+INGESTION_JOB_LEASE = int(os.getenv('INGESTION_JOB_LEASE', '60'))
+
 
 # Application definition
 
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from rag_core_app import views
@@ -16,8 +17,12 @@ urlpatterns = [
     path('home/', views.home, name='home'),
     
     # API Endpoints
-    path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/', views.achat_api if settings.ASYNC_CHAT else views.chat_api, name='chat_api'),
     path('api/upload/', views.upload_api, name='upload_api'),
+    path('api/upload/status/<int:job_id>/', views.upload_status_api, name='upload_status_api'),
+    path('api/sessions/', views.sessions_api, name='sessions_api'),
+    path('api/sessions/<int:session_id>/messages/', views.session_messages_api, name='session_messages_api'),
+    path('metrics/', views.metrics_api, name='metrics'),
 
     path('delete_chat_session/<int:session_id>/', views.delete_chat_session, name='delete_chat_session'),
     path('update_profile/', views.update_profile, name='update_profile'),
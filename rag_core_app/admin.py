@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, ChatSession, ChatMessage
+from .models import Document, ChatSession, ChatMessage, IngestionJob, IngestionJobFile
 
 
 @admin.register(Document)
@@ -33,4 +33,19 @@ class ChatSessionAdmin(admin.ModelAdmin):
 
     def document_count(self, obj):
         return obj.documents.count()
-    document_count.short_description = 'Docs'
\ No newline at end of file
+    document_count.short_description = 'Docs'
+
+
+class IngestionJobFileInline(admin.TabularInline):
+    model = IngestionJobFile
+    extra = 0
+    readonly_fields = ('name', 'source', 'status', 'document')
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'session', 'status', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('session__title', 'session__user__username')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    inlines = [IngestionJobFileInline]
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryTTLCache:
+    """In-process stand-in for `DiskTTLCache`, for a read-only disk or tests. Not shared between workers."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.time():
+                self._remove((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value, ttl):
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[(namespace, key)] = (value, time.time() + ttl)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def clear(self, namespace=None):
+        with self._lock:
+            for entry_key in [k for k in self._entries if namespace is None or k[0] == namespace]:
+                self._remove(entry_key)
+
+    def stats(self):
+        now = time.time()
+        stats = {}
+        with self._lock:
+            for (namespace, _), (value, expires) in self._entries.items():
+                if expires > now:
+                    row = stats.setdefault(namespace, {"entries": 0, "bytes": 0})
+                    row["entries"] += 1
+                    row["bytes"] += len(value)
+        return stats
+
+
+class NullCache:
+    """A store that keeps nothing; every lookup is a miss."""
+
+    def get(self, namespace, key):
+        return None
+
+    def set(self, namespace, key, value, ttl):
+        pass
+
+    def clear(self, namespace=None):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def _json_dumps(value):
+    return json.dumps(value).encode("utf-8")
+
+
+def _json_loads(data):
+    return json.loads(data.decode("utf-8"))
+
+
+class CacheNamespace:
+    """One kind of cached value (search results, query vectors, ...) with its own TTL and counters.
+
+    Keys are hashed, so any string will do; values go through `dumps`/`loads` (JSON by
+    default). Store errors are logged and treated as misses, so a broken cache never
+    fails the request it was meant to speed up. A TTL of 0 disables the namespace.
+    """
+
+    def __init__(self, cache, name, ttl, dumps=_json_dumps, loads=_json_loads):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _key(self, key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        try:
+            data = self.cache.store.get(self.name, self._key(key))
+        except Exception as e:
+            print(f"[WARN] {self.name} cache read failed: {e}")
+            data = None
+        with self._stats_lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if data is None else self.loads(data)
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        try:
+            self.cache.store.set(self.name, self._key(key), self.dumps(value), self.ttl)
+        except Exception as e:
+            print(f"[WARN] {self.name} cache write failed: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SharedCache:
+    """Namespaces over one pluggable store (`DiskTTLCache`, `MemoryTTLCache` or `NullCache`).
+
+    `store` may be swapped at runtime, e.g. by a benchmark that must start cold.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.namespaces = {}
+
+    def namespace(self, name, ttl, **codec):
+        namespace = self.namespaces[name] = CacheNamespace(self, name, ttl, **codec)
+        return namespace
+
+    def metrics(self):
+        """Lookup counters per namespace, in the metrics registry's collector format."""
+        samples = []
+        for name, namespace in sorted(self.namespaces.items()):
+            stats = namespace.stats()
+            samples.append(({"namespace": name, "result": "hit"}, stats["hits"]))
+            samples.append(({"namespace": name, "result": "miss"}, stats["misses"]))
+        return ("rag_cache_requests_total", "counter", "Shared cache lookups by namespace and result.", samples)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key: one caller runs, the rest wait for its result."""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Returns `(func(), shared)`; `shared` is True if another caller's call supplied the result.
+
+        An exception raised by the running call is raised in every waiting caller too.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
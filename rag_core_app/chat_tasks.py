@@ -0,0 +1,72 @@
+import concurrent.futures
+import re
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import Timings
+from .models import ChatSession
+
+# Titling a new chat takes an LLM call, so it runs here once the answer has been
+# saved and the response closes without waiting for it.
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=getattr(settings, 'CHAT_BACKGROUND_WORKERS', 2), thread_name_prefix="chat-background"
+)
+
+_GREETING = re.compile(
+    r"^(?:(?:hi|hello|hey|hiya|yo|please|pls|ok|okay|so|um|uh)\b[\s,!.]*)+", re.IGNORECASE
+)
+_QUESTION_LEAD = re.compile(
+    r"^(?:can|could|would|will) you (?:please )?(?:tell me |explain |help me (?:with |to )?)?|"
+    r"^(?:i (?:want|need|would like) to know|tell me|explain|help me (?:with |to )?)\s*",
+    re.IGNORECASE,
+)
+_STOPWORDS = {"a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "is", "are", "me", "my", "about"}
+
+
+def heuristic_title(message, max_words=5, max_length=50):
+    """A quick local title for a new chat: the gist of the first message, title-cased.
+
+    Shown immediately; the LLM title replaces it once the background task has run.
+    """
+    text = _QUESTION_LEAD.sub("", _GREETING.sub("", message.strip()))
+    words = re.findall(r"[\w'+#.-]+", text)
+    words = [w.strip(".") for w in words if w.strip(".")]
+    while len(words) > 1 and words[0].lower() in _STOPWORDS:
+        words.pop(0)
+    if not words:
+        return "New Chat"
+    title = " ".join(w if w.isupper() else w[:1].upper() + w[1:] for w in words[:max_words])
+    return title[:max_length]
+
+
+def submit(func, *args):
+    """Runs `func(*args)` on the background pool with fresh database connections."""
+    def run():
+        close_old_connections()
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"[ERROR] Chat background task failed: {e}")
+        finally:
+            close_old_connections()
+    return _executor.submit(run)
+
+
+def retitle(session_id, user_message, response, provisional_title):
+    """Replaces a new chat's `provisional_title` with an LLM title.
+
+    A title the user has edited in the meantime is left alone.
+    """
+    from .rag_utils import generate_chat_title
+
+    timings = Timings("chat_background")
+    with timings.span("title"):
+        title = generate_chat_title(user_message, response[:300])
+        if title and title != provisional_title:
+            ChatSession.objects.filter(id=session_id, title=provisional_title).update(title=title)
+    print(f"[RAG] Session {session_id}: titled chat ({timings.summary()})")
+
+
+def retitle_later(session_id, user_message, response, provisional_title):
+    return submit(retitle, session_id, user_message, response, provisional_title)
@@ -0,0 +1,106 @@
+import json
+import mmap
+import os
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+# A segment's chunks are stored as JSON lines in vector order, with a sidecar array of
+# byte offsets and the list of docstore ids, so any single chunk can be read without
+# loading the rest of the file.
+CHUNKS_NAME = "chunks.jsonl"
+OFFSETS_NAME = "chunks.offsets.npy"
+IDS_NAME = "chunks.ids.json"
+
+
+def write_chunks(path, ids, docs):
+    """Writes `docs` (in vector order, with their docstore `ids`) to a segment directory."""
+    offsets = [0]
+    with open(os.path.join(path, CHUNKS_NAME), "wb") as fh:
+        for doc_id, doc in zip(ids, docs):
+            line = json.dumps(
+                {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, default=str
+            ).encode("utf-8") + b"\n"
+            fh.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(path, OFFSETS_NAME), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(path, IDS_NAME), "w", encoding="utf-8") as fh:
+        json.dump(list(ids), fh)
+
+
+def get_document(docstore, doc_id):
+    """Fetches a chunk from any docstore, raising KeyError for unknown ids.
+
+    LangChain's `InMemoryDocstore.search` returns an "ID ... not found." string instead.
+    """
+    doc = docstore.search(doc_id)
+    if not isinstance(doc, Document):
+        raise KeyError(doc_id)
+    return doc
+
+
+def has_chunks(path):
+    return os.path.exists(os.path.join(path, CHUNKS_NAME))
+
+
+class ChunkFile:
+    """Read-only, memory-mapped view of one segment's chunk file."""
+
+    def __init__(self, path):
+        self.offsets = np.load(os.path.join(path, OFFSETS_NAME), mmap_mode="r")
+        with open(os.path.join(path, IDS_NAME), "r", encoding="utf-8") as fh:
+            self.ids = json.load(fh)
+        with open(os.path.join(path, CHUNKS_NAME), "rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            self._data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def read(self, line):
+        record = json.loads(self._data[int(self.offsets[line]):int(self.offsets[line + 1])])
+        return record["id"], Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def __iter__(self):
+        for line in range(len(self)):
+            yield self.read(line)
+
+
+class LazyDocstore(Docstore, AddableMixin):
+    """Docstore over memory-mapped chunk files: a chunk is only parsed when it is fetched.
+
+    Documents added later (e.g. a freshly embedded delta) are kept in memory on top.
+    """
+
+    def __init__(self, files=()):
+        self._files = []
+        self._where = {}
+        self._added = {}
+        for chunk_file in files:
+            self.extend(chunk_file)
+
+    def extend(self, chunk_file):
+        number = len(self._files)
+        self._files.append(chunk_file)
+        self._where.update({doc_id: (number, line) for line, doc_id in enumerate(chunk_file.ids)})
+
+    def merge(self, other):
+        for chunk_file in other._files:
+            self.extend(chunk_file)
+        self._added.update(other._added)
+
+    def search(self, search):
+        if search in self._added:
+            return self._added[search]
+        try:
+            number, line = self._where[search]
+        except KeyError:
+            raise KeyError(search) from None
+        return self._files[number].read(line)[1]
+
+    def add(self, texts):
+        self._added.update(texts)
+
+    def estimated_bytes(self):
+        return 100 * len(self._where) + sum(len(doc.page_content) for doc in self._added.values())
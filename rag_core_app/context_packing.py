@@ -0,0 +1,216 @@
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# Imported by the chat pipeline and its benchmarks, so no Django here.
+
+# One retrieved chunk offered to the packer; `vector` may be None (web results, or
+# when the chunk vectors could not be fetched) and `source` scopes overlap trimming.
+Candidate = namedtuple("Candidate", "text vector source")
+
+PackedPrompt = namedtuple("PackedPrompt", "history context stats")
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w+")
+
+# A cut-off history message shorter than this is more noise than context.
+_MIN_HISTORY_TOKENS = 32
+
+
+def count_tokens(text):
+    """Estimated LLM tokens in `text`.
+
+    Words count one token per four characters (at least one) and punctuation one each,
+    which tracks BPE tokenizers on English prose to within about 10% without shipping
+    one of their vocabularies.
+    """
+    return sum(1 + (len(token) - 1) // 4 for token in _TOKEN.findall(text)) if text else 0
+
+
+def truncate_tokens(text, max_tokens):
+    """The longest prefix of `text` within `max_tokens`, cut between tokens and marked with an ellipsis."""
+    used = 0
+    for match in _TOKEN.finditer(text):
+        used += 1 + (match.end() - match.start() - 1) // 4
+        if used > max_tokens - 1:
+            return text[:match.start()].rstrip() + " …"
+    return text
+
+
+def shingles(text, size=3):
+    """The set of `size`-word shingles of `text`, case-insensitive."""
+    words = _WORD.findall(text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def overlap_length(head_of, tail_of, min_chars=30, max_chars=400):
+    """Length of the longest suffix of `tail_of` (up to `max_chars`) that `head_of` starts with.
+
+    Adjacent chunks from the splitter share up to `chunk_overlap` characters this way;
+    overlaps shorter than `min_chars` are ignored as coincidence.
+    """
+    probe = head_of[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    start = tail_of.find(probe, max(0, len(tail_of) - max_chars))
+    while start != -1:
+        if head_of.startswith(tail_of[start:]):
+            return len(tail_of) - start
+        start = tail_of.find(probe, start + 1)
+    return 0
+
+
+def _normalized(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class ContextPacker:
+    """Fits conversation history and retrieved chunks into one prompt token budget.
+
+    Chunks are picked by maximal marginal relevance over their retrieval rank and
+    pairwise cosine similarities, with `mmr_lambda` trading relevance for diversity.
+    A candidate whose word shingles overlap a picked chunk's by at least
+    `duplicate_threshold` (Jaccard) is dropped; embeddings alone would also drop
+    templated chunks that differ only in the facts asked about. Text a picked chunk of
+    the same source already covers is trimmed.
+
+    At most `max_chunks` chunks are used, and context gets the budget first except for
+    `history_share` of it, which is kept for history; whatever either side leaves
+    unused goes to the other. History is filled newest message first.
+    """
+
+    def __init__(self, budget=3000, history_share=0.3, max_chunks=5, mmr_lambda=0.7,
+                 duplicate_threshold=0.8, min_overlap=30, counter=count_tokens):
+        self.budget = budget
+        self.history_share = history_share
+        self.max_chunks = max_chunks
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.count = counter
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+        self._stats_lock = threading.Lock()
+
+    def pack(self, history_lines, candidates):
+        """Packs `history_lines` (oldest first) and `candidates` (best first) into a `PackedPrompt`.
+
+        `stats` compares the packed prompt with the unpacked one, i.e. every history line
+        plus the top `max_chunks` candidates joined as they came.
+        """
+        history_tokens = [self.count(line) for line in history_lines]
+        reserve = min(sum(history_tokens), int(self.budget * self.history_share))
+        chunks, chunk_stats = self.select(candidates, self.budget - reserve)
+        context = "\n\n".join(chunks)
+        context_tokens = self.count(context)
+        history, dropped, history_tokens_used = self._fit_history(
+            history_lines, history_tokens, self.budget - context_tokens
+        )
+
+        unpacked = sum(history_tokens) + self.count(
+            "\n\n".join(candidate.text for candidate in candidates[:self.max_chunks])
+        )
+        stats = {
+            "prompt_tokens": history_tokens_used + context_tokens,
+            "tokens_saved": unpacked - history_tokens_used - context_tokens,
+            "chunks": len(chunks),
+            **chunk_stats,
+            "history_messages_dropped": dropped,
+        }
+        with self._stats_lock:
+            self.tokens_sent += stats["prompt_tokens"]
+            self.tokens_saved += max(0, stats["tokens_saved"])
+        return PackedPrompt(history, context, stats)
+
+    def select(self, candidates, budget):
+        """Picks chunk texts for the context within `budget` tokens; returns `(texts, stats)`."""
+        stats = {"duplicates": 0, "trimmed_tokens": 0}
+        count = len(candidates)
+        if not count or budget <= 0:
+            return [], stats
+
+        # Fused (RRF) scores of hits found by only one retriever are nearly tied, so scaled
+        # scores would leave diversity to pick among them; relevance follows rank instead.
+        relevance = 1.0 - np.arange(count, dtype=np.float32) / count
+        if all(candidate.vector is not None for candidate in candidates):
+            vectors = _normalized([candidate.vector for candidate in candidates])
+            similarity = vectors @ vectors.T
+        else:
+            similarity = np.eye(count, dtype=np.float32)
+
+        shingle_sets = [shingles(candidate.text) for candidate in candidates]
+        available = np.ones(count, dtype=bool)
+        closest = np.zeros(count, dtype=np.float32)
+        picked = []
+        while available.any() and len(picked) < self.max_chunks:
+            marginal = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * closest
+            i = int(np.argmax(np.where(available, marginal, -np.inf)))
+            available[i] = False
+
+            text, trimmed = self._trim(candidates[i], [candidates[j] for j, _ in picked], [t for _, t in picked])
+            if not text:
+                stats["duplicates"] += 1
+                continue
+            tokens = self.count(text)
+            if tokens > budget:
+                if picked:
+                    continue
+                # Better part of the best chunk (or a long web result) than no context at all.
+                text = truncate_tokens(text, budget)
+                trimmed, tokens = trimmed + tokens - self.count(text), self.count(text)
+            budget -= tokens
+            stats["trimmed_tokens"] += trimmed
+            picked.append((i, text))
+
+            for j in np.flatnonzero(available):
+                if jaccard(shingle_sets[i], shingle_sets[j]) >= self.duplicate_threshold:
+                    available[j] = False
+                    stats["duplicates"] += 1
+            closest = np.maximum(closest, similarity[:, i])
+        return [text for _, text in picked], stats
+
+    def _trim(self, candidate, picked, picked_texts):
+        """Strips text that already-picked chunks of the same source cover; returns `(text, tokens_removed)`."""
+        text = candidate.text.strip()
+        original = self.count(text)
+        for other, other_text in zip(picked, picked_texts):
+            if other.source != candidate.source or not text:
+                continue
+            if text in other_text:
+                return "", original
+            size = overlap_length(text, other_text, self.min_overlap)
+            if size:
+                text = text[size:].lstrip()
+            size = overlap_length(other_text, text, self.min_overlap)
+            if size:
+                text = text[:-size].rstrip()
+        return text, original - self.count(text) if text else original
+
+    def _fit_history(self, lines, tokens, budget):
+        """The newest lines that fit in `budget`, oldest first; returns `(text, lines_dropped, tokens)`."""
+        kept, used = [], 0
+        for line, line_tokens in zip(reversed(lines), reversed(tokens)):
+            if used + line_tokens <= budget:
+                kept.append(line)
+                used += line_tokens
+                continue
+            if budget - used >= _MIN_HISTORY_TOKENS:
+                kept.append(truncate_tokens(line, budget - used))
+                used += self.count(kept[-1])
+            break
+        return "\n".join(reversed(kept)), len(lines) - len(kept), used
+
+    def metrics(self):
+        """Prompt token counters, in the metrics registry's collector format."""
+        with self._stats_lock:
+            samples = [({"kind": "sent"}, self.tokens_sent), ({"kind": "saved"}, self.tokens_saved)]
+        return ("rag_prompt_context_tokens_total", "counter",
+                "Estimated history and context tokens sent to the LLM, and saved by packing.", samples)
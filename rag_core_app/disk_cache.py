@@ -0,0 +1,269 @@
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite caps the number of bound parameters per statement.
+_MAX_PARAMS = 500
+# A hit refreshes an entry's last_access only when it is older than this, so most
+# reads stay reads; eviction order is only approximate within the interval.
+_TOUCH_INTERVAL = 300
+
+
+def _track_size(conn):
+    """Keeps `meta.total_bytes` equal to the summed size of `entries`, via triggers.
+
+    Every process sharing the file sees the same running total, so writes check the
+    cache size without scanning the table. Caches created before the total existed
+    are summed once.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_bytes INTEGER NOT NULL)"
+        )
+        if conn.execute("SELECT 1 FROM meta").fetchone() is None:
+            conn.execute("INSERT INTO meta (id, total_bytes) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+        for name, event, change in (
+            ("entries_size_insert", "INSERT", "+ NEW.size"),
+            ("entries_size_delete", "DELETE", "- OLD.size"),
+            ("entries_size_update", "UPDATE OF size", "+ NEW.size - OLD.size"),
+        ):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON entries "
+                f"BEGIN UPDATE meta SET total_bytes = total_bytes {change}; END"
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _total_bytes(conn):
+    return conn.execute("SELECT total_bytes FROM meta").fetchone()[0]
+
+
+class DiskLRUCache:
+    """SQLite-backed key/value store with least-recently-used eviction by total size.
+
+    Safe to share between threads and worker processes: every thread opens its own
+    connection and SQLite's WAL journal serializes writers.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            _track_size(conn)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """Returns a dict of the keys found; found entries are marked as recently used."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        conn = self._conn()
+        for start in range(0, len(keys), _MAX_PARAMS):
+            batch = keys[start:start + _MAX_PARAMS]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value, last_access FROM entries WHERE key IN ({marks})", batch
+            ).fetchall()
+            found.update((key, value) for key, value, _ in rows)
+            stale = [key for key, _, last_access in rows if last_access < now - _TOUCH_INTERVAL]
+            if stale:
+                conn.execute(
+                    f"UPDATE entries SET last_access = ? WHERE key IN ({','.join('?' * len(stale))})",
+                    [now] + stale,
+                )
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, last_access = excluded.last_access",
+                [(key, value, len(value), now) for key, value in items.items()],
+            )
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _evict(self, conn):
+        total = _total_bytes(conn)
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so a full cache doesn't evict on every single write.
+        excess = total - int(self.max_bytes * 0.9)
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            doomed.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        for start in range(0, len(doomed), _MAX_PARAMS):
+            batch = doomed[start:start + _MAX_PARAMS]
+            conn.execute(f"DELETE FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM entries")
+
+    def total_bytes(self):
+        return _total_bytes(self._conn())
+
+    def stats(self):
+        conn = self._conn()
+        entries, size = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0], _total_bytes(conn)
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def disk_cache_metrics(caches):
+    """Lookups of named `DiskLRUCache`s by result, in the metrics registry's collector format."""
+    samples = []
+    for name, cache in sorted(caches.items()):
+        with cache._stats_lock:
+            samples.append(({"cache": name, "result": "hit"}, cache.hits))
+            samples.append(({"cache": name, "result": "miss"}, cache.misses))
+    return ("rag_disk_cache_requests_total", "counter", "Disk cache lookups by cache and result.", samples)
+
+
+def disk_size_metrics(caches):
+    """Stored bytes of named `DiskLRUCache`s; caches whose file does not exist yet are skipped."""
+    samples = [
+        ({"cache": name}, cache.total_bytes())
+        for name, cache in sorted(caches.items()) if os.path.exists(cache.path)
+    ]
+    return ("rag_disk_cache_bytes", "gauge", "Size of the entries stored in each disk cache.", samples)
+
+
+class DiskTTLCache:
+    """SQLite-backed store of namespaced entries that expire after a per-entry TTL.
+
+    Entries are evicted when they expire, or least recently used first once the file
+    exceeds `max_bytes`. Shared between threads and worker processes like `DiskLRUCache`.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)")
+            _track_size(conn)
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, last_access FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+            (namespace, key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now - _TOUCH_INTERVAL:
+            conn.execute("UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return row[0]
+
+    def set(self, namespace, key, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO entries (namespace, key, value, size, expires, last_access) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires = excluded.expires, last_access = excluded.last_access",
+                (namespace, key, value, len(value), now + ttl, now),
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, now):
+        if _total_bytes(conn) <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        total = _total_bytes(conn)
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so a full cache doesn't evict on every single write.
+        excess = total - int(self.max_bytes * 0.9)
+        doomed = []
+        for namespace, key, size in conn.execute("SELECT namespace, key, size FROM entries ORDER BY last_access"):
+            doomed.append((namespace, key))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", doomed)
+
+    def clear(self, namespace=None):
+        if namespace is None:
+            self._conn().execute("DELETE FROM entries")
+        else:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires > ? GROUP BY namespace",
+            (time.time(),),
+        ).fetchall()
+        return {namespace: {"entries": entries, "bytes": size} for namespace, entries, size in rows}
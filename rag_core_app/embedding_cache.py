@@ -0,0 +1,108 @@
+import hashlib
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def vector_to_bytes(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def bytes_to_vector(data):
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of an embedding model.
+
+    Document vectors are stored as float32 bytes keyed by a hash of the model name and
+    the chunk text, so a chunk seen in any earlier upload is never embedded again.
+    Query vectors go to `query_cache` (a `cache_layer.CacheNamespace`) when one is given,
+    so a repeated question skips the model in every worker.
+    """
+
+    def __init__(self, embeddings, model_name, store, query_cache=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+        self.query_cache = query_cache
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def cache_key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, texts):
+        """Splits `texts` into cached vectors and the unseen texts that still need embedding.
+
+        Returns `(keys, vectors, missing)`: the cache key of every text, a dict of cached
+        vectors by key, and a dict of key -> text for each distinct unseen text.
+        """
+        keys = [self.cache_key(text) for text in texts]
+        try:
+            cached = self.store.get_many(keys)
+        except Exception as e:
+            print(f"[WARN] Embedding cache read failed: {e}")
+            cached = {}
+
+        # Embed each unseen text once, even if it repeats within this batch.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        vectors = {key: np.frombuffer(value, dtype=np.float32) for key, value in cached.items()}
+        return keys, vectors, missing
+
+    def remember(self, missing, embedded):
+        """Stores freshly computed vectors for the `missing` texts and returns them by key."""
+        fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, embedded)}
+        try:
+            self.store.set_many({key: vector.tobytes() for key, vector in fresh.items()})
+        except Exception as e:
+            print(f"[WARN] Embedding cache write failed: {e}")
+        return fresh
+
+    def embed_documents(self, texts):
+        keys, vectors, missing = self.lookup(texts)
+        if missing:
+            vectors.update(self.remember(missing, self.embeddings.embed_documents(list(missing.values()))))
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        key = self.cache_key(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def embedding_metrics(caches):
+    """Chunk lookups of the given `CachedEmbeddings` by result, in the metrics registry's collector format."""
+    hits = misses = 0
+    for cache in caches:
+        stats = cache.stats()
+        hits += stats["hits"]
+        misses += stats["misses"]
+    return (
+        "rag_embedding_cache_requests_total", "counter",
+        "Chunk embedding lookups: vector found in the cache, or computed by the model.",
+        [({"result": "hit"}, hits), ({"result": "miss"}, misses)],
+    )
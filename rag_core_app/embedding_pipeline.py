@@ -0,0 +1,151 @@
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+# This module is imported by spawned embedding workers, so it must not touch Django.
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+_worker_model = None
+
+
+def _init_worker(model_name, batch_size, threads):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+def _embed_batch(texts):
+    return _worker_model.embed_documents(texts)
+
+
+def get_process_pool(model_name, workers, batch_size):
+    """Returns the shared embedding process pool, (re)creating it when its settings change.
+
+    Workers are spawned rather than forked so they don't inherit torch's thread state,
+    and each one is limited to its share of the CPU cores.
+    """
+    global _pool, _pool_key
+    key = (model_name, workers, batch_size)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, batch_size, max(1, (os.cpu_count() or 1) // workers)),
+            )
+            _pool_key = key
+        return _pool
+
+
+@atexit.register
+def shutdown_process_pool(wait=True):
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+        _pool, _pool_key = None, None
+
+
+class BatchEmbedder:
+    """Embeds chunk texts in fixed-size batches, yielding each batch as soon as it is ready.
+
+    With a `CachedEmbeddings` model only cache misses are computed. When `workers` > 1
+    and there is more than one batch, misses are fanned out to a process pool with
+    `workers * 2` batches in flight; otherwise they run on the calling thread.
+    """
+
+    def __init__(self, embeddings, batch_size=64, workers=0):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.workers = workers
+        self.embedded = 0
+        self.cached = 0
+        self.elapsed = 0.0
+        self._done = set()
+
+    @property
+    def chunks_per_second(self):
+        return self.embedded / self.elapsed if self.elapsed else 0.0
+
+    def iter_batches(self, texts):
+        """Yields `(start, vectors)` for consecutive slices of `texts`, in completion order."""
+        started = time.perf_counter()
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+        try:
+            if self.workers > 1 and len(batches) > 1:
+                try:
+                    yield from self._iter_pool(batches)
+                    return
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    print(f"[WARN] Embedding process pool failed, continuing in-process: {e}")
+                    shutdown_process_pool(wait=False)
+                    batches = [batch for batch in batches if batch[0] not in self._done]
+            for start, batch in batches:
+                yield start, self._finish(*self._split(batch), self._model().embed_documents)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def _iter_pool(self, batches):
+        pool = get_process_pool(self._model_name(), self.workers, self.batch_size)
+        self._done = set()
+        pending = {}
+        queue = iter(batches)
+        window = self.workers * 2
+
+        while True:
+            while len(pending) < window:
+                item = next(queue, None)
+                if item is None:
+                    break
+                start, batch = item
+                keys, vectors, missing = self._split(batch)
+                if not missing:
+                    self._done.add(start)
+                    yield start, self._finish(keys, vectors, missing, None)
+                    continue
+                future = pool.submit(_embed_batch, list(missing.values()))
+                pending[future] = (start, keys, vectors, missing)
+            if not pending:
+                return
+            finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                start, keys, vectors, missing = pending.pop(future)
+                embedded = future.result()
+                self._done.add(start)
+                yield start, self._finish(keys, vectors, missing, lambda _texts: embedded)
+
+    def _split(self, batch):
+        if hasattr(self.embeddings, "lookup"):
+            return self.embeddings.lookup(batch)
+        keys = list(range(len(batch)))
+        return keys, {}, dict(zip(keys, batch))
+
+    def _finish(self, keys, vectors, missing, embed_fn):
+        if missing:
+            embedded = embed_fn(list(missing.values()))
+            if hasattr(self.embeddings, "remember"):
+                vectors.update(self.embeddings.remember(missing, embedded))
+            else:
+                vectors.update(zip(missing, embedded))
+        self.embedded += len(keys)
+        self.cached += len(keys) - len(missing)
+        return [vectors[key] for key in keys]
+
+    def _model(self):
+        return getattr(self.embeddings, "embeddings", self.embeddings)
+
+    def _model_name(self):
+        return getattr(self.embeddings, "model_name", None) or self._model().model_name
@@ -0,0 +1,83 @@
+import asyncio
+import re
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Local stand-ins for the remote services, used by load tests and benchmarks. Install
+# them with `install_fakes()`, which swaps them into rag_utils' model registry.
+
+DEFAULT_REPLY = (
+    "### Answer\n\nThis is a canned response from the local fake model. It streams one token "
+    "at a time with a fixed delay so load tests exercise the same code paths as the real "
+    "LLM without network calls or API quotas. [Source 1](https://example.com/fake)"
+)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that streams a canned reply word by word, sleeping `delay` seconds per token."""
+
+    reply: str = DEFAULT_REPLY
+    delay: float = 0.02
+    first_token_delay: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming-chat"
+
+    def _tokens(self):
+        return re.findall(r"\S+\s*", self.reply)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay + self.delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay)
+        for token in self._tokens():
+            time.sleep(self.delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_delay)
+        for token in self._tokens():
+            await asyncio.sleep(self.delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeWebSearch:
+    """Stands in for DuckDuckGoSearchResults: returns canned snippets after `delay` seconds.
+
+    `calls` counts provider calls, so tests can check how many searches were really made.
+    """
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def run(self, query):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return (
+            f"snippet: Canned search result for '{query}'., title: Fake result, "
+            f"link: https://example.com/search?q={re.sub(r'[^a-z0-9]+', '-', query.lower())}"
+        )
+
+
+def install_fakes(token_delay=0.02, first_token_delay=0.0, search_delay=0.2, reply=DEFAULT_REPLY):
+    """Replaces the chat/router/title LLMs and web search with local fakes; returns the previous models."""
+    from . import rag_utils
+
+    previous = dict(rag_utils._models)
+    rag_utils._models.update({
+        "chat_llm": FakeStreamingChatModel(reply=reply, delay=token_delay, first_token_delay=first_token_delay),
+        "router_llm": FakeStreamingChatModel(reply="QUERY", delay=0.0),
+        "title_llm": FakeStreamingChatModel(reply="Fake Chat Title", delay=0.0),
+        "web_search": FakeWebSearch(delay=search_delay),
+    })
+    return previous
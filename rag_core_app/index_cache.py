@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_store_bytes(value):
+    """Rough in-memory footprint of a session index: float32 vectors, chunk text and keyword postings."""
+    if hasattr(value, "estimated_bytes"):
+        return value.estimated_bytes()
+    vector_store = getattr(value, "store", value)
+    index = vector_store.index
+    size = index.ntotal * index.d * 4
+    for doc in getattr(vector_store.docstore, "_dict", {}).values():
+        size += len(doc.page_content)
+    keywords = getattr(value, "keywords", None)
+    if keywords is not None:
+        size += keywords.estimated_bytes()
+    return size
+
+
+class SessionIndexCache:
+    """Process-wide LRU cache of loaded session indexes.
+
+    Entries are bounded by count, total estimated bytes and age. Each entry carries
+    the on-disk signature it was loaded from, so a store rewritten by another worker
+    is reloaded instead of served stale. Cached stores are treated as read-only:
+    writers build a new store and `put` it, they never mutate a cached one.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=512 * 1024 * 1024, ttl=1800):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        """Returns the cached store for `key` if it is fresh and matches `signature`."""
+        key = str(key)
+        with self._lock:
+            value = self._lookup(key, signature)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, signature):
+        """Like `get`, for writers: doesn't count as a lookup or refresh the entry's recency."""
+        with self._lock:
+            return self._lookup(str(key), signature)
+
+    def put(self, key, value, signature, size=None):
+        key = str(key)
+        if size is None:
+            size = estimate_store_bytes(value)
+        with self._lock:
+            self._remove(key)
+            if self.max_entries <= 0 or size > self.max_bytes:
+                return
+            self._entries[key] = (value, signature, size, time.monotonic())
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(str(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key, signature):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, entry_signature, size, loaded_at = entry
+        expired = self.ttl and time.monotonic() - loaded_at > self.ttl
+        if entry_signature == signature and not expired:
+            return value
+        self._remove(key)
+        return None
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
@@ -0,0 +1,143 @@
+import math
+import time
+
+import faiss
+import numpy as np
+
+# Session indexes start as exact flat indexes. Past `flat_max` vectors they are rebuilt
+# as HNSW graphs, and past `hnsw_max` as IVF (inverted file) indexes. `quantization`
+# additionally compresses the stored vectors: "sq8" keeps one byte per dimension,
+# "pq" a few bytes per vector (product quantization, IVF only: HNSW graphs over PQ
+# codes lose too much recall, so they use SQ8 instead), "none" keeps float32.
+QUANTIZATIONS = ("none", "sq8", "pq")
+
+
+def _pq_subquantizers(d):
+    """Number of PQ sub-vectors: about 8 dimensions each, and it must divide `d`."""
+    for m in range(max(1, d // 8), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def choose_spec(n, d, flat_max=20000, hnsw_max=200000, quantization="none", hnsw_m=32):
+    """Returns the `faiss.index_factory` string for an index of `n` vectors of dimension `d`."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+    if n <= flat_max:
+        return "Flat"
+    if n <= hnsw_max:
+        return f"HNSW{hnsw_m}" if quantization == "none" else f"HNSW{hnsw_m}_SQ8"
+    # ~4·sqrt(n) lists keeps list scans short; training wants ~39+ points per list.
+    nlist = max(16, min(int(4 * math.sqrt(n)), n // 39))
+    codec = {"none": "Flat", "sq8": "SQ8", "pq": f"PQ{_pq_subquantizers(d)}"}[quantization]
+    return f"IVF{nlist},{codec}"
+
+
+def shards(index):
+    """The sub-indexes of an `IndexShards`, in id order, or `[index]` for any other index."""
+    if isinstance(index, faiss.IndexShards):
+        # The Python wrapper keeps the added shard objects alive; prefer them to the
+        # non-owning proxies from `at()`, so the shards can be re-added elsewhere.
+        owners = getattr(index, "referenced_objects", None)
+        if owners is not None and len(owners) == index.count():
+            return list(owners)
+        return [faiss.downcast_index(index.at(i)) for i in range(index.count())]
+    return [index]
+
+
+def reconstruct_all(index):
+    """Returns all stored vectors as a float32 array (approximate for quantized indexes)."""
+    if not index.ntotal:
+        return np.empty((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexShards):
+        return np.vstack([reconstruct_all(shard) for shard in shards(index)])
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF indexes need a direct map from ids to list positions to reconstruct.
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct(index, positions):
+    """Returns the stored vectors at `positions` as a float32 array (approximate for quantized indexes)."""
+    if not len(positions):
+        return np.empty((0, index.d), dtype=np.float32)
+    parts = shards(index)
+    if len(parts) > 1:
+        offsets = np.cumsum([0] + [part.ntotal for part in parts])
+        rows = []
+        for position in positions:
+            shard = int(np.searchsorted(offsets, position, side="right")) - 1
+            rows.append(reconstruct(parts[shard], [position - offsets[shard]])[0])
+        return np.vstack(rows)
+    try:
+        return np.vstack([index.reconstruct(int(position)) for position in positions])
+    except RuntimeError:
+        faiss.extract_index_ivf(index).make_direct_map()
+        return np.vstack([index.reconstruct(int(position)) for position in positions])
+
+
+def build_index(vectors, spec, nprobe=16, ef_search=64, max_training_points=100000, seed=1234):
+    """Creates, trains (on a sample if needed) and fills an L2 index from a spec string."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > max_training_points:
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), max_training_points, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+
+def set_search_params(index, nprobe=16, ef_search=64):
+    """Applies query-time accuracy knobs (IVF lists probed, HNSW beam width) where they exist."""
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass  # not an IVF index
+
+
+def index_kind(index):
+    name = type(faiss.downcast_index(index)).__name__
+    # LangChain builds IndexFlatL2; the factory's "Flat" is the equivalent IndexFlat.
+    return "IndexFlat" if name == "IndexFlatL2" else name
+
+
+def fits(index, flat_max=20000, hnsw_max=200000, quantization="none", hnsw_m=32, count=None, **_search_params):
+    """True when `index` already has the type `choose_spec` picks for its size, or for
+    `count` vectors if given.
+
+    A sharded index (memory-mapped base plus deltas) is judged by its base shard.
+    """
+    spec = choose_spec(index.ntotal if count is None else count, index.d, flat_max, hnsw_max, quantization, hnsw_m)
+    return index_kind(shards(index)[0]) == index_kind(faiss.index_factory(index.d, spec, faiss.METRIC_L2))
+
+
+def fit_index(index, flat_max=20000, hnsw_max=200000, quantization="none", nprobe=16, ef_search=64, hnsw_m=32):
+    """Returns `index` if it already has the right type for its size, else a rebuilt copy.
+
+    Rebuilding reconstructs the stored vectors, so moving between quantized types is lossy;
+    vector ids (positions) are preserved, so the docstore mapping stays valid.
+    """
+    if fits(index, flat_max, hnsw_max, quantization, hnsw_m):
+        return index
+    spec = choose_spec(index.ntotal, index.d, flat_max, hnsw_max, quantization, hnsw_m)
+    started = time.perf_counter()
+    rebuilt = build_index(reconstruct_all(index), spec, nprobe=nprobe, ef_search=ef_search)
+    print(
+        f"[RAG] Rebuilt {index.ntotal}-vector index as {spec} "
+        f"({index_kind(index)} -> {index_kind(rebuilt)}) in {time.perf_counter() - started:.2f}s"
+    )
+    return rebuilt
+
+
+def index_bytes(index):
+    return len(faiss.serialize_index(index))
@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+CHAT = "CHAT"
+QUERY = "QUERY"
+
+IntentDecision = namedtuple("IntentDecision", ["label", "confidence", "method", "elapsed_ms"])
+
+# Labelled utterances the centroids are built from. CHAT is small talk only; anything
+# that asks for facts, documents, code or help is QUERY.
+CHAT_EXAMPLES = [
+    "hi", "hello", "hey", "hey there", "hello there, how's it going", "good morning", "good evening",
+    "good night", "how are you", "how are you doing today", "what's up", "thanks", "thank you",
+    "thank you so much", "thanks a lot, that helped", "appreciate it", "great, thanks!", "awesome",
+    "cool", "ok", "okay got it", "nice", "lol", "haha that's funny", "bye", "goodbye",
+    "see you later", "talk to you tomorrow", "have a nice day", "nice to meet you",
+    "you're awesome", "you are very helpful", "who are you", "what's your name",
+    "I'm doing well, and you?", "sorry, my bad", "never mind", "no worries",
+]
+QUERY_EXAMPLES = [
+    "summarize the document", "give me a summary of the uploaded file", "what are the key points of this report",
+    "what does section 3 say about pricing", "find the invoice number in the pdf", "list the action items from the meeting notes",
+    "what is the capital of france", "who won the world cup in 2022", "what is the latest news about AI",
+    "explain how transformers work", "what is retrieval augmented generation", "define photosynthesis",
+    "how do I reverse a list in python", "write a sql query to count rows per user", "why is my django migration failing",
+    "compare the revenue in q1 and q2", "what was the total amount in the spreadsheet", "translate this paragraph to french",
+    "how many employees are listed in the csv", "what is the weather in london today", "who is the ceo of openai",
+    "draft an email to my team about the deadline", "what are the side effects of ibuprofen", "how does a binary search work",
+    "what is the difference between tcp and udp", "tell me about the history of rome", "search the web for the latest iphone",
+    "can you explain the second slide", "what are the requirements in the contract", "calculate the average of these numbers",
+]
+
+_CHAT_PATTERN = re.compile(
+    r"^(hi+|hello+|hey+|hiya|yo|howdy|greetings|good (morning|afternoon|evening|night|day)|"
+    r"thanks?( a lot| so much| you( so much| very much)?)?|thank you( so much| very much)?|thx|ty|"
+    r"cheers|bye+|good ?bye|see (you|ya)( later| soon)?|ok(ay)?|cool|nice|great|awesome|lol|haha+|"
+    r"how are you( doing)?( today)?|what'?s up|sup)"
+    r"( (there|buddy|mate|bot|again|friend))?[\s!.,?:)]*$",
+    re.IGNORECASE,
+)
+_QUERY_VERBS = re.compile(
+    r"^(summari[sz]e|explain|list|find|search|look up|write|compare|define|translate|calculate|"
+    r"extract|describe|analy[sz]e|show|give me|tell me about|draft|generate|convert|how (do|does|can|to)|"
+    r"what (is|are|was|were|does|did)|who (is|was|won)|when (is|was|did)|where (is|are)|why)\b",
+    re.IGNORECASE,
+)
+_CODE_OR_DATA = re.compile(r"https?://|```|[{}\[\]=<>;]|\d{3,}")
+
+
+def keyword_intent(query):
+    """Cheap pattern-based decision for unambiguous inputs; None when the patterns don't apply."""
+    text = query.strip()
+    if not text:
+        return CHAT
+    if len(text) <= 60 and _CHAT_PATTERN.match(text):
+        return CHAT
+    if _CODE_OR_DATA.search(text) or _QUERY_VERBS.match(text) or len(text.split()) > 15:
+        return QUERY
+    return None
+
+
+class IntentRouter:
+    """Nearest-centroid CHAT/QUERY classifier over sentence embeddings.
+
+    Keyword fast paths decide obvious inputs without embedding anything. Otherwise the
+    query is compared (cosine) with the mean embedding of each label's examples; when
+    the two similarities are closer than `min_margin`, `llm_fallback(query)` decides if
+    given, else the router errs towards QUERY so retrieval still runs.
+
+    Embedding and LLM decisions are remembered in `cache` (a `cache_layer.CacheNamespace`)
+    if given, so a repeated query is routed without embedding it or calling the LLM.
+    """
+
+    def __init__(self, embeddings_getter, min_margin=0.04, llm_fallback=None, cache=None):
+        self.embeddings_getter = embeddings_getter
+        self.min_margin = min_margin
+        self.llm_fallback = llm_fallback
+        self.cache = cache
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _get_centroids(self, embeddings):
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    centroids = {}
+                    for label, examples in ((CHAT, CHAT_EXAMPLES), (QUERY, QUERY_EXAMPLES)):
+                        vectors = _normalize(np.asarray(embeddings.embed_documents(examples), dtype=np.float32))
+                        centroids[label] = _normalize(vectors.mean(axis=0))
+                    self._centroids = centroids
+        return self._centroids
+
+    def _cache_key(self, query, use_fallback):
+        return f"{self.min_margin}\0{bool(use_fallback and self.llm_fallback)}\0{query.strip()}"
+
+    def cached(self, query, use_fallback=True):
+        """The remembered decision for `query`, or None."""
+        if self.cache is None:
+            return None
+        started = time.perf_counter()
+        hit = self.cache.get(self._cache_key(query, use_fallback))
+        if hit is None:
+            return None
+        label, confidence = hit
+        return IntentDecision(label, confidence, "cache", (time.perf_counter() - started) * 1000)
+
+    def classify(self, query, query_vector=None, use_fallback=True):
+        """Labels `query`; `query_vector` may be a precomputed vector or a callable returning one."""
+        started = time.perf_counter()
+        label = keyword_intent(query)
+        if label:
+            return IntentDecision(label, 1.0, "keyword", (time.perf_counter() - started) * 1000)
+
+        decision = self.cached(query, use_fallback)
+        if decision is None:
+            decision = self._classify(query, query_vector, use_fallback)
+            # "default" means the model or the LLM was unavailable; don't remember that.
+            if self.cache is not None and decision.method != "default":
+                self.cache.set(self._cache_key(query, use_fallback), [decision.label, decision.confidence])
+        return decision
+
+    def _classify(self, query, query_vector, use_fallback):
+        started = time.perf_counter()
+
+        def decide(label, confidence, method):
+            return IntentDecision(label, confidence, method, (time.perf_counter() - started) * 1000)
+
+        embeddings = self.embeddings_getter()
+        if embeddings is None:
+            return self._fallback(query, decide, 0.0, use_fallback)
+
+        centroids = self._get_centroids(embeddings)
+        if callable(query_vector):
+            query_vector = query_vector()
+        if query_vector is None:
+            query_vector = embeddings.embed_query(query)
+        vector = _normalize(np.asarray(query_vector, dtype=np.float32))
+        margin = float(vector @ centroids[QUERY] - vector @ centroids[CHAT])
+        if abs(margin) >= self.min_margin:
+            return decide(QUERY if margin > 0 else CHAT, abs(margin), "embedding")
+        return self._fallback(query, decide, abs(margin), use_fallback)
+
+    def _fallback(self, query, decide, confidence, use_fallback):
+        if use_fallback and self.llm_fallback:
+            try:
+                return decide(self.llm_fallback(query), confidence, "llm")
+            except Exception as e:
+                print(f"[WARN] LLM intent fallback failed: {e}")
+        return decide(QUERY, confidence, "default")
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
@@ -0,0 +1,180 @@
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChatMessage, IngestionJob, IngestionJobFile
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def enqueue_ingestion(session, sources):
+    """Records an ingestion job for `sources` and hands it to the background workers.
+
+    `sources` is a list of `(name, source, document)` tuples where `source` is a local
+    file path or URL and `document` is the saved `Document` row, if any.
+    """
+    with transaction.atomic():
+        job = IngestionJob.objects.create(session=session)
+        IngestionJobFile.objects.bulk_create([
+            IngestionJobFile(
+                job=job, name=name[:255], source=source, document=document,
+                status='Uploaded' if document else 'URL Queued'
+            )
+            for name, source, document in sources
+        ])
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def wake_workers():
+    if getattr(settings, 'INGESTION_INLINE_WORKERS', True):
+        start_workers()
+    _wakeup.set()
+
+
+def start_workers(count=None):
+    """Starts the in-process worker threads once per process."""
+    with _workers_lock:
+        _workers[:] = [t for t in _workers if t.is_alive()]
+        if _workers:
+            return _workers
+        count = count or getattr(settings, 'INGESTION_WORKER_THREADS', 2)
+        for i in range(count):
+            worker = threading.Thread(target=worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+        return _workers
+
+
+def worker_loop(stop_event=None):
+    poll_interval = getattr(settings, 'INGESTION_POLL_INTERVAL', 5)
+    while not (stop_event and stop_event.is_set()):
+        try:
+            job = claim_next_job()
+            if job is None:
+                requeue_stale_jobs()
+                _wakeup.wait(poll_interval)
+                _wakeup.clear()
+                continue
+            run_job(job)
+        except Exception as e:
+            print(f"[ERROR] Ingestion worker error: {e}")
+        finally:
+            close_old_connections()
+
+
+def _lease_duration():
+    return timedelta(seconds=getattr(settings, 'INGESTION_JOB_LEASE', 60))
+
+
+def worker_id():
+    """Names the calling worker thread and claim, so a job claimed again (even by the
+    same thread) after its lease expired is told apart from the earlier attempt."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+
+
+def requeue_stale_jobs():
+    """Puts back running jobs whose lease expired, i.e. whose worker died mid-job."""
+    now = timezone.now()
+    IngestionJob.objects.filter(
+        Q(lease_expires_at__lt=now)
+        # Jobs claimed before leases existed.
+        | Q(lease_expires_at__isnull=True, started_at__lt=now - _lease_duration()),
+        status=IngestionJob.STATUS_RUNNING,
+    ).update(status=IngestionJob.STATUS_QUEUED, started_at=None, worker_id='', lease_expires_at=None)
+
+
+def claim_next_job():
+    """Atomically moves the oldest queued job to 'running'; safe across threads and processes."""
+    queued = IngestionJob.objects.filter(status=IngestionJob.STATUS_QUEUED).order_by('created_at')
+    owner = worker_id()
+    for job_id in queued.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = IngestionJob.objects.filter(id=job_id, status=IngestionJob.STATUS_QUEUED).update(
+            status=IngestionJob.STATUS_RUNNING, started_at=now,
+            worker_id=owner, lease_expires_at=now + _lease_duration(),
+        )
+        if claimed:
+            return IngestionJob.objects.get(id=job_id)
+    return None
+
+
+def renew_lease(job):
+    """Extends the lease on a job this worker runs; False if the job is no longer ours."""
+    return bool(IngestionJob.objects.filter(
+        id=job.id, status=IngestionJob.STATUS_RUNNING, worker_id=job.worker_id
+    ).update(lease_expires_at=timezone.now() + _lease_duration()))
+
+
+@contextmanager
+def _heartbeat(job):
+    """Renews the job's lease from a background thread while the body runs."""
+    stop = threading.Event()
+    interval = _lease_duration().total_seconds() / 3
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                if not renew_lease(job):
+                    print(f"[WARN] Ingestion job {job.id} lost its lease")
+                    return
+        except Exception as e:
+            print(f"[WARN] Ingestion job {job.id} lease renewal failed: {e}")
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=beat, name=f"ingestion-lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    from .rag_utils import process_files_bulk
+
+    files = list(job.files.all())
+    job.files.update(status='Processing')
+
+    def progress(source, status):
+        job.files.filter(source=source).update(status=status)
+
+    try:
+        with _heartbeat(job):
+            success = process_files_bulk([f.source for f in files], job.session_id, progress_callback=progress)
+        job.status = IngestionJob.STATUS_DONE if success else IngestionJob.STATUS_FAILED
+        if not success:
+            job.files.filter(status__in=['Processing', 'Embedding']).update(status='Index Failed')
+
+        ChatMessage.objects.create(
+            session_id=job.session_id, is_user=True,
+            text=f"Uploaded {len(files)} source(s)."
+        )
+        ChatMessage.objects.create(
+            session_id=job.session_id, is_user=False,
+            text="I have analyzed these sources. Ask me anything!" if success
+            else "I couldn't index these sources. Please check the files or links and try again."
+        )
+    except Exception as e:
+        print(f"[ERROR] Ingestion job {job.id} failed: {e}")
+        job.status = IngestionJob.STATUS_FAILED
+        job.error = str(e)
+        job.files.exclude(status='Indexed').update(status='Index Failed')
+    finally:
+        job.finished_at = timezone.now()
+        IngestionJob.objects.filter(id=job.id, worker_id=job.worker_id).update(
+            status=job.status, error=job.error, finished_at=job.finished_at, lease_expires_at=None
+        )
+    return job
@@ -0,0 +1,117 @@
+import heapq
+import json
+import math
+import re
+from collections import Counter
+
+from .chunk_store import get_document
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our "
+    "she so that the their them then there these they this to was we were what when where which who why will "
+    "with you your".split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens; compound identifiers such as `AX-2291` or `v1.2` are kept
+    whole and also split into their parts, so exact codes and their pieces both match."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./:]", token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring over chunks identified by docstore id."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_store(cls, vector_store):
+        """Builds an index over every chunk of a FAISS store, in vector order."""
+        index = cls()
+        for position in range(vector_store.index.ntotal):
+            doc_id = vector_store.index_to_docstore_id[position]
+            index.add(doc_id, get_document(vector_store.docstore, doc_id).page_content)
+        return index
+
+    def add(self, doc_id, text):
+        number = len(self.doc_ids)
+        counts = Counter(tokenize(text))
+        self.doc_ids.append(doc_id)
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self._total_length += length
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[number] = tf
+
+    def merge(self, other):
+        """Appends all of `other`'s documents to this index."""
+        offset = len(self.doc_ids)
+        self.doc_ids.extend(other.doc_ids)
+        self.doc_lengths.extend(other.doc_lengths)
+        self._total_length += other._total_length
+        for term, docs in other.postings.items():
+            target = self.postings.setdefault(term, {})
+            for number, tf in docs.items():
+                target[number + offset] = tf
+        return self
+
+    def search(self, query, k=10):
+        """Returns up to `k` `(doc_id, score)` pairs, best first."""
+        count = len(self.doc_ids)
+        if not count:
+            return []
+        avg_length = self._total_length / count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for number, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[number] / avg_length)
+                scores[number] = scores.get(number, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[number], score) for number, score in best]
+
+    def estimated_bytes(self):
+        return 64 * (len(self.doc_ids) + sum(len(docs) for docs in self.postings.values()))
+
+    def save(self, path):
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": {term: [[number, tf] for number, tf in docs.items()] for term, docs in self.postings.items()},
+        }
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        index = cls(payload["k1"], payload["b"])
+        index.doc_ids = payload["doc_ids"]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: dict((number, tf) for number, tf in docs) for term, docs in payload["postings"].items()}
+        index._total_length = sum(index.doc_lengths)
+        return index
@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from .routerbench import _percentile
+
+QUERIES = [
+    "what is retrieval augmented generation",
+    "explain how transformers work",
+    "who won the world cup in 2022",
+    "how do I reverse a list in python",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams many concurrent chat answers against a local fake LLM and web search, "
+        "comparing the async pipeline with the thread-per-chat sync one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=200, help="Concurrent chats to stream.")
+        parser.add_argument('--mode', choices=['async', 'sync', 'both'], default='both')
+        parser.add_argument('--threads', type=int, default=16, help="Worker threads for the sync mode (WSGI workers).")
+        parser.add_argument('--token-delay', type=float, default=0.02, help="Seconds between fake LLM tokens.")
+        parser.add_argument('--search-delay', type=float, default=0.2, help="Seconds per fake web search.")
+
+    def handle(self, *args, **options):
+        from rag_core_app import rag_utils
+        from rag_core_app.cache_layer import NullCache
+        from rag_core_app.fakes import install_fakes
+
+        previous = install_fakes(token_delay=options['token_delay'], search_delay=options['search_delay'])
+        # Every chat repeats one of a few queries; measure the pipeline, not the shared cache.
+        previous_store, rag_utils.SHARED_CACHE.store = rag_utils.SHARED_CACHE.store, NullCache()
+        # Sessions without an index: each chat classifies, web-searches and streams.
+        session_ids = [-(i + 1) for i in range(options['chats'])]
+        try:
+            rag_utils.INTENT_ROUTER.classify("warm up the centroids", use_fallback=False)
+            if options['mode'] in ('sync', 'both'):
+                self._report("sync", *self._run_sync(rag_utils, session_ids, options['threads']))
+            if options['mode'] in ('async', 'both'):
+                self._report("async", *asyncio.run(self._run_async(rag_utils, session_ids)))
+        finally:
+            rag_utils._models.clear()
+            rag_utils._models.update(previous)
+            rag_utils.SHARED_CACHE.store = previous_store
+
+    def _run_sync(self, rag_utils, session_ids, threads):
+        # Latencies are measured from the moment the whole burst arrives, so time
+        # spent queued behind busy worker threads counts, as it would for a client.
+        def chat(session_id):
+            first = None
+            for _ in rag_utils.get_answer(QUERIES[session_id % len(QUERIES)], session_id):
+                first = first or time.perf_counter() - started
+            return first, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with _ThreadSampler() as sampler:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(chat, session_ids))
+            wall = time.perf_counter() - started
+        return results, wall, sampler.peak
+
+    async def _run_async(self, rag_utils, session_ids):
+        async def chat(session_id):
+            first = None
+            async for _ in rag_utils.aget_answer(QUERIES[session_id % len(QUERIES)], session_id):
+                first = first or time.perf_counter() - started
+            return first, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with _ThreadSampler() as sampler:
+            results = await asyncio.gather(*(chat(session_id) for session_id in session_ids))
+            wall = time.perf_counter() - started
+        return results, wall, sampler.peak
+
+    def _report(self, mode, results, wall, peak_threads):
+        ttft = [first * 1000 for first, _ in results if first is not None]
+        total = [elapsed * 1000 for _, elapsed in results]
+        self.stdout.write(
+            f"{mode:<5} {len(results)} chats in {wall:6.2f}s ({len(results) / wall:6.1f} chats/s)   "
+            f"TTFT p50 {statistics.median(ttft):7.0f}ms p95 {_percentile(ttft, 95):7.0f}ms   "
+            f"total p50 {statistics.median(total):7.0f}ms p95 {_percentile(total, 95):7.0f}ms   "
+            f"peak threads {peak_threads}"
+        )
+
+
+class _ThreadSampler:
+    """Samples `threading.active_count()` in the background to find the peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
@@ -0,0 +1,100 @@
+import json
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from .routerbench import _percentile
+
+
+def synthetic_corpus(n, d, clusters=64, latent_dim=32, seed=0):
+    """Unit-norm vectors clustered around topics in a low-dimensional subspace.
+
+    Sentence embeddings have far lower intrinsic dimension than their width; uniform
+    random vectors would make every approximate index look much worse than it is.
+    """
+    rng = np.random.default_rng(0)  # topics and projection are shared by corpus and queries
+    centroids = rng.normal(size=(clusters, latent_dim))
+    projection = rng.normal(size=(latent_dim, d))
+    rng = np.random.default_rng(seed + 1)
+    latent = centroids[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, latent_dim))
+    vectors = (latent @ projection + 0.5 * rng.normal(size=(n, d))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+class Command(BaseCommand):
+    help = "Measures recall@k, query latency, build time and size of FAISS index types on synthetic corpora."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default="10000,50000", help="Comma-separated corpus sizes.")
+        parser.add_argument('--dim', type=int, default=384, help="Vector dimension (MiniLM is 384).")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('-k', type=int, default=5)
+        parser.add_argument(
+            '--specs', default="auto",
+            help="Comma-separated faiss index_factory strings, or 'auto' for the types the session index factory uses."
+        )
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from rag_core_app.index_factory import build_index, choose_spec, index_bytes
+
+        nprobe = getattr(settings, 'FAISS_IVF_NPROBE', 16)
+        ef_search = getattr(settings, 'FAISS_HNSW_EF_SEARCH', 64)
+        d, k = options['dim'], options['k']
+        rows = []
+
+        for n in [int(size) for size in options['sizes'].split(',')]:
+            corpus = synthetic_corpus(n, d)
+            queries = synthetic_corpus(options['queries'], d, seed=1)
+            if options['specs'] == 'auto':
+                # Every type the factory can pick, forced regardless of the size thresholds.
+                specs = list(dict.fromkeys(["Flat"] + [
+                    choose_spec(n, d, flat_max=0, hnsw_max=max_hnsw, quantization=quantization)
+                    for max_hnsw in (n, 0) for quantization in ("none", "sq8", "pq")
+                ]))
+            else:
+                specs = options['specs'].split(',')
+
+            truth = None
+            for spec in specs:
+                started = time.perf_counter()
+                index = build_index(corpus, spec, nprobe=nprobe, ef_search=ef_search)
+                build_seconds = time.perf_counter() - started
+
+                latencies, found = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    _, ids = index.search(query[None, :], k)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    found.append(ids[0])
+                found = np.array(found)
+                if truth is None and spec == "Flat":
+                    truth = found
+                recall = (
+                    float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+                    if truth is not None else None
+                )
+                rows.append({
+                    "vectors": n,
+                    "spec": spec,
+                    "recall_at_k": recall,
+                    "p50_ms": statistics.median(latencies),
+                    "p95_ms": _percentile(latencies, 95),
+                    "bytes": index_bytes(index),
+                    "build_seconds": build_seconds,
+                })
+                if not options['json']:
+                    row = rows[-1]
+                    recall_text = f"{row['recall_at_k']:.3f}" if recall is not None else "  n/a"
+                    self.stdout.write(
+                        f"n={n:<8} {spec:<16} recall@{k} {recall_text}   p50 {row['p50_ms']:7.3f}ms   "
+                        f"p95 {row['p95_ms']:7.3f}ms   {row['bytes'] / 1024 / 1024:8.1f}MB   "
+                        f"build {build_seconds:6.2f}s"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
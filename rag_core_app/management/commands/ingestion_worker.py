@@ -0,0 +1,28 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from rag_core_app.jobs import worker_loop
+
+
+class Command(BaseCommand):
+    help = "Runs ingestion job workers in a dedicated process instead of inside the web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help="Worker threads in this process.")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(target=worker_loop, args=(stop_event,), name=f"ingestion-worker-{i}", daemon=True)
+            for i in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f"Ingestion worker started with {len(threads)} thread(s)."))
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.stdout.write("Stopping ingestion worker...")
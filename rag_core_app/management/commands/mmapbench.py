@@ -0,0 +1,174 @@
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from .indexbench import synthetic_corpus
+from .routerbench import _percentile
+
+
+def _memory_kb():
+    """Rss, Pss and anonymous (private heap) memory of this process in kB, from /proc."""
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as fh:
+            for line in fh:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss", "Anonymous"):
+                    fields[name] = int(rest.split()[0])
+    except OSError:
+        import resource
+        fields["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return fields
+
+
+def _worker(db_path, mmap, queries, k, start, done, results):
+    """One web worker: loads the session index, answers queries and reports its memory."""
+    from langchain_community.embeddings import FakeEmbeddings
+    from rag_core_app.segment_store import load_segments
+
+    before = _memory_kb()
+    start.wait()
+    started = time.perf_counter()
+    index = load_segments(db_path, FakeEmbeddings(size=queries.shape[1]), mmap=mmap)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    def query(vector):
+        started = time.perf_counter()
+        _, ids = index.store.index.search(vector[None, :], k)
+        for i in ids[0]:
+            if i >= 0:
+                index.store.docstore.search(index.store.index_to_docstore_id[int(i)])
+        return (time.perf_counter() - started) * 1000
+
+    cold_ms = query(queries[0])
+    warm = [query(vector) for vector in queries[1:]]
+    after = _memory_kb()
+    results.put({
+        "load_ms": load_ms,
+        "cold_ms": cold_ms,
+        "warm_p50_ms": statistics.median(warm),
+        "warm_p95_ms": _percentile(warm, 95),
+        "rss_mb": after.get("Rss", 0) / 1024,
+        "pss_mb": after.get("Pss", 0) / 1024,
+        "added_rss_mb": (after.get("Rss", 0) - before.get("Rss", 0)) / 1024,
+        "added_anon_mb": (after.get("Anonymous", 0) - before.get("Anonymous", 0)) / 1024,
+    })
+    # Stay alive until every worker has measured, so shared pages are counted as shared.
+    done.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads one synthetic session index in N worker processes, in heap and mmap mode, "
+        "and reports per-worker memory and cold/warm query latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=100000)
+        parser.add_argument('--dim', type=int, default=384, help="Vector dimension (MiniLM is 384).")
+        parser.add_argument('--workers', type=int, default=4, help="Worker processes loading the index.")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('-k', type=int, default=5)
+        parser.add_argument('--modes', default="heap,mmap", help="Comma-separated load modes to compare.")
+        parser.add_argument(
+            '--drop-caches', action='store_true',
+            help="Drop the OS page cache before each mode (Linux, needs root) for truly cold first queries."
+        )
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.embeddings import FakeEmbeddings
+        from langchain_community.vectorstores import FAISS
+        from langchain.docstore.document import Document
+        from rag_core_app.index_factory import build_index, choose_spec
+        from rag_core_app.segment_store import SessionIndex, append_segment
+
+        n, d, k = options['vectors'], options['dim'], options['k']
+        spec = choose_spec(
+            n, d,
+            flat_max=getattr(settings, 'FAISS_FLAT_MAX_VECTORS', 20000),
+            hnsw_max=getattr(settings, 'FAISS_HNSW_MAX_VECTORS', 200000),
+            quantization=getattr(settings, 'FAISS_QUANTIZATION', 'none'),
+        )
+        queries = synthetic_corpus(options['queries'] + 1, d, seed=1)
+        rows = []
+
+        with tempfile.TemporaryDirectory() as db_path:
+            started = time.perf_counter()
+            index = build_index(
+                synthetic_corpus(n, d), spec,
+                nprobe=getattr(settings, 'FAISS_IVF_NPROBE', 16),
+                ef_search=getattr(settings, 'FAISS_HNSW_EF_SEARCH', 64),
+            )
+            ids = [f"chunk-{i}" for i in range(n)]
+            docs = {
+                doc_id: Document(
+                    page_content=f"Synthetic chunk {i} of the benchmark corpus. " * 16,
+                    metadata={"source": "mmapbench.txt", "chunk": i},
+                )
+                for i, doc_id in enumerate(ids)
+            }
+            store = FAISS(FakeEmbeddings(size=d), index, InMemoryDocstore(docs), dict(enumerate(ids)))
+            append_segment(db_path, SessionIndex(store))
+            del store, index, docs
+            self.stdout.write(f"Built {n}x{d} {spec} session index in {time.perf_counter() - started:.1f}s")
+
+            context = multiprocessing.get_context("spawn")
+            for mode in options['modes'].split(','):
+                if options['drop_caches']:
+                    self._drop_caches()
+                start = context.Barrier(options['workers'])
+                done = context.Event()
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=_worker, args=(db_path, mode == "mmap", queries, k, start, done, results)
+                    )
+                    for _ in range(options['workers'])
+                ]
+                for worker in workers:
+                    worker.start()
+                measured = [results.get() for _ in workers]
+                done.set()
+                for worker in workers:
+                    worker.join()
+
+                row = {
+                    "mode": mode,
+                    "spec": spec,
+                    "vectors": n,
+                    "workers": len(workers),
+                    "load_ms": statistics.median(r["load_ms"] for r in measured),
+                    "cold_ms": statistics.median(r["cold_ms"] for r in measured),
+                    "warm_p50_ms": statistics.median(r["warm_p50_ms"] for r in measured),
+                    "warm_p95_ms": max(r["warm_p95_ms"] for r in measured),
+                    "added_rss_mb_per_worker": statistics.mean(r["added_rss_mb"] for r in measured),
+                    "added_anon_mb_per_worker": statistics.mean(r["added_anon_mb"] for r in measured),
+                    "total_pss_mb": sum(r["pss_mb"] for r in measured),
+                }
+                rows.append(row)
+                if not options['json']:
+                    self.stdout.write(
+                        f"{mode:<5} x{row['workers']}   load {row['load_ms']:8.1f}ms   cold {row['cold_ms']:7.2f}ms   "
+                        f"warm p50 {row['warm_p50_ms']:6.3f}ms p95 {row['warm_p95_ms']:6.3f}ms   "
+                        f"+RSS {row['added_rss_mb_per_worker']:7.1f}MB/worker "
+                        f"(private {row['added_anon_mb_per_worker']:7.1f}MB)   total PSS {row['total_pss_mb']:8.1f}MB"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+
+    def _drop_caches(self):
+        try:
+            os.sync()
+            with open("/proc/sys/vm/drop_caches", "w") as fh:
+                fh.write("3\n")
+        except OSError as e:
+            self.stderr.write(f"[WARN] Could not drop the page cache: {e}")
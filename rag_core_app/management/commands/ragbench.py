@@ -0,0 +1,188 @@
+import concurrent.futures
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .routerbench import _percentile
+
+BENCH_SESSION_ID = -424242
+
+
+def _summary(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {"p50": statistics.median(values), "p95": _percentile(values, 95), "p99": _percentile(values, 99)}
+
+
+def _spread(items, count):
+    """Up to `count` items picked evenly across `items`, so every document type is queried."""
+    return items[::max(1, len(items) // count)][:count] if count > 0 else []
+
+
+def _directory_bytes(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end benchmark: ingests synthetic documents of every type, then measures "
+        "retrieval and streamed answers against a local fake LLM and web search."
+    )
+
+    def add_arguments(self, parser):
+        from rag_core_app.synthetic_docs import SUPPORTED_TYPES
+
+        parser.add_argument('--types', default=",".join(SUPPORTED_TYPES), help="Comma-separated document types.")
+        parser.add_argument('--docs-per-type', type=int, default=2)
+        parser.add_argument('--paragraphs', type=int, default=40, help="Paragraphs (one planted fact each) per document.")
+        parser.add_argument('--queries', type=int, default=100, help="Retrieval queries.")
+        parser.add_argument('--answers', type=int, default=20, help="Full streamed answers.")
+        parser.add_argument('--token-delay', type=float, default=0.005, help="Seconds between fake LLM tokens.")
+        parser.add_argument('--search-delay', type=float, default=0.05, help="Seconds per fake web search.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        from rag_core_app import rag_utils
+        from rag_core_app.cache_layer import NullCache
+        from rag_core_app.fakes import install_fakes
+        from rag_core_app.synthetic_docs import WRITERS, write_documents
+
+        types = [t.strip() for t in options['types'].split(',') if t.strip()]
+        unknown = [t for t in types if t not in WRITERS]
+        if unknown:
+            raise CommandError(f"Unsupported document types: {', '.join(unknown)}")
+        if rag_utils.get_embeddings() is None:
+            raise CommandError("Embedding model failed to load.")
+
+        previous = install_fakes(token_delay=options['token_delay'], search_delay=options['search_delay'])
+        # Start every run cold, so results don't depend on what earlier runs left in the shared cache.
+        previous_store, rag_utils.SHARED_CACHE.store = rag_utils.SHARED_CACHE.store, NullCache()
+        rag_utils.clear_data(BENCH_SESSION_ID)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                files, facts = write_documents(
+                    directory, types, options['docs_per_type'], options['paragraphs'], options['seed']
+                )
+                results = {
+                    "ingestion": self._ingest(rag_utils, files),
+                    "index": self._index_size(rag_utils),
+                    "retrieval": self._retrieve(rag_utils, facts, options['queries']),
+                    "answers": self._answer(rag_utils, facts, options['answers']),
+                }
+        finally:
+            rag_utils.clear_data(BENCH_SESSION_ID)
+            rag_utils._models.clear()
+            rag_utils._models.update(previous)
+            rag_utils.SHARED_CACHE.store = previous_store
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._report(results)
+
+    def _ingest(self, rag_utils, files):
+        rows = []
+        for file_type, paths in files.items():
+            before = self._vector_count(rag_utils)
+            size = sum(os.path.getsize(path) for path in paths)
+            started = time.perf_counter()
+            ok = rag_utils.process_files_bulk(paths, BENCH_SESSION_ID)
+            seconds = time.perf_counter() - started
+            chunks = self._vector_count(rag_utils) - before
+            rows.append({
+                "type": file_type,
+                "files": len(paths),
+                "ok": ok,
+                "bytes": size,
+                "chunks": chunks,
+                "seconds": seconds,
+                "chunks_per_second": chunks / seconds if seconds else None,
+                "mb_per_second": size / 1024 / 1024 / seconds if seconds else None,
+            })
+        return rows
+
+    def _vector_count(self, rag_utils):
+        index = rag_utils.load_session_index(BENCH_SESSION_ID)
+        return index.store.index.ntotal if index else 0
+
+    def _index_size(self, rag_utils):
+        from rag_core_app.segment_store import read_manifest
+
+        db_path = rag_utils.get_db_path(BENCH_SESSION_ID)
+        index = rag_utils.load_session_index(BENCH_SESSION_ID)
+        manifest = read_manifest(db_path) or {"segments": []}
+        return {
+            "vectors": index.store.index.ntotal if index else 0,
+            "segments": len(manifest["segments"]),
+            "disk_bytes": _directory_bytes(db_path) if os.path.exists(db_path) else 0,
+            "memory_bytes": index.estimated_bytes() if index else 0,
+        }
+
+    def _retrieve(self, rag_utils, facts, count):
+        latencies, hits, prompt_tokens, saved = [], 0, [], 0
+        for fact in _spread(facts, count):
+            started = time.perf_counter()
+            candidates, source = rag_utils._retrieve_context(
+                f"Which project does reference code {fact.code} belong to?",
+                BENCH_SESSION_ID, concurrent.futures.Future(),
+            )
+            packed = rag_utils.CONTEXT_PACKER.pack([], candidates)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += source == "Uploaded Document" and fact.code in packed.context
+            prompt_tokens.append(packed.stats["prompt_tokens"])
+            saved += packed.stats["tokens_saved"]
+        return {
+            "queries": len(latencies),
+            "hit_rate": hits / len(latencies) if latencies else None,
+            "prompt_tokens": statistics.mean(prompt_tokens) if prompt_tokens else None,
+            "tokens_saved": saved / len(latencies) if latencies else None,
+            **_summary(latencies),
+        }
+
+    def _answer(self, rag_utils, facts, count):
+        ttft, total = [], []
+        for fact in _spread(facts, count):
+            first = None
+            started = time.perf_counter()
+            for _ in rag_utils.get_answer(f"What project uses reference code {fact.code}?", BENCH_SESSION_ID):
+                first = first or time.perf_counter() - started
+            if first is not None:
+                ttft.append(first * 1000)
+            total.append((time.perf_counter() - started) * 1000)
+        return {"answers": len(total), "ttft_ms": _summary(ttft), "total_ms": _summary(total)}
+
+    def _report(self, results):
+        for row in results["ingestion"]:
+            self.stdout.write(
+                f"ingest {row['type']:<5} {row['files']} files {row['bytes'] / 1024:8.1f}KB   {row['chunks']:5} chunks "
+                f"in {row['seconds']:6.2f}s   {row['chunks_per_second'] or 0:7.1f} chunks/s   "
+                f"{row['mb_per_second'] or 0:6.2f}MB/s{'' if row['ok'] else '   FAILED'}"
+            )
+        index = results["index"]
+        self.stdout.write(
+            f"index  {index['vectors']} vectors in {index['segments']} segments   "
+            f"disk {index['disk_bytes'] / 1024 / 1024:.1f}MB   memory {index['memory_bytes'] / 1024 / 1024:.1f}MB"
+        )
+        retrieval = results["retrieval"]
+        if retrieval["queries"]:
+            self.stdout.write(
+                f"retrieval {retrieval['queries']} queries   hit rate {retrieval['hit_rate']:.2f}   "
+                f"p50 {retrieval['p50']:7.1f}ms p95 {retrieval['p95']:7.1f}ms p99 {retrieval['p99']:7.1f}ms   "
+                f"context {retrieval['prompt_tokens']:.0f} tokens ({retrieval['tokens_saved']:.0f} saved)"
+            )
+        answers = results["answers"]
+        for label in ("ttft_ms", "total_ms"):
+            stats = answers[label]
+            if stats["p50"] is not None:
+                self.stdout.write(
+                    f"answer {label[:-3]:<5} ({answers['answers']})   p50 {stats['p50']:7.1f}ms "
+                    f"p95 {stats['p95']:7.1f}ms p99 {stats['p99']:7.1f}ms"
+                )
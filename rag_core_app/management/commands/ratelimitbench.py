@@ -0,0 +1,117 @@
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from .routerbench import _percentile
+
+
+def _latencies_us(func, count):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        func(i)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return latencies
+
+
+def _summary(latencies):
+    return {
+        "p50_us": statistics.median(latencies),
+        "p95_us": _percentile(latencies, 95),
+        "p99_us": _percentile(latencies, 99),
+    }
+
+
+def _burst_worker(path, limit, hits, start, results):
+    """One web worker sending `hits` requests for the same user as fast as it can."""
+    from rag_core_app.rate_limit import SlidingWindowLimiter
+
+    limiter = SlidingWindowLimiter(path)
+    start.wait()
+    started = time.perf_counter()
+    allowed = sum(not limiter.hit("burst:1", limit, 3600) for _ in range(hits))
+    results.put((allowed, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the per-request overhead of the SQLite rate limiter and checks that "
+        "concurrent worker processes never admit more than the limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help="Checks timed per scenario.")
+        parser.add_argument('--workers', type=int, default=4, help="Processes in the burst test.")
+        parser.add_argument('--burst', type=int, default=500, help="Requests per process in the burst test.")
+        parser.add_argument('--limit', type=int, default=100, help="Limit for the burst test.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        from django.core.cache.backends.locmem import LocMemCache
+        from rag_core_app.rate_limit import SlidingWindowLimiter
+
+        count = options['requests']
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ratelimit.sqlite3")
+            limiter = SlidingWindowLimiter(path)
+            limiter.hit("warmup", 1, 60)
+
+            # Allowed: every request is a different user, so each check inserts a hit.
+            results["allowed"] = _summary(_latencies_us(lambda i: limiter.hit(f"chat:{i}", 15, 60), count))
+            # Limited: one user already at the limit, so each check is rejected.
+            for _ in range(15):
+                limiter.hit("chat:busy", 15, 60)
+            results["limited"] = _summary(_latencies_us(lambda i: limiter.hit("chat:busy", 15, 60), count))
+
+            # The previous per-process cache.get/cache.set counter, for comparison.
+            cache = LocMemCache("ratelimitbench", {})
+
+            def locmem(i):
+                key = f"rate_limit_chat_{i % 1000}"
+                cache.set(key, cache.get(key, 0) + 1, 60)
+            results["locmem_baseline"] = _summary(_latencies_us(locmem, count))
+
+            context = multiprocessing.get_context("spawn")
+            start = context.Barrier(options['workers'])
+            queue = context.Queue()
+            workers = [
+                context.Process(
+                    target=_burst_worker, args=(path, options['limit'], options['burst'], start, queue)
+                )
+                for _ in range(options['workers'])
+            ]
+            for worker in workers:
+                worker.start()
+            measured = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            requests = options['workers'] * options['burst']
+            results["burst"] = {
+                "workers": options['workers'],
+                "requests": requests,
+                "limit": options['limit'],
+                "allowed": sum(allowed for allowed, _ in measured),
+                "requests_per_second": requests / max(seconds for _, seconds in measured),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name in ("allowed", "limited", "locmem_baseline"):
+            row = results[name]
+            self.stdout.write(
+                f"{name:<16} p50 {row['p50_us']:7.1f}us   p95 {row['p95_us']:7.1f}us   p99 {row['p99_us']:7.1f}us"
+            )
+        burst = results["burst"]
+        self.stdout.write(
+            f"burst  {burst['workers']} processes x {options['burst']} requests: {burst['allowed']} allowed "
+            f"(limit {burst['limit']})   {burst['requests_per_second']:.0f} checks/s"
+        )
+        if burst["allowed"] != burst["limit"]:
+            self.stderr.write("[WARN] Burst admitted a different number of requests than the limit.")
@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+# Held-out utterances, none of which appear in the router's own example lists.
+LABELLED_QUERIES = [
+    ("hello!", "CHAT"), ("hey, good afternoon", "CHAT"), ("thanks, that was useful", "CHAT"),
+    ("how's your day going?", "CHAT"), ("you're the best", "CHAT"), ("ok bye for now", "CHAT"),
+    ("haha nice one", "CHAT"), ("good to see you again", "CHAT"), ("I appreciate the help", "CHAT"),
+    ("are you a robot?", "CHAT"), ("morning!", "CHAT"), ("that's all, thank you", "CHAT"),
+    ("what is the main argument of the paper", "QUERY"), ("summarise chapter two", "QUERY"),
+    ("which products had the highest sales", "QUERY"), ("how do I install django on windows", "QUERY"),
+    ("who wrote pride and prejudice", "QUERY"), ("what's the boiling point of water in kelvin", "QUERY"),
+    ("give me the deadlines mentioned in the contract", "QUERY"), ("explain the formula on page 4", "QUERY"),
+    ("latest stock price of apple", "QUERY"), ("how does garbage collection work in python", "QUERY"),
+    ("any news on the election results", "QUERY"), ("what is part number AX-2291 used for", "QUERY"),
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Compares accuracy and latency of the local intent router against the router LLM."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--llm', action='store_true', help="Also benchmark the remote router LLM.")
+        parser.add_argument('--rounds', type=int, default=3, help="Passes over the labelled set.")
+
+    def handle(self, *args, **options):
+        from rag_core_app import rag_utils
+        from rag_core_app.cache_layer import NullCache
+
+        router = rag_utils.INTENT_ROUTER
+        # Repeated rounds would otherwise be answered from the decision and query vector caches.
+        previous_store, rag_utils.SHARED_CACHE.store = rag_utils.SHARED_CACHE.store, NullCache()
+        try:
+            self._run(router, rag_utils, options)
+        finally:
+            rag_utils.SHARED_CACHE.store = previous_store
+
+    def _run(self, router, rag_utils, options):
+        router.classify("warm up the centroids", use_fallback=False)
+
+        strategies = [
+            ("local", lambda q: router.classify(q, use_fallback=False).label),
+            ("local+fallback", lambda q: router.classify(q).label),
+        ]
+        if options['llm']:
+            strategies.append(("llm", rag_utils.llm_intent))
+
+        for name, classify in strategies:
+            rounds = 1 if name != "local" else options['rounds']
+            correct, latencies = 0, []
+            for _ in range(rounds):
+                for query, expected in LABELLED_QUERIES:
+                    started = time.perf_counter()
+                    label = classify(query)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    correct += label == expected
+            total = rounds * len(LABELLED_QUERIES)
+            self.stdout.write(
+                f"{name:<15} accuracy {correct / total:6.1%}   "
+                f"p50 {statistics.median(latencies):8.2f}ms   p95 {_percentile(latencies, 95):8.2f}ms"
+            )
@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Preloads the embedding model and LLM clients and runs a dummy embedding."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pool', action='store_true',
+            help="Also start the embedding process pool (when EMBEDDING_WORKERS > 1)."
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        from rag_core_app import rag_utils
+        self._report("Imported rag_utils", started)
+
+        step = time.perf_counter()
+        embeddings = rag_utils.get_embeddings()
+        if embeddings is None:
+            raise CommandError("Embedding model failed to load.")
+        self._report("Loaded embedding model", step)
+
+        step = time.perf_counter()
+        vector = embeddings.embed_query("warmup")
+        self._report(f"Dummy embedding ({len(vector)} dims)", step)
+
+        step = time.perf_counter()
+        rag_utils.get_chat_llm()
+        rag_utils.get_router_llm()
+        self._report("Initialised LLM clients", step)
+
+        workers = getattr(settings, 'EMBEDDING_WORKERS', 0)
+        if options['pool'] and workers > 1:
+            from rag_core_app.embedding_pipeline import _embed_batch, get_process_pool
+            step = time.perf_counter()
+            pool = get_process_pool(
+                rag_utils.EMBEDDING_MODEL_NAME, workers, getattr(settings, 'EMBEDDING_BATCH_SIZE', 64)
+            )
+            for future in [pool.submit(_embed_batch, ["warmup"]) for _ in range(workers)]:
+                future.result()
+            self._report(f"Started {workers} embedding workers", step)
+
+        self.stdout.write(self.style.SUCCESS(f"Warmup complete in {time.perf_counter() - started:.2f}s"))
+
+    def _report(self, label, started):
+        self.stdout.write(f"{label}: {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process latency histograms for the chat and ingestion pipelines, rendered in the
+# Prometheus text format. Each worker process keeps its own counts, so scrape every
+# worker (or sum across them) to see the whole deployment.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_METRIC = "rag_stage_duration_seconds"
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """Thread-safe set of labelled histograms plus collectors for other exported values.
+
+    A collector is a function returning `(name, type, help, [(labels, value), ...])`,
+    called at render time, so modules can export their own counters without importing
+    this registry's callers.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+                self._help.setdefault(name, help_text)
+            histogram.observe(seconds)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            families = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                families.setdefault(name, []).append((labels, histogram))
+            for name, series in families.items():
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series:
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                name, kind, help_text, samples = collector()
+            except Exception as e:
+                print(f"[WARN] Metrics collector failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Timings:
+    """Per-request stage timings for one pipeline run (a chat answer, an ingestion).
+
+    Spans may be recorded from several threads; a stage recorded more than once is
+    summed. Every span is also observed in the process-wide stage histogram.
+    """
+
+    def __init__(self, pipeline, registry=REGISTRY):
+        self.pipeline = pipeline
+        self.registry = registry
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._notes = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+        self.registry.observe(
+            STAGE_METRIC, seconds, "Time spent in each pipeline stage.", pipeline=self.pipeline, stage=stage
+        )
+
+    def mark(self, stage):
+        """Records the time elapsed since this run started, e.g. time to first token."""
+        self.add(stage, time.perf_counter() - self.started)
+
+    def note(self, name, value):
+        """Records a per-request figure that isn't a duration, e.g. prompt tokens."""
+        with self._lock:
+            self._notes[name] = value
+
+    def notes(self):
+        with self._lock:
+            return dict(self._notes)
+
+    def as_dict(self):
+        """Stage durations in milliseconds, in the order they were first recorded."""
+        with self._lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self._stages.items()}
+
+    def elapsed_timing(self, name, desc):
+        """A single `Server-Timing` entry for the time elapsed so far, e.g. before a response streams."""
+        ms = round((time.perf_counter() - self.started) * 1000, 1)
+        return f'{name};desc="{desc}";dur={ms}'
+
+    def summary(self):
+        return " ".join(f"{stage} {ms:.0f}ms" for stage, ms in self.as_dict().items())
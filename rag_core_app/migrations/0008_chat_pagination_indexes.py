@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_core_app', '0007_ingestionjob_ingestionjobfile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'timestamp'], name='chatmessage_session_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'created_at'], name='chatsession_user_created_idx'),
+        ),
+    ]
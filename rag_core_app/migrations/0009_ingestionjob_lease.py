@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_core_app', '0008_chat_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='worker_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -7,6 +7,10 @@ class ChatSession(models.Model):
     title = models.CharField(max_length=100, default="New Chat")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Serves the newest-first, keyset-paginated session list of a user.
+        indexes = [models.Index(fields=['user', 'created_at'], name='chatsession_user_created_idx')]
+
     def __str__(self):
         return self.title or "New Chat"
 
@@ -39,7 +43,65 @@ class ChatMessage(models.Model):
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Serves history reads and keyset pagination of a session's messages.
+        indexes = [models.Index(fields=['session', 'timestamp'], name='chatmessage_session_ts_idx')]
+
     def __str__(self):
         role = "User" if self.is_user else "Bot"
         preview = self.text[:60].replace('\n', ' ')
-        return f"[{role}] {preview}"
\ No newline at end of file
+        return f"[{role}] {preview}"
+
+
+class IngestionJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    session = models.ForeignKey(
+        ChatSession,
+        related_name='ingestion_jobs',
+        on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # The worker running the job keeps renewing its lease; an expired lease means it died.
+    worker_id = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def __str__(self):
+        return f"Job {self.id} [{self.status}] (Session: {self.session_id})"
+
+
+class IngestionJobFile(models.Model):
+    job = models.ForeignKey(
+        IngestionJob,
+        related_name='files',
+        on_delete=models.CASCADE
+    )
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    name = models.CharField(max_length=255)
+    source = models.TextField()
+    status = models.CharField(max_length=50, default='Uploaded')
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
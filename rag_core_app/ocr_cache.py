@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from io import BytesIO
+
+# Imported by spawned PDF workers as well, so no Django here.
+
+
+class CachedOcr:
+    """Content-addressed cache in front of Tesseract.
+
+    Results are keyed by a hash of the image content plus everything that changes the
+    OCR output (language, page segmentation mode and, for rendered PDF pages, DPI), so
+    the same screenshot or scan uploaded to any session is only recognized once.
+    """
+
+    def __init__(self, store, lang="eng", psm=3, tesseract_cmd=None):
+        self.store = store
+        self.lang = lang
+        self.psm = psm
+        self.tesseract_cmd = tesseract_cmd
+        self.hits = 0
+        self.misses = 0
+        self.ocr_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def cache_key(self, digest, dpi=None):
+        return hashlib.sha256(f"{digest}\0{self.lang}\0{self.psm}\0{dpi}".encode("utf-8")).hexdigest()
+
+    def image_bytes_to_string(self, data):
+        """OCRs an encoded image file (PNG, JPEG, ...); the image is only decoded on a miss."""
+        key = self.cache_key(hashlib.sha256(data).hexdigest())
+        return self._cached(key, lambda: self._recognize(_open_image(data)))
+
+    def image_to_string(self, image, dpi=None):
+        """OCRs a decoded PIL image, e.g. a PDF page rendered at `dpi`."""
+        digest = hashlib.sha256(f"{image.mode}\0{image.size}\0".encode("utf-8") + image.tobytes()).hexdigest()
+        return self._cached(self.cache_key(digest, dpi), lambda: self._recognize(image))
+
+    def _cached(self, key, recognize):
+        try:
+            cached = self.store.get(key)
+        except Exception as e:
+            print(f"[WARN] OCR cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            with self._stats_lock:
+                self.hits += 1
+            return cached.decode("utf-8")
+
+        started = time.perf_counter()
+        text = recognize()
+        with self._stats_lock:
+            self.misses += 1
+            self.ocr_seconds += time.perf_counter() - started
+        try:
+            self.store.set(key, text.encode("utf-8"))
+        except Exception as e:
+            print(f"[WARN] OCR cache write failed: {e}")
+        return text
+
+    def _recognize(self, image):
+        import pytesseract
+        if self.tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+        return pytesseract.image_to_string(image, lang=self.lang, config=f"--psm {self.psm}")
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "ocr_seconds": self.ocr_seconds,
+                "avg_ocr_seconds": self.ocr_seconds / self.misses if self.misses else 0.0,
+            }
+
+
+def ocr_metrics(ocrs):
+    """OCR lookups of the given `CachedOcr`s by result, in the metrics registry's collector format."""
+    stats = [ocr.stats() for ocr in ocrs]
+    return (
+        "rag_ocr_cache_requests_total", "counter",
+        "OCR lookups: text found in the cache, or recognized by Tesseract.",
+        [({"result": "hit"}, sum(s["hits"] for s in stats)), ({"result": "miss"}, sum(s["misses"] for s in stats))],
+    )
+
+
+def ocr_seconds_metrics(ocrs):
+    return (
+        "rag_ocr_seconds_total", "counter", "Time spent in Tesseract on cache misses.",
+        [({}, round(sum(ocr.stats()["ocr_seconds"] for ocr in ocrs), 6))],
+    )
+
+
+def _open_image(data):
+    from PIL import Image
+    return Image.open(BytesIO(data))
@@ -0,0 +1,130 @@
+import atexit
+import concurrent.futures
+import multiprocessing
+import threading
+from collections import namedtuple
+
+# Like embedding_pipeline, this module runs inside spawned workers and must not touch Django.
+
+OcrOptions = namedtuple(
+    "OcrOptions",
+    ["dpi", "lang", "psm", "min_text_chars", "poppler_path", "tesseract_cmd", "cache_path", "cache_max_bytes"],
+)
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+_ocr = {}
+_ocr_lock = threading.Lock()
+
+
+def _render_page(file_path, doc, number, options):
+    """Rasterizes one page (0-based) for OCR, with pdf2image when Poppler is available."""
+    try:
+        from pdf2image import convert_from_path
+        images = convert_from_path(
+            file_path, dpi=options.dpi, first_page=number + 1, last_page=number + 1,
+            poppler_path=options.poppler_path or None,
+        )
+        if images:
+            return images[0]
+    except Exception:
+        pass  # Poppler missing or failed on this page; render with MuPDF instead
+    from PIL import Image
+    pixmap = doc[number].get_pixmap(dpi=options.dpi)
+    return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def get_ocr(options):
+    """Returns this process's `CachedOcr` for `options`; workers share the cache file on disk."""
+    key = (options.lang, options.psm, options.tesseract_cmd, options.cache_path)
+    with _ocr_lock:
+        if key not in _ocr:
+            from .disk_cache import DiskLRUCache
+            from .ocr_cache import CachedOcr
+            _ocr[key] = CachedOcr(
+                DiskLRUCache(options.cache_path, options.cache_max_bytes),
+                lang=options.lang, psm=options.psm, tesseract_cmd=options.tesseract_cmd,
+            )
+        return _ocr[key]
+
+
+def ocr_instances():
+    """The `CachedOcr`s this process has created (PDF worker processes keep their own)."""
+    with _ocr_lock:
+        return list(_ocr.values())
+
+
+def extract_pages(file_path, first, last, options):
+    """Returns `(page, text, ocr)` for pages `first..last-1`, OCRing pages without a text layer."""
+    import pymupdf
+
+    pages = []
+    with pymupdf.open(file_path) as doc:
+        for number in range(first, last):
+            text = doc[number].get_text()
+            ocr = len(text.strip()) < options.min_text_chars
+            if ocr:
+                try:
+                    image = _render_page(file_path, doc, number, options)
+                    text = get_ocr(options).image_to_string(image, dpi=options.dpi)
+                except Exception as e:
+                    print(f"[WARN] OCR failed for page {number + 1} of {file_path}: {e}")
+            pages.append((number, text, ocr))
+    return pages
+
+
+def get_process_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def shutdown_process_pool(wait=True):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+        _pool, _pool_workers = None, None
+
+
+def iter_pdf_pages(file_path, options, workers=0, pages_per_task=4):
+    """Yields `(page, text, ocr, total_pages)` for every page of a PDF, in completion order.
+
+    Pages are extracted in ranges of `pages_per_task`; with `workers` > 1 and more than
+    one range, the ranges run in a process pool so text extraction and OCR of scanned
+    pages proceed in parallel, and each range is yielded as soon as it finishes.
+    """
+    import pymupdf
+
+    with pymupdf.open(file_path) as doc:
+        total = len(doc)
+    ranges = [(first, min(first + pages_per_task, total)) for first in range(0, total, pages_per_task)]
+
+    if workers > 1 and len(ranges) > 1:
+        done = set()
+        try:
+            pool = get_process_pool(workers)
+            futures = [pool.submit(extract_pages, file_path, first, last, options) for first, last in ranges]
+            for future in concurrent.futures.as_completed(futures):
+                pages = future.result()
+                done.add(pages[0][0])
+                for number, text, ocr in pages:
+                    yield number, text, ocr, total
+            return
+        except concurrent.futures.process.BrokenProcessPool as e:
+            print(f"[WARN] PDF process pool failed, continuing in-process: {e}")
+            shutdown_process_pool(wait=False)
+            ranges = [(first, last) for first, last in ranges if first not in done]
+
+    for first, last in ranges:
+        for number, text, ocr in extract_pages(file_path, first, last, options):
+            yield number, text, ocr, total
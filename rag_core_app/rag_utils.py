@@ -5,51 +5,248 @@ if sys.stdout.encoding.lower() != 'utf-8':
     except AttributeError:
         pass
 
+import asyncio
 import os
-import shutil
-import pytesseract
-import requests
+import queue
+import threading
+import time
+import tempfile
 import concurrent.futures
-from io import BytesIO
 from datetime import datetime
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-from PIL import Image
-from pdf2image import convert_from_path
 from langchain_community.document_loaders import (
-    PyMuPDFLoader,
     TextLoader,
     Docx2txtLoader,
-    CSVLoader,
-    WebBaseLoader
 )
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_groq import ChatGroq
+from django.conf import settings
+from django.db import connection
 from .models import ChatMessage
+from .chat_tasks import heuristic_title
+from .index_cache import SessionIndexCache
+from .cache_layer import MemoryTTLCache, NullCache, SharedCache
+from .context_packing import Candidate, ContextPacker
+from .disk_cache import DiskLRUCache, DiskTTLCache, disk_cache_metrics, disk_size_metrics
+from .embedding_cache import CachedEmbeddings, bytes_to_vector, embedding_metrics, vector_to_bytes
+from .embedding_pipeline import BatchEmbedder
+from .ocr_cache import ocr_metrics, ocr_seconds_metrics
+from .pdf_pipeline import OcrOptions, get_ocr, iter_pdf_pages, ocr_instances
+from .spreadsheet_loader import iter_csv_documents, iter_xlsx_documents
+from .url_fetcher import UrlFetcher, decode_body, html_to_text
+from .intent_router import CHAT, QUERY, IntentRouter, keyword_intent
+from .index_factory import fit_index, fits
+from .keyword_index import BM25Index
+from .metrics import REGISTRY, Timings
+from .retrieval import hybrid_search
+from .search_cache import CachedSearch
+from .segment_store import (
+    SessionIndex, add_sources, append_segment, compact, delete_index, index_signature, indexed_sources, load_segments,
+)
 from langchain_community.tools import DuckDuckGoSearchResults
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
-try:
-    GLOBAL_EMBEDDINGS = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    CHAT_LLM = ChatGroq(temperature=0.2, model_name="llama-3.1-8b-instant", streaming=True)
-    ROUTER_LLM = ChatGroq(temperature=0.0, model_name="llama-3.1-8b-instant")
-except Exception:
-    GLOBAL_EMBEDDINGS = None
-    CHAT_LLM = None
-    ROUTER_LLM = None
+CACHE_DIR = Path(getattr(settings, "RAG_CACHE_DIR", BASE_DIR / "cache"))
+
+EMBEDDING_CACHE = DiskLRUCache(
+    CACHE_DIR / "embeddings.sqlite3",
+    max_bytes=getattr(settings, "EMBEDDING_CACHE_MAX_MB", 1024) * 1024 * 1024,
+)
+
+
+def _shared_cache_store():
+    backend = getattr(settings, "RAG_SHARED_CACHE_BACKEND", "disk")
+    max_bytes = getattr(settings, "RAG_SHARED_CACHE_MAX_MB", 256) * 1024 * 1024
+    if backend == "memory":
+        return MemoryTTLCache(max_bytes)
+    if backend == "none":
+        return NullCache()
+    return DiskTTLCache(CACHE_DIR / "shared.sqlite3", max_bytes)
+
+
+# Results worth reusing across requests, workers and restarts, one namespace (and TTL) each.
+SHARED_CACHE = SharedCache(_shared_cache_store())
+WEB_SEARCH_CACHE = SHARED_CACHE.namespace("web_search", getattr(settings, "WEB_SEARCH_CACHE_TTL", 3600))
+QUERY_EMBEDDING_CACHE = SHARED_CACHE.namespace(
+    "query_embedding", getattr(settings, "QUERY_EMBEDDING_CACHE_TTL", 7 * 86400),
+    dumps=vector_to_bytes, loads=bytes_to_vector,
+)
+INTENT_CACHE = SHARED_CACHE.namespace("intent", getattr(settings, "INTENT_CACHE_TTL", 86400))
+REGISTRY.register_collector(SHARED_CACHE.metrics)
+
+CHAT_MODEL_NAME = "llama-3.1-8b-instant"
+
+# Models are built on first use rather than at import, so management commands and
+# worker boot don't pay for torch/sentence-transformers; `manage.py warmup` preloads them.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(name, factory):
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                try:
+                    model = factory()
+                except Exception as e:
+                    print(f"[WARN] Could not initialise {name}: {e}")
+                    return None
+                _models[name] = model
+    return model
+
+
+def get_embeddings():
+    """Returns the shared (disk-cached) embedding model, loading it on first use."""
+    def build():
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return CachedEmbeddings(
+            HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME), EMBEDDING_MODEL_NAME, EMBEDDING_CACHE,
+            query_cache=QUERY_EMBEDDING_CACHE,
+        )
+    return _get_model("embeddings", build)
+
+
+def get_chat_llm():
+    def build():
+        from langchain_groq import ChatGroq
+        return ChatGroq(temperature=0.2, model_name=CHAT_MODEL_NAME, streaming=True)
+    return _get_model("chat_llm", build)
+
+
+def get_router_llm():
+    def build():
+        from langchain_groq import ChatGroq
+        return ChatGroq(temperature=0.0, model_name=CHAT_MODEL_NAME)
+    return _get_model("router_llm", build)
+
+
+def get_title_llm():
+    def build():
+        from langchain_groq import ChatGroq
+        return ChatGroq(temperature=0.3, model_name=CHAT_MODEL_NAME)
+    return _get_model("title_llm", build)
+
+
+def get_web_search():
+    return _get_model("web_search", lambda: DuckDuckGoSearchResults(num_results=4))
+
+
+WEB_SEARCH = CachedSearch(get_web_search, WEB_SEARCH_CACHE)
+REGISTRY.register_collector(WEB_SEARCH.request_metrics)
+REGISTRY.register_collector(WEB_SEARCH.saved_metrics)
+
+# Retrieval fetches CONTEXT_CANDIDATES chunks; the packer keeps the diverse ones that fit.
+CONTEXT_CANDIDATES = getattr(settings, "CONTEXT_CANDIDATES", 10)
+CONTEXT_PACKER = ContextPacker(
+    budget=getattr(settings, "CONTEXT_TOKEN_BUDGET", 3000),
+    history_share=getattr(settings, "CONTEXT_HISTORY_SHARE", 0.3),
+    max_chunks=getattr(settings, "CONTEXT_MAX_CHUNKS", 5),
+    mmr_lambda=getattr(settings, "CONTEXT_MMR_LAMBDA", 0.7),
+    duplicate_threshold=getattr(settings, "CONTEXT_DUPLICATE_THRESHOLD", 0.8),
+)
+REGISTRY.register_collector(CONTEXT_PACKER.metrics)
+
+
+SESSION_INDEX_CACHE = SessionIndexCache(
+    max_entries=getattr(settings, "RAG_INDEX_CACHE_MAX_ENTRIES", 32),
+    max_bytes=getattr(settings, "RAG_INDEX_CACHE_MAX_MB", 512) * 1024 * 1024,
+    ttl=getattr(settings, "RAG_INDEX_CACHE_TTL", 1800),
+)
+REGISTRY.register_collector(lambda: (
+    "rag_index_cache_events_total", "counter", "Session index cache lookups and evictions.",
+    [({"event": event}, getattr(SESSION_INDEX_CACHE, event)) for event in ("hits", "misses", "evictions")],
+))
+
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+
+_STAGE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=getattr(settings, "CHAT_STAGE_WORKERS", 32), thread_name_prefix="chat-stage"
+)
+_compaction_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-compaction")
+
+# Index type thresholds and search parameters, see index_factory.
+FAISS_INDEX_OPTIONS = {
+    "flat_max": getattr(settings, "FAISS_FLAT_MAX_VECTORS", 20000),
+    "hnsw_max": getattr(settings, "FAISS_HNSW_MAX_VECTORS", 200000),
+    "quantization": getattr(settings, "FAISS_QUANTIZATION", "none"),
+    "nprobe": getattr(settings, "FAISS_IVF_NPROBE", 16),
+    "ef_search": getattr(settings, "FAISS_HNSW_EF_SEARCH", 64),
+}
+_compactions_pending = set()
+# Memory-map session indexes instead of reading them into every worker's heap.
+FAISS_MMAP = getattr(settings, "FAISS_LOAD_MODE", "heap") == "mmap"
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
+# URL sources share one pooled HTTP session. Bodies with an ETag or Last-Modified are
+# kept on disk, so re-ingesting an unchanged page costs a 304 instead of a download.
+URL_FETCHER = UrlFetcher(
+    store=DiskLRUCache(CACHE_DIR / "urls.sqlite3", max_bytes=getattr(settings, "URL_CACHE_MAX_MB", 256) * 1024 * 1024),
+    max_bytes=getattr(settings, "URL_FETCH_MAX_MB", 20) * 1024 * 1024,
+    timeout=getattr(settings, "URL_FETCH_TIMEOUT", 15),
+    per_host=getattr(settings, "URL_FETCH_PER_HOST", 4),
+    pool_size=getattr(settings, "URL_FETCH_POOL_SIZE", 16),
+    headers=HEADERS,
+)
+
+# OCR results are cached on disk by image content, shared with the PDF worker processes.
+OCR_OPTIONS = OcrOptions(
+    dpi=getattr(settings, "PDF_OCR_DPI", 300),
+    lang=getattr(settings, "OCR_LANG", "eng"),
+    psm=getattr(settings, "OCR_PSM", 3),
+    min_text_chars=getattr(settings, "PDF_MIN_TEXT_CHARS", 20),
+    poppler_path=getattr(settings, "POPPLER_PATH", None),
+    tesseract_cmd=getattr(settings, "TESSERACT_CMD", None),
+    cache_path=str(CACHE_DIR / "ocr.sqlite3"),
+    cache_max_bytes=getattr(settings, "OCR_CACHE_MAX_MB", 256) * 1024 * 1024,
+)
+
+# Per-process cache counters; the embedding model and OCR engines only count once loaded.
+REGISTRY.register_collector(lambda: embedding_metrics(filter(None, [_models.get("embeddings")])))
+REGISTRY.register_collector(lambda: ocr_metrics(ocr_instances()))
+REGISTRY.register_collector(lambda: ocr_seconds_metrics(ocr_instances()))
+
+
+def _disk_caches():
+    """The disk caches of this process by file name: 'embeddings', 'urls', 'ocr'."""
+    stores = [EMBEDDING_CACHE, URL_FETCHER.store] + [ocr.store for ocr in ocr_instances()]
+    return {os.path.splitext(os.path.basename(store.path))[0]: store for store in stores}
+
+
+REGISTRY.register_collector(lambda: disk_cache_metrics(_disk_caches()))
+REGISTRY.register_collector(lambda: disk_size_metrics(_disk_caches()))
+
+
+def llm_intent(query):
+    """Asks the router LLM to label `query` as CHAT or QUERY (one remote round trip)."""
+    router_prompt = ChatPromptTemplate.from_template(
+        "Classify the following user input: '{question}'.\n"
+        "If the user is asking for ANY real-world facts, current events, knowledge, programming help, or specific information, reply ONLY with 'QUERY'.\n"
+        "If the user is ONLY making small talk, greeting you, or saying thanks, reply ONLY with 'CHAT'."
+    )
+    intent = (router_prompt | get_router_llm() | StrOutputParser()).invoke({"question": query}).strip().upper()
+    return CHAT if CHAT in intent else QUERY
+
+
+INTENT_ROUTER = IntentRouter(
+    get_embeddings,
+    min_margin=getattr(settings, "INTENT_ROUTER_MIN_MARGIN", 0.04),
+    llm_fallback=llm_intent if getattr(settings, "INTENT_ROUTER_LLM_FALLBACK", True) else None,
+    cache=INTENT_CACHE,
+)
+
 
 def get_db_path(session_id):
     """Returns the absolute path to the session's FAISS index directory."""
@@ -58,30 +255,240 @@ def get_db_path(session_id):
     return str(BASE_DIR / "faiss_indexes" / f"session_{session_id}")
 
 
+def _session_lock(session_id):
+    """Per-session lock serializing index writers within this process."""
+    with _session_locks_guard:
+        return _session_locks.setdefault(str(session_id), threading.Lock())
+
+
+def load_session_index(session_id):
+    """Returns the session's `SessionIndex`, served from the in-process cache while it is fresh."""
+    db_path = get_db_path(session_id)
+    if not db_path:
+        return None
+
+    signature = index_signature(db_path)
+    if signature is None:
+        SESSION_INDEX_CACHE.invalidate(session_id)
+        return None
+
+    index = SESSION_INDEX_CACHE.get(session_id, signature)
+    if index is None:
+        embeddings = get_embeddings()
+        if embeddings is None:
+            return None
+        index = load_segments(db_path, embeddings, mmap=FAISS_MMAP)
+        if index is not None:
+            SESSION_INDEX_CACHE.put(session_id, index, signature)
+    return index
+
+
+def _schedule_compaction(session_id):
+    """Merges a session's delta segments into a new base segment in the background,
+    rebuilding it as the index type suited to its size."""
+    key = str(session_id)
+    with _session_locks_guard:
+        if key in _compactions_pending:
+            return
+        _compactions_pending.add(key)
+
+    def run():
+        try:
+            merged, signature = compact(
+                get_db_path(session_id), get_embeddings(),
+                rebuild=lambda index: fit_index(index, **FAISS_INDEX_OPTIONS),
+            )
+            if merged is not None:
+                if FAISS_MMAP:
+                    # Drop the in-heap merge; the next reader maps the new base segment.
+                    SESSION_INDEX_CACHE.invalidate(session_id)
+                else:
+                    SESSION_INDEX_CACHE.put(session_id, merged, signature)
+                print(f"[RAG] Session {session_id}: compacted index segments ({merged.store.index.ntotal} vectors)")
+        except Exception as e:
+            print(f"[WARN] Index compaction failed for session {session_id}: {e}")
+        finally:
+            with _session_locks_guard:
+                _compactions_pending.discard(key)
+
+    _compaction_executor.submit(run)
+
+
+def iter_pdf_documents(file_path):
+    """Yields one Document per PDF page as pages finish; scanned pages are OCRed."""
+    pages = iter_pdf_pages(
+        file_path, OCR_OPTIONS,
+        workers=getattr(settings, "PDF_WORKERS", 0),
+        pages_per_task=getattr(settings, "PDF_PAGES_PER_TASK", 4),
+    )
+    for number, text, ocr, total in pages:
+        if text.strip():
+            yield Document(page_content=text, metadata={
+                "source": file_path, "file_path": file_path, "page": number, "total_pages": total, "ocr": ocr,
+            })
+
+
+def _source_kind(source):
+    """Short label for a source's type, used to name its load stage: 'pdf', 'url', ..."""
+    if source.startswith(("http://", "https://")):
+        return "url"
+    return os.path.splitext(source)[1].lower().lstrip(".") or "file"
+
+
+def _iter_documents(source):
+    """Yields a source's Documents; PDFs and spreadsheets are streamed rather than loaded whole."""
+    kind = _source_kind(source)
+    if kind == "url":
+        return iter_url_documents(source)
+    if kind == "pdf":
+        return iter_pdf_documents(source)
+    if kind == "csv":
+        return iter_csv_documents(source)
+    if kind in ("xlsx", "xls"):
+        return iter_xlsx_documents(source)
+    return iter(load_single_file(source))
+
+
+def _iter_chunks(file_paths, splitter, timings, indexed=(), unchanged=None):
+    """Loads and splits all sources concurrently, yielding `(source, chunks)` as they are produced.
+
+    Each source ends with a `(source, None)` marker. Loader threads block once
+    INGESTION_QUEUE_SIZE groups are waiting, so a large file is never held in memory
+    ahead of embedding. Load and split time is summed per source type across threads.
+
+    URLs are fetched together with `URL_FETCHER.fetch_many` (pooled, at most
+    URL_FETCH_PER_HOST at a time per host) and each body is loaded as it arrives. A URL
+    in `indexed` that answers 304 Not Modified is not split again; it is added to
+    `unchanged` instead.
+    """
+    pending = queue.Queue(maxsize=getattr(settings, "INGESTION_QUEUE_SIZE", 64))
+    stop = threading.Event()
+    sources = list(dict.fromkeys(file_paths))
+    urls = {source for source in sources if _source_kind(source) == "url"}
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def produce(source, load):
+        load_stage = f"load_{_source_kind(source)}"
+        try:
+            # Creating the iterator is part of the load: non-streaming loaders read the whole file here.
+            with timings.span(load_stage):
+                documents = load()
+            while not stop.is_set():
+                with timings.span(load_stage):
+                    doc = next(documents, None)
+                if doc is None:
+                    return
+                with timings.span("split"):
+                    chunks = splitter.split_documents([doc])
+                if chunks:
+                    put((source, chunks))
+        except Exception as e:
+            print(f"[WARN] Load error ({source}): {e}")
+        finally:
+            put((source, None))
+
+    def fetch_urls(executor):
+        waiting = set(urls)
+        results = URL_FETCHER.fetch_many(sorted(urls))
+        try:
+            while not stop.is_set():
+                with timings.span("fetch_url"):
+                    result = next(results, None)
+                if result is None:
+                    return
+                waiting.discard(result.url)
+                if result.not_modified and result.url in indexed and unchanged is not None:
+                    print(f"[RAG] {result.url} unchanged since it was indexed, skipping")
+                    unchanged.add(result.url)
+                    put((result.url, None))
+                else:
+                    executor.submit(produce, result.url, lambda result=result: iter_fetched_documents(result))
+        except Exception as e:
+            print(f"[WARN] URL fetch error: {e}")
+        finally:
+            results.close()
+            for url in waiting:
+                put((url, None))
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        if urls:
+            executor.submit(fetch_urls, executor)
+        for source in sources:
+            if source not in urls:
+                executor.submit(produce, source, lambda source=source: _iter_documents(source))
+        try:
+            remaining = len(sources)
+            while remaining:
+                source, chunks = pending.get()
+                remaining -= chunks is None
+                yield source, chunks
+        finally:
+            stop.set()
+
+
+def iter_url_documents(url):
+    """Fetches a URL and yields its Documents, by the type sniffed from the response body."""
+    return iter_fetched_documents(URL_FETCHER.fetch(url))
+
+
+def iter_fetched_documents(result):
+    """Yields the Documents of a `FetchResult`."""
+    url = result.url
+    if result.error:
+        print(f"[WARN] URL fetch failed ({url}): {result.error}")
+        return
+    if result.not_modified:
+        print(f"[RAG] {url} not modified, reusing the stored copy")
+
+    if result.kind == "html":
+        text, title, language = html_to_text(decode_body(result.body, result.content_type))
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": url, "title": title, "language": language})
+    elif result.kind == "text":
+        text = decode_body(result.body, result.content_type)
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": url})
+    elif result.kind == "image":
+        text = get_ocr(OCR_OPTIONS).image_bytes_to_string(result.body)
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": url, "type": "image_url"})
+    elif result.kind:
+        # Binary formats go through the file loaders, from a temporary copy.
+        with tempfile.NamedTemporaryFile(suffix=f".{result.kind}", delete=False) as fh:
+            fh.write(result.body)
+        try:
+            for doc in _iter_documents(fh.name):
+                doc.metadata.update({"source": url, "file_path": url})
+                yield doc
+        finally:
+            os.remove(fh.name)
+    else:
+        print(f"[WARN] Unsupported content at {url} ({result.content_type or 'unknown type'})")
+
+
 def load_single_file(file_path):
     """Loads and extracts text from a URL or local file of any supported type."""
     try:
         if file_path.startswith("http://") or file_path.startswith("https://"):
-            if any(file_path.lower().endswith(ext) for ext in ['.png', '.jpg', '.jpeg', '.webp']):
-                try:
-                    response = requests.get(file_path, headers=HEADERS, timeout=10)
-                    text = pytesseract.image_to_string(Image.open(BytesIO(response.content)))
-                    if text.strip():
-                        return [Document(page_content=text, metadata={"source": file_path, "type": "image_url"})]
-                    return []
-                except Exception:
-                    return []
-
             try:
-                return WebBaseLoader(file_path, header_template=HEADERS).load()
-            except Exception:
+                return list(iter_url_documents(file_path))
+            except Exception as e:
+                print(f"[WARN] URL load error ({file_path}): {e}")
                 return []
 
         ext = os.path.splitext(file_path)[1].lower()
 
         if ext in ['.png', '.jpg', '.jpeg']:
             try:
-                text = pytesseract.image_to_string(Image.open(file_path))
+                with open(file_path, "rb") as fh:
+                    text = get_ocr(OCR_OPTIONS).image_bytes_to_string(fh.read())
                 if text.strip():
                     return [Document(page_content=text, metadata={"source": file_path})]
                 return []
@@ -90,7 +497,7 @@ def load_single_file(file_path):
 
         if ext == ".pdf":
             try:
-                return PyMuPDFLoader(file_path).load()
+                return list(iter_pdf_documents(file_path))
             except Exception as e:
                 print(f"[WARN] PDF load error ({file_path}): {e}")
                 return []
@@ -120,13 +527,10 @@ def load_single_file(file_path):
 
         elif ext == ".csv":
             try:
-                return CSVLoader(file_path, encoding='utf-8').load()
-            except Exception:
-                try:
-                    return CSVLoader(file_path, encoding='latin-1').load()
-                except Exception as e:
-                    print(f"[WARN] CSV load error ({file_path}): {e}")
-                    return []
+                return list(iter_csv_documents(file_path))
+            except Exception as e:
+                print(f"[WARN] CSV load error ({file_path}): {e}")
+                return []
 
         elif ext == ".pptx":
             try:
@@ -151,19 +555,7 @@ def load_single_file(file_path):
 
         elif ext in [".xlsx", ".xls"]:
             try:
-                import openpyxl
-                wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-                all_rows = []
-                for ws in wb.worksheets:
-                    all_rows.append(f"--- Sheet: {ws.title} ---")
-                    for row in ws.iter_rows(values_only=True):
-                        cleaned = [str(cell) for cell in row if cell is not None]
-                        if cleaned:
-                            all_rows.append(" | ".join(cleaned))
-                full_text = "\n".join(all_rows)
-                if full_text.strip():
-                    return [Document(page_content=full_text, metadata={"source": file_path, "type": "xlsx"})]
-                return []
+                return list(iter_xlsx_documents(file_path))
             except Exception as e:
                 print(f"[WARN] XLSX load error ({file_path}): {e}")
                 return []
@@ -179,72 +571,238 @@ def load_single_file(file_path):
         return []
 
 
-def process_files_bulk(file_paths, session_id):
-    """Ingests a list of file paths and/or URLs into the session's FAISS index."""
-    if not session_id or not GLOBAL_EMBEDDINGS or not file_paths:
-        return False
+def process_files_bulk(file_paths, session_id, progress_callback=None, timings=None):
+    """Ingests a list of file paths and/or URLs into the session's FAISS index.
 
-    db_path = get_db_path(session_id)
-    all_documents = []
+    If given, `progress_callback(source, status)` is called as each source is loaded
+    and again once the index write has succeeded or failed. Stage durations are
+    recorded on `timings`.
+    """
+    timings = timings if timings is not None else Timings("ingest")
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for res in executor.map(load_single_file, file_paths):
-            if res:
-                all_documents.extend(res)
+    def report(sources, status):
+        if progress_callback:
+            for source in sources:
+                progress_callback(source, status)
 
-    if not all_documents:
+    embeddings = get_embeddings() if session_id and file_paths else None
+    if embeddings is None:
+        report(file_paths or [], "Index Failed")
         return False
 
-    docs = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_documents(all_documents)
-    if not docs:
-        return False
+    db_path = get_db_path(session_id)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    embedder = BatchEmbedder(
+        embeddings,
+        batch_size=getattr(settings, "EMBEDDING_BATCH_SIZE", 64),
+        workers=getattr(settings, "EMBEDDING_WORKERS", 0),
+    )
+    # Chunks are embedded in windows as they stream in, sized to keep every
+    # embedding worker busy without buffering whole files. Every
+    # INGESTION_SEGMENT_CHUNKS chunks the delta is written out as a segment, so memory
+    # stays bounded however large the upload is.
+    window_size = embedder.batch_size * max(1, embedder.workers) * 4
+    segment_chunks = max(window_size, getattr(settings, "INGESTION_SEGMENT_CHUNKS", 20000))
+    chunk_counts = {}
+    delta_store = None
+    unchanged = set()
+    ended = set()
+    written = []
+
+    def embed_window(docs):
+        nonlocal delta_store
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        # Batches are added to the delta as they finish, in whatever order they complete.
+        for start, vectors in embedder.iter_batches(texts):
+            end = start + len(vectors)
+            text_embeddings = list(zip(texts[start:end], vectors))
+            if delta_store is None:
+                delta_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas[start:end])
+            else:
+                delta_store.add_embeddings(text_embeddings, metadatas=metadatas[start:end])
+
+    def flush():
+        """Appends the delta as a segment; sources all of whose chunks are now written are recorded as indexed."""
+        nonlocal delta_store
+        store, delta_store = delta_store, None
+        sources = [source for source in file_paths if source in ended and source not in written]
+        # A single very large upload goes straight to an approximate index.
+        with timings.span("fit_index"):
+            store.index = fit_index(store.index, **FAISS_INDEX_OPTIONS)
+
+        # Only the new chunks are embedded and written, as a delta segment appended to
+        # the session index; existing segments are never loaded or rewritten here.
+        with _session_lock(session_id), timings.span("write"):
+            # The keyword index is built from the same chunks and saved in the segment.
+            delta = SessionIndex(store, BM25Index.from_store(store))
+            before, after, manifest = append_segment(db_path, delta, sources=sources)
+
+            # Cached indexes are searched by readers without locks, so they are never
+            # extended in place (and copying one to extend would cost O(session size)).
+            # A new session caches its delta; otherwise the next read loads the segments.
+            cached = SESSION_INDEX_CACHE.peek(session_id, before) if before else None
+            if len(manifest["segments"]) == 1:
+                SESSION_INDEX_CACHE.put(session_id, delta, after)
+            else:
+                SESSION_INDEX_CACHE.invalidate(session_id)
+        written.extend(sources)
+
+        # Compact when deltas pile up, or early when the session has outgrown its index type.
+        if len(manifest["segments"]) - 1 > getattr(settings, "FAISS_MAX_DELTA_SEGMENTS", 8) or (
+            cached is not None and not fits(
+                cached.store.index, count=cached.store.index.ntotal + delta.store.index.ntotal, **FAISS_INDEX_OPTIONS
+            )
+        ):
+            _schedule_compaction(session_id)
 
     try:
-        if os.path.exists(db_path):
-            try:
-                vector_store = FAISS.load_local(db_path, GLOBAL_EMBEDDINGS, allow_dangerous_deserialization=True)
-                vector_store.add_documents(docs)
-                vector_store.save_local(db_path)
-            except Exception as e:
-                print(f"[WARN] FAISS merge failed, rebuilding index: {e}")
-                FAISS.from_documents(docs, GLOBAL_EMBEDDINGS).save_local(db_path)
+        window = []
+        for source, chunks in _iter_chunks(file_paths, splitter, timings, indexed_sources(db_path), unchanged):
+            if chunks is None:
+                ended.add(source)
+                if source in unchanged:
+                    report([source], "Indexed")
+                elif not chunk_counts.get(source):
+                    report([source], "Index Failed")
+                continue
+            if not chunk_counts.get(source):
+                report([source], "Embedding")
+            chunk_counts[source] = chunk_counts.get(source, 0) + len(chunks)
+            window.extend(chunks)
+            if len(window) >= window_size:
+                with timings.span("embed"):
+                    embed_window(window)
+                window = []
+                if delta_store.index.ntotal >= segment_chunks:
+                    flush()
+        if window:
+            with timings.span("embed"):
+                embed_window(window)
+        if delta_store is not None:
+            flush()
         else:
-            FAISS.from_documents(docs, GLOBAL_EMBEDDINGS).save_local(db_path)
-        return True
+            # The last flush came before the end of some sources; their chunks are all written.
+            pending = [source for source in file_paths if chunk_counts.get(source) and source not in written]
+            if pending:
+                add_sources(db_path, pending)
+                written.extend(pending)
     except Exception as e:
-        print(f"[ERROR] FAISS indexing failed: {e}")
+        SESSION_INDEX_CACHE.invalidate(session_id)
+        print(f"[ERROR] Indexing failed: {e}")
+        # Sources already written in full stay indexed.
+        report(written, "Indexed")
+        report([source for source in file_paths if chunk_counts.get(source) and source not in written], "Index Failed")
         return False
 
+    if not written:
+        # Nothing new to index; fine if every loaded source was already indexed and unchanged.
+        return bool(unchanged)
+    print(
+        f"[RAG] Session {session_id}: embedded {embedder.embedded} chunks in {embedder.elapsed:.2f}s "
+        f"({embedder.chunks_per_second:.1f} chunks/s, {embedder.cached} from cache)"
+    )
+    timings.mark("total")
+    print(f"[RAG] Session {session_id}: ingestion stages: {timings.summary()}")
+    report(written, "Indexed")
+    return True
+
+
+def perform_web_search(query, timings=None):
+    timings = timings if timings is not None else Timings("chat")
+    with timings.span("web_search"):
+        try:
+            return WEB_SEARCH.run(query)
+        except Exception as e:
+            return f"Web search failed: {e}"
+
+
+def _history_lines(recent_history):
+    return [f"{'User' if msg.is_user else 'AI'}: {msg.text}" for msg in reversed(recent_history)]
+
+
+def _fetch_history(session_id, timings):
+    """The last six messages of the session as lines, oldest first; runs on a stage thread."""
+    try:
+        with timings.span("history"):
+            return _history_lines(ChatMessage.objects.filter(session_id=session_id).order_by('-timestamp')[:6])
+    finally:
+        # Stage threads are pooled, so don't leave a connection open on them.
+        connection.close()
+
+
+def _retrieve_context(query, session_id, query_vector, timings=None):
+    """Embeds the query, publishes the vector on `query_vector` and runs a hybrid
+    (vector + BM25) search of the session index.
 
-def perform_web_search(query):
+    Returns `(candidates, source_type)`: the best CONTEXT_CANDIDATES chunks for the
+    packer, or a web search result when the index has nothing or fails.
+    """
+    timings = timings if timings is not None else Timings("chat")
     try:
-        return DuckDuckGoSearchResults(num_results=4).run(query)
+        with timings.span("embed_query"):
+            embeddings = get_embeddings()
+            vector = embeddings.embed_query(query) if embeddings else None
     except Exception as e:
-        return f"Web search failed: {e}"
+        print(f"[WARN] Query embedding failed for session {session_id}: {e}")
+        vector = None
+    query_vector.set_result(vector)
 
+    try:
+        with timings.span("index_load"):
+            index = load_session_index(session_id)
+        with timings.span("search"):
+            results, search_timings = hybrid_search(
+                index, query, vector, k=CONTEXT_CANDIDATES,
+                candidates=getattr(settings, "HYBRID_CANDIDATES", 20),
+                rrf_k=getattr(settings, "HYBRID_RRF_K", 60),
+            ) if index else ([], {})
+        if results:
+            print(
+                f"[RAG] Session {session_id}: {len(results)} chunks retrieved. Top score: {results[0][1]:.4f} "
+                f"(vector {search_timings['vector_ms']:.1f}ms, keyword {search_timings['keyword_ms']:.1f}ms, "
+                f"fusion {search_timings['fusion_ms']:.1f}ms)"
+            )
+            with timings.span("chunk_vectors"):
+                vectors = _chunk_vectors(index, [doc_id for _, _, doc_id in results])
+            return [
+                Candidate(d.page_content, chunk_vector, d.metadata.get("source"))
+                for (d, _, _), chunk_vector in zip(results, vectors)
+            ], "Uploaded Document"
+    except Exception as e:
+        print(f"[WARN] Retrieval error for session {session_id}: {e}")
+    return _web_context(query, timings)
+
+
+def _chunk_vectors(index, doc_ids):
+    """The retrieved chunks' vectors, read back from the session index for the packer's similarity checks."""
+    try:
+        return list(index.vectors(doc_ids))
+    except Exception as e:
+        print(f"[WARN] Chunk vectors unavailable, packing by rank only: {e}")
+        return [None] * len(doc_ids)
+
+
+def _web_context(query, timings):
+    return [Candidate(perform_web_search(query, timings), None, "web")], "Web Search"
 
-def get_answer(query, session_id):
-    db_path = get_db_path(session_id)
-    current_date = datetime.now().strftime("%Y-%m-%d")
 
-    recent_history = ChatMessage.objects.filter(session_id=session_id).order_by('-timestamp')[:6]
-    history_text = "\n".join(
-        [f"{'User' if msg.is_user else 'AI'}: {msg.text}" for msg in reversed(recent_history)]
+def _pack_prompt(history_lines, candidates, timings):
+    """Fits history and context into the prompt token budget and reports the savings."""
+    with timings.span("pack"):
+        packed = CONTEXT_PACKER.pack(history_lines, candidates)
+    stats = packed.stats
+    for name, value in stats.items():
+        timings.note(name, value)
+    print(
+        f"[RAG] Prompt context: {stats['prompt_tokens']} tokens, {stats['tokens_saved']} saved "
+        f"({stats['chunks']} chunks, {stats['duplicates']} duplicates dropped, "
+        f"{stats['trimmed_tokens']} tokens trimmed, {stats['history_messages_dropped']} history messages dropped)"
     )
+    return packed
 
-    try:
-        router_prompt = ChatPromptTemplate.from_template(
-            "Classify the following user input: '{question}'.\n"
-            "If the user is asking for ANY real-world facts, current events, knowledge, programming help, or specific information, reply ONLY with 'QUERY'.\n"
-            "If the user is ONLY making small talk, greeting you, or saying thanks, reply ONLY with 'CHAT'."
-        )
-        intent = (router_prompt | ROUTER_LLM | StrOutputParser()).invoke({"question": query}).strip().upper()
-    except Exception:
-        intent = "QUERY"
 
-    if "CHAT" in intent:
-        prompt = ChatPromptTemplate.from_template(
-            """You are a highly capable, precise, and professional AI assistant.
+CHAT_TEMPLATE = """You are a highly capable, precise, and professional AI assistant.
             Current Date: {date}
 
             Conversation History:
@@ -253,32 +811,8 @@ def get_answer(query, session_id):
             User: {question}
 
             Reply naturally, concisely, and use clean markdown formatting. Do not use filler language."""
-        )
-        for chunk in (prompt | CHAT_LLM | StrOutputParser()).stream({"date": current_date, "history": history_text, "question": query}):
-            yield chunk
-        return
 
-    has_index = db_path and os.path.exists(db_path) and GLOBAL_EMBEDDINGS
-    if has_index:
-        try:
-            vector_store = FAISS.load_local(db_path, GLOBAL_EMBEDDINGS, allow_dangerous_deserialization=True)
-            results = vector_store.similarity_search_with_score(query, k=5)
-            if results:
-                context_text = "\n\n".join([d.page_content for d, _ in results])
-                source_type = "Uploaded Document"
-                print(f"[RAG] Session {session_id}: {len(results)} chunks retrieved. Top score: {results[0][1]:.4f}")
-            else:
-                context_text = perform_web_search(query)
-                source_type = "Web Search"
-        except Exception as e:
-            print(f"[WARN] Retrieval error for session {session_id}: {e}")
-            context_text = perform_web_search(query)
-            source_type = "Web Search"
-    else:
-        context_text = perform_web_search(query)
-        source_type = "Web Search"
-
-    system_prompt = """You are an expert, precision-focused AI assistant.
+ANSWER_TEMPLATE = """You are an expert, precision-focused AI assistant.
     Current Date: {date}. Always use this date context to ensure your answers are up-to-date and relevant.
 
     Conversation History:
@@ -295,33 +829,192 @@ def get_answer(query, session_id):
     3. Knowledge Strategy: Base your answers STRICTLY on the provided Context. If the context does not contain the answer, use your General Knowledge only if you are absolutely certain. If uncertain, state: "I don't know. Please upload relevant documents for this topic."
     4. Sources: At the very end of your response, cite sources as inline Markdown links: `[Source 1](URL1) [Source 2](URL2)`. Do not use a bulleted list."""
 
-    for chunk in (ChatPromptTemplate.from_template(system_prompt) | CHAT_LLM | StrOutputParser()).stream({
+
+def _answer_chain(template):
+    return ChatPromptTemplate.from_template(template) | get_chat_llm() | StrOutputParser()
+
+
+def _stream_answer(template, inputs, timings):
+    """Streams the LLM answer, recording time to first token and generation time."""
+    started = time.perf_counter()
+    first = True
+    for chunk in _answer_chain(template).stream(inputs):
+        if first:
+            timings.mark("first_token")
+            first = False
+        yield chunk
+    timings.add("llm", time.perf_counter() - started)
+    timings.mark("total")
+
+
+async def _astream_answer(template, inputs, timings):
+    started = time.perf_counter()
+    first = True
+    async for chunk in _answer_chain(template).astream(inputs):
+        if first:
+            timings.mark("first_token")
+            first = False
+        yield chunk
+    timings.add("llm", time.perf_counter() - started)
+    timings.mark("total")
+
+
+def get_answer(query, session_id, timings=None):
+    """Streams the answer to `query`; stage durations are recorded on `timings`."""
+    timings = timings if timings is not None else Timings("chat")
+    db_path = get_db_path(session_id)
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    has_index = db_path and os.path.exists(db_path)
+
+    # History, retrieval (or a speculative web search) run on stage threads while the
+    # intent is classified here; retrieval work is simply discarded for CHAT turns.
+    # Stage tasks never wait on each other, so a busy pool cannot deadlock.
+    history_future = _STAGE_EXECUTOR.submit(_fetch_history, session_id, timings)
+    query_vector = concurrent.futures.Future()
+    if has_index:
+        context_future = _STAGE_EXECUTOR.submit(_retrieve_context, query, session_id, query_vector, timings)
+    elif getattr(settings, "SPECULATIVE_WEB_SEARCH", False):
+        context_future = _STAGE_EXECUTOR.submit(_web_context, query, timings)
+    else:
+        context_future = None
+
+    try:
+        with timings.span("route"):
+            decision = INTENT_ROUTER.classify(query, query_vector=query_vector.result if has_index else None)
+        intent = decision.label
+        print(f"[RAG] Intent {intent} via {decision.method} in {decision.elapsed_ms:.1f}ms")
+    except Exception as e:
+        print(f"[WARN] Intent routing failed: {e}")
+        intent = QUERY
+
+    history_lines = history_future.result()
+
+    if intent == CHAT:
+        if context_future:
+            context_future.cancel()
+        packed = _pack_prompt(history_lines, [], timings)
+        yield from _stream_answer(
+            CHAT_TEMPLATE, {"date": current_date, "history": packed.history, "question": query}, timings
+        )
+        return
+
+    if context_future:
+        candidates, source_type = context_future.result()
+    else:
+        candidates, source_type = _web_context(query, timings)
+    packed = _pack_prompt(history_lines, candidates, timings)
+
+    yield from _stream_answer(ANSWER_TEMPLATE, {
+        "date": current_date,
+        "source": source_type,
+        "history": packed.history,
+        "context": packed.context,
+        "question": query
+    }, timings)
+
+
+async def _afetch_history(session_id, timings):
+    with timings.span("history"):
+        recent_history = [
+            msg async for msg in ChatMessage.objects.filter(session_id=session_id).order_by('-timestamp')[:6]
+        ]
+    return _history_lines(recent_history)
+
+
+async def _aclassify(query, query_vector):
+    """Classifies on a stage thread; the query vector is awaited here rather than blocked on there."""
+    loop = asyncio.get_running_loop()
+    vector = None
+    if query_vector is not None and keyword_intent(query) is None:
+        decision = await loop.run_in_executor(_STAGE_EXECUTOR, INTENT_ROUTER.cached, query)
+        if decision is not None:
+            return decision
+        vector = await asyncio.wrap_future(query_vector)
+    return await loop.run_in_executor(_STAGE_EXECUTOR, lambda: INTENT_ROUTER.classify(query, query_vector=vector))
+
+
+async def aget_answer(query, session_id, timings=None):
+    """Async counterpart of `get_answer` for the ASGI chat view.
+
+    The LLM is streamed with `astream` and history is read with the async ORM, so a
+    waiting chat holds no thread; embedding, FAISS search and web search still run on
+    the stage thread pool.
+    """
+    timings = timings if timings is not None else Timings("chat")
+    loop = asyncio.get_running_loop()
+    db_path = get_db_path(session_id)
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    has_index = db_path and os.path.exists(db_path)
+
+    history_task = asyncio.ensure_future(_afetch_history(session_id, timings))
+    query_vector = concurrent.futures.Future()
+    if has_index:
+        context_future = loop.run_in_executor(
+            _STAGE_EXECUTOR, _retrieve_context, query, session_id, query_vector, timings
+        )
+    elif getattr(settings, "SPECULATIVE_WEB_SEARCH", False):
+        context_future = loop.run_in_executor(_STAGE_EXECUTOR, _web_context, query, timings)
+    else:
+        context_future = None
+
+    try:
+        with timings.span("route"):
+            decision = await _aclassify(query, query_vector if has_index else None)
+        intent = decision.label
+        print(f"[RAG] Intent {intent} via {decision.method} in {decision.elapsed_ms:.1f}ms")
+    except Exception as e:
+        print(f"[WARN] Intent routing failed: {e}")
+        intent = QUERY
+
+    history_lines = await history_task
+
+    if intent == CHAT:
+        if context_future:
+            context_future.cancel()
+        packed = _pack_prompt(history_lines, [], timings)
+        async for chunk in _astream_answer(
+            CHAT_TEMPLATE, {"date": current_date, "history": packed.history, "question": query}, timings
+        ):
+            yield chunk
+        return
+
+    if context_future:
+        candidates, source_type = await context_future
+    else:
+        candidates, source_type = await loop.run_in_executor(_STAGE_EXECUTOR, _web_context, query, timings)
+    # Packing is a few small matrix products over ~10 chunks, cheap enough for the event loop.
+    packed = _pack_prompt(history_lines, candidates, timings)
+
+    async for chunk in _astream_answer(ANSWER_TEMPLATE, {
         "date": current_date,
         "source": source_type,
-        "history": history_text,
-        "context": context_text,
+        "history": packed.history,
+        "context": packed.context,
         "question": query
-    }):
+    }, timings):
         yield chunk
 
 
 def clear_data(session_id):
     db_path = get_db_path(session_id)
     if db_path and os.path.exists(db_path):
-        try:
-            shutil.rmtree(db_path)
-        except Exception:
-            pass
+        # Waits for in-process writers, then (via the directory lock) for other processes'.
+        with _session_lock(session_id):
+            try:
+                delete_index(db_path)
+            except Exception as e:
+                print(f"[WARN] Could not delete index for session {session_id}: {e}")
+    SESSION_INDEX_CACHE.invalidate(session_id)
 
 
 def generate_chat_title(user_message, bot_response):
+    """Asks the LLM for a 2-4 word chat title; runs in the background after the answer."""
     try:
-        llm = ChatGroq(temperature=0.3, model_name="llama-3.1-8b-instant")
         prompt = (
             "Determine the core topic of this conversation and create a concise 2-4 word title for it. "
             "Return ONLY the title with no quotes or extra text.\n"
             f"User: {user_message}\nAI: {bot_response}"
         )
-        return llm.invoke(prompt).content.strip().replace('"', '')[:50]
+        return get_title_llm().invoke(prompt).content.strip().replace('"', '')[:50]
     except Exception:
-        return user_message[:30]
\ No newline at end of file
+        return heuristic_title(user_message)
\ No newline at end of file
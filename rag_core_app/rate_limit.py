@@ -0,0 +1,124 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import REGISTRY
+
+# Rejected hits are not recorded, so a client retrying in a loop doesn't extend its own ban.
+# Expired rows of other keys are swept every this many hits.
+_PURGE_EVERY = 1000
+
+
+class SlidingWindowLimiter:
+    """Per-key sliding-window rate limiter stored in SQLite.
+
+    Each allowed hit is logged with its timestamp; a key may have at most `limit` hits
+    in any `period` seconds. The check and the insert run in one `BEGIN IMMEDIATE`
+    transaction, so concurrent threads and worker processes sharing the file can't
+    both take the last slot.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.allowed = {}
+        self.limited = {}
+        self._calls = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS hits (key TEXT NOT NULL, ts REAL NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS hits_key_ts ON hits (key, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS hits_expires ON hits (expires)")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, limit, period, now=None):
+        """Records a hit for `key` if it is under the limit.
+
+        Returns 0.0 when the hit is allowed, otherwise the seconds until the oldest hit
+        in the window expires and the key may try again.
+        """
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM hits WHERE key = ? AND ts <= ?", (key, now - period))
+            count, oldest = conn.execute("SELECT COUNT(*), MIN(ts) FROM hits WHERE key = ?", (key,)).fetchone()
+            if count >= limit:
+                retry_after = oldest + period - now if oldest is not None else period
+            else:
+                conn.execute("INSERT INTO hits (key, ts, expires) VALUES (?, ?, ?)", (key, now, now + period))
+                retry_after = 0.0
+            with self._stats_lock:
+                self._calls += 1
+                purge = self._calls % _PURGE_EVERY == 0
+            if purge:
+                conn.execute("DELETE FROM hits WHERE expires <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        scope = key.split(":", 1)[0]
+        with self._stats_lock:
+            counter = self.limited if retry_after else self.allowed
+            counter[scope] = counter.get(scope, 0) + 1
+        return retry_after
+
+    def reset(self, key):
+        self._conn().execute("DELETE FROM hits WHERE key = ?", (key,))
+
+    def stats(self):
+        with self._stats_lock:
+            return {"allowed": dict(self.allowed), "limited": dict(self.limited)}
+
+
+# Per-endpoint limits: scope -> (requests, period in seconds).
+RATE_LIMITS = {
+    "chat": (getattr(settings, "CHAT_RATE_LIMIT", 15), getattr(settings, "CHAT_RATE_LIMIT_PERIOD", 60)),
+    "upload": (getattr(settings, "UPLOAD_RATE_LIMIT", 10), getattr(settings, "UPLOAD_RATE_LIMIT_PERIOD", 60)),
+}
+
+LIMITER = SlidingWindowLimiter(
+    getattr(settings, "RATE_LIMIT_DB", os.path.join(getattr(settings, "RAG_CACHE_DIR", "cache"), "ratelimit.sqlite3"))
+)
+
+
+def check(scope, user):
+    """Counts a request by `user` against `scope`'s limit.
+
+    Returns the whole seconds to wait before retrying, or 0 when the request may proceed.
+    Anonymous users are not limited here (the views require login), and if the limiter's
+    database is unavailable requests are let through rather than failing the endpoint.
+    """
+    if not user.is_authenticated:
+        return 0
+    limit, period = RATE_LIMITS[scope]
+    if limit <= 0:
+        return 0
+    try:
+        retry_after = LIMITER.hit(f"{scope}:{user.id}", limit, period)
+    except sqlite3.Error as e:
+        print(f"[WARN] Rate limiter unavailable, allowing request: {e}")
+        return 0
+    return max(1, math.ceil(retry_after)) if retry_after else 0
+
+
+def _collect():
+    stats = LIMITER.stats()
+    samples = [({"scope": scope, "outcome": "allowed"}, n) for scope, n in sorted(stats["allowed"].items())]
+    samples += [({"scope": scope, "outcome": "limited"}, n) for scope, n in sorted(stats["limited"].items())]
+    return ("rag_rate_limit_requests_total", "counter", "Rate-limited endpoint requests by outcome.", samples)
+
+
+REGISTRY.register_collector(_collect)
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+
+from .chunk_store import get_document
+
+
+def vector_search(store, vector, k):
+    """Returns up to `k` `(doc_id, distance)` pairs from a FAISS store, nearest first."""
+    if not store.index.ntotal:
+        return []
+    query = np.asarray([vector], dtype=np.float32)
+    if store._normalize_L2:
+        import faiss
+        faiss.normalize_L2(query)
+    distances, positions = store.index.search(query, min(k, store.index.ntotal))
+    return [
+        (store.index_to_docstore_id[position], float(distance))
+        for position, distance in zip(positions[0], distances[0])
+        if position != -1
+    ]
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """Fuses ranked lists of ids by summing 1 / (k + rank); returns `(id, score)` best first."""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(index, query, vector, k=5, candidates=20, rrf_k=60):
+    """Retrieves the top `k` chunks of a `SessionIndex` by fusing vector and BM25 rankings.
+
+    Each retriever contributes its best `candidates` ids; ids whose chunk is missing from
+    the docstore are skipped. Returns `(results, timings)` where results are
+    `(Document, fused_score, doc_id)` and timings are milliseconds per stage.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    vector_hits = vector_search(index.store, vector, candidates) if vector is not None else []
+    timings["vector_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    keyword_hits = index.keywords.search(query, candidates)
+    timings["keyword_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    fused = reciprocal_rank_fusion(
+        [[doc_id for doc_id, _ in vector_hits], [doc_id for doc_id, _ in keyword_hits]], k=rrf_k
+    )
+    results = []
+    for doc_id, score in fused:
+        try:
+            results.append((get_document(index.store.docstore, doc_id), score, doc_id))
+        except KeyError:
+            print(f"[WARN] Chunk {doc_id} is indexed but missing from the docstore")
+        if len(results) == k:
+            break
+    timings["fusion_ms"] = (time.perf_counter() - started) * 1000
+    return results, timings
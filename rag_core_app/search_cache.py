@@ -0,0 +1,104 @@
+import re
+import threading
+import time
+import unicodedata
+
+from .cache_layer import SingleFlight
+
+
+def normalize_query(query):
+    """The form of a search query used as its cache key.
+
+    Case, Unicode compatibility forms, runs of whitespace and trailing punctuation
+    don't change what a search engine returns, so "What is RAG?" and "what is  rag"
+    share one entry. Word order and inner punctuation ("c++", "node.js") are kept.
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = " ".join(text.split())
+    return re.sub(r"^[\s\"'“”‘’]+|[\s\"'“”‘’?!.,;:。？！]+$", "", text)
+
+
+class CachedSearch:
+    """Web search behind a normalized-query TTL cache and single-flight coalescing.
+
+    Results are cached in `cache` (a `cache_layer.CacheNamespace`) together with how
+    long the search took, so a hit knows how much latency it saved. Concurrent misses
+    for the same query in this process share one provider call. Failed searches are
+    not cached.
+    """
+
+    def __init__(self, provider_getter, cache):
+        self.provider_getter = provider_getter
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.search_seconds = 0.0
+        self.saved_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def run(self, query):
+        provider = self.provider_getter()
+        # Keyed by provider too, so results of a stand-in search never reach real chats.
+        key = f"{type(provider).__name__}\0{normalize_query(query)}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._stats_lock:
+                self.hits += 1
+                self.saved_seconds += cached["seconds"]
+            return cached["results"]
+
+        def search():
+            started = time.perf_counter()
+            results = provider.run(query)
+            seconds = time.perf_counter() - started
+            self.cache.set(key, {"results": results, "seconds": seconds})
+            return results, seconds
+
+        waited = time.perf_counter()
+        try:
+            (results, seconds), shared = self.flights.do(key, search)
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        waited = time.perf_counter() - waited
+        with self._stats_lock:
+            if shared:
+                self.coalesced += 1
+                self.saved_seconds += max(0.0, seconds - waited)
+            else:
+                self.misses += 1
+                self.search_seconds += seconds
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses + self.coalesced + self.errors
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "search_seconds": self.search_seconds,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def request_metrics(self):
+        stats = self.stats()
+        return (
+            "rag_web_search_requests_total", "counter",
+            "Web searches by outcome: served from cache, searched, coalesced with an in-flight search, or failed.",
+            [({"result": result}, stats[key]) for result, key in
+             (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"), ("error", "errors"))],
+        )
+
+    def saved_metrics(self):
+        return (
+            "rag_web_search_saved_seconds_total", "counter",
+            "Search latency avoided by cache hits and coalesced searches.",
+            [({}, round(self.stats()["saved_seconds"], 6))],
+        )
@@ -0,0 +1,317 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+from .chunk_store import ChunkFile, LazyDocstore, get_document, has_chunks, write_chunks
+from .index_factory import reconstruct, reconstruct_all, shards
+from .keyword_index import BM25Index
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# A session index directory holds a manifest listing its segments in order: one base
+# segment followed by delta segments appended by later uploads. Each segment holds the
+# raw faiss index (`index.faiss`, which can be memory-mapped), its chunks in vector
+# order (see chunk_store; only the chunks of search hits are ever read back) and a
+# `keywords.json` BM25 index over the same chunks. Older segments are FAISS
+# `save_local` directories (`index.faiss` plus a pickled docstore) and are still read,
+# into memory, until compaction rewrites them. Sessions written before segments
+# existed keep their index files at the top level and are read as a single legacy segment.
+# Segments merged by a compaction stay on disk, listed as `retired`, until the next one.
+MANIFEST_NAME = "manifest.json"
+KEYWORDS_NAME = "keywords.json"
+INDEX_NAME = "index.faiss"
+LEGACY_SEGMENT = "."
+# Maps the vector data read-only without copying it to the heap, so every worker
+# process shares one copy in the OS page cache (older faiss only has IO_FLAG_MMAP).
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class SessionIndex:
+    """A loaded session index: the FAISS vector store and the BM25 index over its chunks.
+
+    A `mapped` index was loaded with memory-mapped, read-only vectors: it is never added
+    to, later segments are searched alongside it as extra shards instead.
+    """
+
+    def __init__(self, store, keywords=None, mapped=False, heap_vectors=None):
+        self.store = store
+        self.keywords = keywords if keywords is not None else BM25Index.from_store(store)
+        self.mapped = mapped
+        # Vectors held in process memory rather than mapped from disk.
+        self.heap_vectors = heap_vectors if heap_vectors is not None else (0 if mapped else store.index.ntotal)
+        self._positions = None
+
+    def merge(self, other):
+        """Appends `other`'s vectors, chunks and keyword postings to this index in place.
+
+        Vectors are copied with reconstruct/add rather than `FAISS.merge_from`, so the two
+        indexes may be of different types (e.g. a flat delta added to an HNSW base). A
+        mapped index instead searches `other`'s index as an additional shard.
+        """
+        count = other.store.index.ntotal
+        if not count:
+            return self
+        offset = self.store.index.ntotal
+        if self.mapped:
+            if not isinstance(self.store.index, faiss.IndexShards):
+                index = faiss.IndexShards(self.store.index.d, False, True)
+                index.add_shard(self.store.index)
+                self.store.index = index
+            for shard in shards(other.store.index):
+                self.store.index.add_shard(shard)
+        else:
+            self.store.index.add(reconstruct_all(other.store.index))
+        doc_ids = [other.store.index_to_docstore_id[i] for i in range(count)]
+        if isinstance(self.store.docstore, LazyDocstore) and isinstance(other.store.docstore, LazyDocstore):
+            self.store.docstore.merge(other.store.docstore)
+        else:
+            self.store.docstore.add({doc_id: get_document(other.store.docstore, doc_id) for doc_id in doc_ids})
+        self.store.index_to_docstore_id.update({offset + i: doc_id for i, doc_id in enumerate(doc_ids)})
+        self.keywords.merge(other.keywords)
+        self.heap_vectors += other.heap_vectors
+        return self
+
+    def vectors(self, doc_ids):
+        """The stored vectors of the given chunks, read back from the FAISS index rather than re-embedded."""
+        positions = self._positions
+        if positions is None or len(positions) != self.store.index.ntotal:
+            positions = self._positions = {doc_id: i for i, doc_id in self.store.index_to_docstore_id.items()}
+        return reconstruct(self.store.index, [positions[doc_id] for doc_id in doc_ids])
+
+    def estimated_bytes(self):
+        """Heap footprint: mapped vectors and chunks live in the shared page cache instead."""
+        index, docstore = self.store.index, self.store.docstore
+        size = self.keywords.estimated_bytes()
+        if isinstance(docstore, LazyDocstore):
+            size += docstore.estimated_bytes()
+        else:
+            size += sum(len(doc.page_content) for doc in getattr(docstore, "_dict", {}).values())
+        return size + self.heap_vectors * index.d * 4
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        store = self.store
+        doc_ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        faiss.write_index(store.index, os.path.join(path, INDEX_NAME))
+        write_chunks(path, doc_ids, [get_document(store.docstore, doc_id) for doc_id in doc_ids])
+        self.keywords.save(os.path.join(path, KEYWORDS_NAME))
+
+    @classmethod
+    def load(cls, path, embeddings, mmap=False):
+        """Loads a segment, memory-mapping its vectors if `mmap` is set.
+
+        Chunk text and metadata are not read here: the docstore fetches them from the
+        chunk file by vector position when a search hits them.
+        """
+        if has_chunks(path):
+            chunks = ChunkFile(path)
+            flags = MMAP_FLAGS if mmap else 0
+            index = faiss.read_index(os.path.join(path, INDEX_NAME), flags)
+            store = FAISS(embeddings, index, LazyDocstore([chunks]), dict(enumerate(chunks.ids)))
+        else:
+            mmap = False  # pickled docstores are always read into memory
+            store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        try:
+            keywords = BM25Index.load(os.path.join(path, KEYWORDS_NAME))
+        except FileNotFoundError:
+            keywords = None  # segment predates keyword indexes; rebuilt from its chunks
+        return cls(store, keywords, mapped=mmap)
+
+
+@contextmanager
+def file_lock(db_path):
+    """Exclusive lock on the session directory, held across processes while it is rewritten."""
+    os.makedirs(db_path, exist_ok=True)
+    with open(os.path.join(db_path, ".lock"), "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_manifest(db_path):
+    try:
+        with open(os.path.join(db_path, MANIFEST_NAME), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        if os.path.exists(os.path.join(db_path, "index.faiss")):
+            return {"generation": 0, "segments": [LEGACY_SEGMENT]}
+        return None
+
+
+def _write_manifest(db_path, manifest):
+    path = os.path.join(db_path, MANIFEST_NAME)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, path)
+
+
+def index_signature(db_path):
+    """Cheap version stamp for a session index: a stat of its manifest (or legacy index file)."""
+    for name in (MANIFEST_NAME, "index.faiss"):
+        try:
+            st = os.stat(os.path.join(db_path, name))
+        except OSError:
+            continue
+        return (name, st.st_ino, st.st_mtime_ns, st.st_size)
+    return None
+
+
+def load_segments(db_path, embeddings, manifest=None, mmap=False):
+    """Loads every segment listed in the manifest and merges them into one `SessionIndex`."""
+    manifest = manifest or read_manifest(db_path)
+    if not manifest or not manifest["segments"]:
+        return None
+    index = None
+    for segment in manifest["segments"]:
+        loaded = SessionIndex.load(os.path.join(db_path, segment), embeddings, mmap=mmap)
+        index = loaded if index is None else index.merge(loaded)
+    return index
+
+
+def indexed_sources(db_path):
+    """The sources (file paths, URLs) whose chunks the session index already holds."""
+    manifest = read_manifest(db_path)
+    return set(manifest.get("sources", [])) if manifest else set()
+
+
+def append_segment(db_path, segment, sources=()):
+    """Persists the `SessionIndex` as a new segment and publishes it in the manifest.
+
+    `sources` are recorded in the manifest as indexed. Returns `(before, after,
+    manifest)`: the index signatures immediately before and after the manifest update,
+    taken under the directory lock, so callers can tell exactly which on-disk version
+    the new segment extends.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    name = f"seg-{uuid.uuid4().hex[:12]}"
+    segment.save(os.path.join(db_path, name))
+    with file_lock(db_path):
+        before = index_signature(db_path)
+        manifest = read_manifest(db_path) or {"generation": 0, "segments": []}
+        manifest = {
+            "generation": manifest["generation"] + 1,
+            "segments": manifest["segments"] + [name],
+            "sources": sorted(set(manifest.get("sources", [])) | set(sources)),
+            "retired": manifest.get("retired", []),
+        }
+        _write_manifest(db_path, manifest)
+        after = index_signature(db_path)
+    return before, after, manifest
+
+
+def add_sources(db_path, sources):
+    """Records `sources` as indexed when their chunks went out in already appended segments."""
+    with file_lock(db_path):
+        manifest = read_manifest(db_path)
+        if not manifest:
+            return
+        _write_manifest(db_path, {**manifest, "sources": sorted(set(manifest.get("sources", [])) | set(sources))})
+
+
+def _remove_segment(db_path, segment):
+    if segment == LEGACY_SEGMENT:
+        for filename in ("index.faiss", "index.pkl"):
+            try:
+                os.remove(os.path.join(db_path, filename))
+            except OSError:
+                pass
+    else:
+        shutil.rmtree(os.path.join(db_path, segment), ignore_errors=True)
+
+
+def _remove_contents(db_path):
+    """Deletes everything in the session directory but the lock file; call with the lock held."""
+    for name in os.listdir(db_path):
+        path = os.path.join(db_path, name)
+        if name == ".lock":
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def delete_index(db_path):
+    """Deletes a session index, waiting for any append or compaction writing it to finish."""
+    if not os.path.isdir(db_path):
+        return
+    with file_lock(db_path):
+        _remove_contents(db_path)
+    # The lock file cannot be removed while it is held on Windows.
+    shutil.rmtree(db_path, ignore_errors=True)
+
+
+def compact(db_path, embeddings, rebuild=None):
+    """Merges all current segments into a single new base segment.
+
+    If given, `rebuild(faiss_index)` returns the index to store for the merged vectors,
+    e.g. one rebuilt with a type suited to its size. Segments appended while the merge
+    runs are kept after the new base. The merged segments are listed as `retired` in the
+    manifest and only deleted by the next compaction, so readers still loading them
+    from the previous manifest are not cut off. Returns
+    `(index, signature)` when the compacted base is the whole index, `(None, None)`
+    otherwise (nothing to do, or the index was replaced or deleted underneath us).
+    """
+    manifest = read_manifest(db_path)
+    if not manifest or len(manifest["segments"]) < 2:
+        return None, None
+
+    snapshot = manifest["segments"]
+    merged = load_segments(db_path, embeddings, manifest)
+    if rebuild:
+        merged.store.index = rebuild(merged.store.index)
+    name = f"seg-{uuid.uuid4().hex[:12]}"
+    try:
+        # Not makedirs: if the session was deleted meanwhile, its directory stays gone.
+        os.mkdir(os.path.join(db_path, name))
+    except FileNotFoundError:
+        return None, None
+    merged.save(os.path.join(db_path, name))
+
+    with file_lock(db_path):
+        current = read_manifest(db_path)
+        if not current:
+            # Deleted while we merged; anything left here is ours.
+            _remove_contents(db_path)
+            return None, None
+        if current["segments"][:len(snapshot)] != snapshot:
+            shutil.rmtree(os.path.join(db_path, name), ignore_errors=True)
+            return None, None
+        for segment in current.get("retired", []):
+            _remove_segment(db_path, segment)
+        remaining = current["segments"][len(snapshot):]
+        _write_manifest(db_path, {
+            "generation": current["generation"] + 1,
+            "segments": [name] + remaining,
+            "sources": current.get("sources", []),
+            "retired": snapshot,
+        })
+        signature = index_signature(db_path)
+
+    if remaining:
+        return None, None
+    return merged, signature
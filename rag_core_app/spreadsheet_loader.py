@@ -0,0 +1,81 @@
+import codecs
+import csv
+
+from langchain.docstore.document import Document
+
+# Spreadsheets are read row by row and emitted as groups of rows, each prefixed with
+# the header row so every chunk stays self-describing. Only one group is held in memory.
+
+
+def _format_row(cells):
+    values = ["" if cell is None else str(cell).strip() for cell in cells]
+    while values and not values[-1]:
+        values.pop()
+    return " | ".join(values)
+
+
+def _iter_groups(rows, header, max_chars):
+    """Groups `(row_number, line)` pairs into `(first_row, last_row, text)` of at most ~`max_chars`."""
+    lines, first, last, size = [], None, None, len(header)
+    for number, line in rows:
+        if lines and size + len(line) + 1 > max_chars:
+            yield first, last, "\n".join([header] + lines)
+            lines, first, size = [], None, len(header)
+        lines.append(line)
+        first = number if first is None else first
+        last = number
+        size += len(line) + 1
+    if lines:
+        yield first, last, "\n".join([header] + lines)
+
+
+def _sniff_encoding(file_path, sample_bytes=1024 * 1024):
+    with open(file_path, "rb") as fh:
+        sample = fh.read(sample_bytes)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def iter_csv_documents(file_path, max_chars=900):
+    """Yields row-group Documents from a CSV file, streaming it from disk."""
+    with open(file_path, "r", encoding=_sniff_encoding(file_path), errors="replace", newline="") as fh:
+        lines = (
+            (number, line)
+            for number, row in enumerate(csv.reader(fh), start=1)
+            for line in [_format_row(row)] if line
+        )
+        header = next(lines, None)
+        if header is None:
+            return
+        header = header[1]
+        for first, last, text in _iter_groups(lines, header, max_chars):
+            yield Document(page_content=text, metadata={
+                "source": file_path, "type": "csv", "row_start": first, "row_end": last,
+            })
+
+
+def iter_xlsx_documents(file_path, max_chars=900):
+    """Yields row-group Documents from every sheet of a workbook, read in streaming mode."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            lines = (
+                (number, line)
+                for number, row in enumerate(ws.iter_rows(values_only=True), start=1)
+                for line in [_format_row(row)] if line
+            )
+            header = next(lines, None)
+            if header is None:
+                continue
+            header = f"--- Sheet: {ws.title} ---\n{header[1]}"
+            for first, last, text in _iter_groups(lines, header, max_chars):
+                yield Document(page_content=text, metadata={
+                    "source": file_path, "type": "xlsx", "sheet": ws.title, "row_start": first, "row_end": last,
+                })
+    finally:
+        wb.close()
@@ -0,0 +1,147 @@
+import csv
+import os
+import random
+import zipfile
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+# Deterministic documents of every uploadable type, for benchmarks. Each paragraph
+# carries one fact ("reference code X belongs to project Y") that appears nowhere
+# else, so a query for the code has exactly one right chunk to retrieve.
+
+SUPPORTED_TYPES = ("txt", "pdf", "csv", "xlsx", "docx", "pptx")
+
+Fact = namedtuple("Fact", "code project source")
+
+WORDS = (
+    "analysis budget contract customer delivery design engine estimate forecast framework "
+    "hardware inventory invoice latency ledger milestone module network operations payment "
+    "pipeline policy portfolio procurement quarter report revenue review schedule security "
+    "service shipment specification storage supplier support system timeline vendor warehouse"
+).split()
+PROJECTS = (
+    "Aurora Basalt Cobalt Delta Ember Falcon Granite Harbor Indigo Juniper Kestrel Lumen "
+    "Meridian Nimbus Onyx Pioneer Quartz Raven Sierra Tundra"
+).split()
+
+
+def _sentence(rng, words=14):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraphs(rng, count, source, facts, sentences=8):
+    paragraphs = []
+    for _ in range(count):
+        code = f"{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}-{rng.randrange(1000, 9999)}"
+        project = rng.choice(PROJECTS)
+        facts.append(Fact(code, project, source))
+        body = [_sentence(rng) for _ in range(sentences)]
+        body.insert(rng.randrange(len(body)), f"Reference code {code} belongs to project {project}.")
+        paragraphs.append(" ".join(body))
+    return paragraphs
+
+
+def _write_txt(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write("\n\n".join(paragraphs))
+
+
+def _write_pdf(path, paragraphs, per_page=3):
+    import pymupdf
+
+    doc = pymupdf.open()
+    for start in range(0, len(paragraphs), per_page):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), "\n\n".join(paragraphs[start:start + per_page]), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def _rows(paragraphs):
+    for i, paragraph in enumerate(paragraphs):
+        yield [i + 1, f"Item {i + 1}", paragraph]
+
+
+def _write_csv(path, paragraphs):
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["id", "name", "description"])
+        writer.writerows(_rows(paragraphs))
+
+
+def _write_xlsx(path, paragraphs):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Items")
+    sheet.append(["id", "name", "description"])
+    for row in _rows(paragraphs):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def _write_docx(path, paragraphs):
+    # The smallest package Word and docx2txt accept: content types plus the main part.
+    body = "".join(f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>" for paragraph in paragraphs)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ))
+        archive.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        archive.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        ))
+
+
+def _write_pptx(path, paragraphs):
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    presentation = Presentation()
+    for i, paragraph in enumerate(paragraphs):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {i + 1}"
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(5))
+        box.text_frame.word_wrap = True
+        box.text_frame.text = paragraph
+    presentation.save(path)
+
+
+WRITERS = {
+    "txt": _write_txt,
+    "pdf": _write_pdf,
+    "csv": _write_csv,
+    "xlsx": _write_xlsx,
+    "docx": _write_docx,
+    "pptx": _write_pptx,
+}
+
+
+def write_documents(directory, types=SUPPORTED_TYPES, per_type=2, paragraphs=40, seed=0):
+    """Writes `per_type` documents of each type to `directory`.
+
+    Returns `(files, facts)`: `{type: [path, ...]}` and the list of `Fact`s planted in them.
+    """
+    rng = random.Random(seed)
+    files, facts = {}, []
+    for file_type in types:
+        for number in range(per_type):
+            path = os.path.join(directory, f"synthetic_{number}.{file_type}")
+            WRITERS[file_type](path, _paragraphs(rng, paragraphs, path, facts))
+            files.setdefault(file_type, []).append(path)
+    return files, facts
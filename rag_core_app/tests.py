@@ -1,3 +1,1474 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from langchain_core.embeddings import Embeddings
+
+
+class StartupTimeTests(SimpleTestCase):
+    """Guards against heavy ML imports creeping back into Django startup."""
+
+    CHECK_BUDGET_SECONDS = float(os.getenv('STARTUP_CHECK_BUDGET', '3.0'))
+
+    def _run(self, *args):
+        return subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=os.environ.copy(),
+            capture_output=True, text=True, timeout=120
+        )
+
+    def test_manage_check_within_budget(self):
+        started = time.perf_counter()
+        result = self._run('manage.py', 'check')
+        elapsed = time.perf_counter() - started
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertLess(
+            elapsed, self.CHECK_BUDGET_SECONDS,
+            f"manage.py check took {elapsed:.2f}s (budget {self.CHECK_BUDGET_SECONDS:.2f}s)"
+        )
+
+    def test_url_loading_does_not_import_models(self):
+        result = self._run('-c', (
+            "import django, sys; django.setup();"
+            "import ChatBot.urls;"
+            "print(','.join(m for m in ('torch', 'sentence_transformers', 'langchain_huggingface',"
+            " 'rag_core_app.rag_utils') if m in sys.modules))"
+        ))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class _TestSite(BaseHTTPRequestHandler):
+    """Pages for UrlFetcherTests; counts requests and the peak of concurrent ones."""
+
+    page = b"<!doctype html><html lang='en'><head><title>Test page</title><style>p {}</style></head>" \
+           b"<body><p>Hello from the test site.</p><script>var x = 1;</script></body></html>"
+    requests = []
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            self.requests.append((self.path, self.headers.get('If-None-Match')))
+            _TestSite.active += 1
+            _TestSite.peak = max(_TestSite.peak, _TestSite.active)
+        try:
+            if self.path == '/page':
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self._send(self.page, 'text/html; charset=utf-8', ETag='"v1"')
+            elif self.path == '/download':
+                self._send(b"%PDF-1.4\n%...\n", 'application/octet-stream')
+            elif self.path == '/big':
+                # No Content-Length, so the cap has to be enforced while streaming.
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.end_headers()
+                for _ in range(64):
+                    self.wfile.write(b"x" * 65536)
+            elif self.path.startswith('/slow'):
+                time.sleep(0.2)
+                self._send(b"slow", 'text/plain')
+            else:
+                self.send_error(404)
+        finally:
+            with self.lock:
+                _TestSite.active -= 1
+
+    def _send(self, body, content_type, **headers):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UrlFetcherTests(SimpleTestCase):
+    """URL ingestion against a local HTTP server: conditional re-fetch, size cap, sniffing, per-host limit."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _TestSite)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+        from rag_core_app.url_fetcher import UrlFetcher
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fetcher = UrlFetcher(
+            store=DiskLRUCache(os.path.join(directory.name, 'urls.sqlite3'), 1024 * 1024),
+            max_bytes=1024 * 1024, per_host=2,
+        )
+        _TestSite.requests = []
+        _TestSite.peak = 0
+
+    def test_unchanged_page_is_revalidated_with_304(self):
+        from rag_core_app.url_fetcher import decode_body, html_to_text
+
+        first = self.fetcher.fetch(f"{self.base}/page")
+        second = self.fetcher.fetch(f"{self.base}/page")
+        self.assertEqual((first.status, first.kind, first.not_modified), (200, 'html', False))
+        self.assertEqual((second.status, second.not_modified), (304, True))
+        self.assertEqual(second.body, first.body)
+        self.assertEqual([etag for _, etag in _TestSite.requests], [None, '"v1"'])
+        text, title, language = html_to_text(decode_body(second.body, second.content_type))
+        self.assertEqual((text, title, language), ("Hello from the test site.", "Test page", "en"))
+
+    def test_body_over_the_cap_is_rejected(self):
+        result = self.fetcher.fetch(f"{self.base}/big")
+        self.assertIsNone(result.body)
+        self.assertIn("limit", result.error)
+
+    def test_content_type_is_sniffed_from_the_body(self):
+        self.assertEqual(self.fetcher.fetch(f"{self.base}/download").kind, 'pdf')
+
+    def test_concurrent_fetches_respect_the_per_host_limit(self):
+        urls = [f"{self.base}/slow?{i}" for i in range(6)]
+        started = time.perf_counter()
+        results = list(self.fetcher.fetch_many(urls))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(sorted(r.url for r in results), sorted(urls))
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(_TestSite.peak, 2)
+        # Two at a time: three rounds of 0.2s, not six.
+        self.assertLess(elapsed, 1.0)
+
+    def test_ingestion_fetches_urls_together_and_skips_unchanged_ones(self):
+        from unittest import mock
+
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from rag_core_app import rag_utils
+        from rag_core_app.metrics import Timings
+
+        page, slow = f"{self.base}/page", [f"{self.base}/slow?{i}" for i in range(4)]
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        with mock.patch.object(rag_utils, "URL_FETCHER", self.fetcher):
+            unchanged = set()
+            first = list(rag_utils._iter_chunks([page] + slow, splitter, Timings("test"), set(), unchanged))
+            self.assertEqual(_TestSite.peak, 2)
+            self.assertEqual({source for source, chunks in first if chunks}, {page} | set(slow))
+
+            second = list(rag_utils._iter_chunks([page], splitter, Timings("test"), {page}, unchanged))
+        self.assertEqual(second, [(page, None)])
+        self.assertEqual(unchanged, {page})
+        self.assertEqual(_TestSite.requests[-1], ('/page', '"v1"'))
+
+
+class CachedSearchTests(SimpleTestCase):
+    """Web search cache and single-flight, against the stand-in search provider."""
+
+    def setUp(self):
+        from rag_core_app.cache_layer import MemoryTTLCache, SharedCache
+        from rag_core_app.fakes import FakeWebSearch
+        from rag_core_app.search_cache import CachedSearch
+
+        self.provider = FakeWebSearch(delay=0.2)
+        self.search = CachedSearch(
+            lambda: self.provider, SharedCache(MemoryTTLCache(1024 * 1024)).namespace("web_search", 60)
+        )
+
+    def test_equivalent_queries_share_one_entry(self):
+        first = self.search.run("What is RAG?")
+        self.assertEqual(self.search.run("  what is   rag "), first)
+        self.assertEqual(self.provider.calls, 1)
+        stats = self.search.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertGreater(stats["saved_seconds"], 0.15)
+
+    def test_concurrent_identical_searches_make_one_call(self):
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(self.search.run, ["latest python release"] * 8))
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.provider.calls, 1)
+        stats = self.search.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["coalesced"], 7)
+
+    def test_failures_are_not_cached(self):
+        from unittest import mock
+
+        with mock.patch.object(self.provider, "run", side_effect=RuntimeError("rate limited")):
+            with self.assertRaises(RuntimeError):
+                self.search.run("flaky")
+        self.search.run("flaky")
+        self.assertEqual(self.search.stats()["errors"], 1)
+        self.assertEqual(self.provider.calls, 1)
+
+
+class ContextPackerTests(SimpleTestCase):
+    """Prompt packing: duplicates, splitter overlap and the shared token budget."""
+
+    def setUp(self):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text = " ".join(f"Sentence {i} is about topic {i % 7} and mentions code ZX{i * 13}." for i in range(200))
+        self.chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_text(text)
+
+    def candidates(self, texts, source="notes.txt"):
+        from rag_core_app.context_packing import Candidate
+
+        return [Candidate(text, None, source) for text in texts]
+
+    def test_duplicates_are_dropped_and_overlap_trimmed(self):
+        from rag_core_app.context_packing import Candidate, ContextPacker
+
+        offered = self.candidates(self.chunks[:3])
+        offered.insert(1, Candidate(self.chunks[0], None, "copy.txt"))
+        packed = ContextPacker(budget=100000).pack([], offered)
+        self.assertEqual(packed.stats["chunks"], 3)
+        self.assertEqual(packed.stats["duplicates"], 1)
+        self.assertGreater(packed.stats["trimmed_tokens"], 0)
+        self.assertGreater(packed.stats["tokens_saved"], 0)
+        # Every sentence survives exactly once.
+        for i in range(40):
+            self.assertLessEqual(packed.context.count(f"code ZX{i * 13}."), 1)
+
+    def test_templated_chunks_with_different_facts_are_kept(self):
+        from rag_core_app.context_packing import ContextPacker
+
+        rows = [f"Reference code RC-{i:04d} belongs to project Falcon {i}." for i in range(5)]
+        packed = ContextPacker(budget=100000).pack([], self.candidates(rows))
+        self.assertEqual(packed.stats["duplicates"], 0)
+        self.assertTrue(all(row in packed.context for row in rows))
+
+    def test_history_and_context_share_the_budget(self):
+        from rag_core_app.context_packing import ContextPacker, count_tokens
+
+        history = ["User: first question", "AI: " + "a long earlier answer " * 500, "User: follow-up"]
+        packer = ContextPacker(budget=1200, history_share=0.25)
+        packed = packer.pack(history, self.candidates(self.chunks[:5]))
+        self.assertLessEqual(count_tokens(packed.history) + count_tokens(packed.context), 1200)
+        self.assertTrue(packed.history.endswith("User: follow-up"))
+        self.assertGreaterEqual(count_tokens(packed.history), 300)
+        self.assertIn(self.chunks[0], packed.context)
+        self.assertGreater(packed.stats["tokens_saved"], 0)
+
+
+class RateLimitTests(TestCase):
+    """Per-user request limits on the chat endpoint."""
+
+    def setUp(self):
+        from rag_core_app.rate_limit import SlidingWindowLimiter
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patches = [
+            mock.patch('rag_core_app.rate_limit.LIMITER', SlidingWindowLimiter(os.path.join(directory.name, 'rl.sqlite3'))),
+            mock.patch.dict('rag_core_app.rate_limit.RATE_LIMITS', {'chat': (3, 60)}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client.force_login(User.objects.create_user('limited', password='pw-limited-1'))
+
+    def test_burst_over_the_limit_gets_429_with_retry_after(self):
+        # Empty messages are rejected by the view, after the limiter has counted them.
+        statuses = [self.client.post('/api/chat/', {'message': ''}, secure=True).status_code for _ in range(3)]
+        self.assertEqual(statuses, [400, 400, 400])
+
+        response = self.client.post('/api/chat/', {'message': ''}, secure=True)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+
+
+class ChatTimingTests(TestCase):
+    """Stage timings of a streamed chat answer: the header only covers what precedes the stream."""
+
+    def setUp(self):
+        from rag_core_app.models import ChatSession
+        from rag_core_app.rate_limit import SlidingWindowLimiter
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch('rag_core_app.rate_limit.LIMITER',
+                           SlidingWindowLimiter(os.path.join(directory.name, 'rl.sqlite3')))
+        patch.start()
+        self.addCleanup(patch.stop)
+        user = User.objects.create_user('timed', password='pw-timed-1')
+        self.session = ChatSession.objects.create(user=user, title='Timed')
+        self.client.force_login(user)
+
+    def test_stage_breakdown_comes_in_the_meta_event(self):
+        import json
+
+        def get_answer(message, session_id, timings):
+            with timings.span('retrieval'):
+                pass
+            yield 'An answer.'
+
+        with mock.patch('rag_core_app.rag_utils.get_answer', get_answer):
+            response = self.client.post('/api/chat/', {'message': 'hi', 'session_id': self.session.id}, secure=True)
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertRegex(response['Server-Timing'], r'^prestream;desc="Before streaming";dur=[\d.]+$')
+        answer, meta = body.split('\n__META__:')
+        self.assertEqual(answer, 'An answer.')
+        self.assertEqual(list(json.loads(meta)['timings']), ['session', 'retrieval', 'save'])
+
+
+class PaginationTests(TestCase):
+    """Keyset pagination of the sessions and messages APIs."""
+
+    def setUp(self):
+        from rag_core_app.models import ChatMessage, ChatSession
+
+        self.user = User.objects.create_user('pager', password='pw-pager-1')
+        self.client.force_login(self.user)
+        # Rows created in one burst share timestamps, so pages must also order by id.
+        self.sessions = [ChatSession.objects.create(user=self.user, title=f"Chat {i}") for i in range(7)]
+        self.messages = [
+            ChatMessage.objects.create(session=self.sessions[0], is_user=i % 2 == 0, text=f"Message {i}")
+            for i in range(5)
+        ]
+
+    def pages(self, url, key):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(url, {'limit': 2, **({'cursor': cursor} if cursor else {})}, secure=True)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [item['id'] for item in data[key]]
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids, pages
+
+    def test_cursor_walks_every_session_once_newest_first(self):
+        ids, pages = self.pages('/api/sessions/', 'sessions')
+        self.assertEqual(ids, [s.id for s in reversed(self.sessions)])
+        self.assertEqual(pages, 4)
+
+    def test_cursor_walks_every_message_once_newest_first(self):
+        ids, pages = self.pages(f'/api/sessions/{self.sessions[0].id}/messages/', 'messages')
+        self.assertEqual(ids, [m.id for m in reversed(self.messages)])
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor_is_rejected(self):
+        for url in ('/api/sessions/', f'/api/sessions/{self.sessions[0].id}/messages/'):
+            response = self.client.get(url, {'cursor': 'not-a-cursor'}, secure=True)
+            self.assertEqual(response.status_code, 400)
+
+
+class _WordEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors, so index tests need no model."""
+
+    dims = 64
+
+    def _embed(self, text):
+        import zlib
+
+        vector = [0.0] * self.dims
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % self.dims] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class SegmentStoreTests(SimpleTestCase):
+    """Session indexes grown by appended segments and merged by compaction."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'session')
+        self.embeddings = _WordEmbeddings()
+
+    def segment(self, texts, source):
+        from langchain_community.vectorstores import FAISS
+        from rag_core_app.keyword_index import BM25Index
+        from rag_core_app.segment_store import SessionIndex
+
+        store = FAISS.from_texts(texts, self.embeddings, metadatas=[{'source': source}] * len(texts))
+        return SessionIndex(store, BM25Index.from_store(store))
+
+    def search(self, queries):
+        from rag_core_app.retrieval import hybrid_search
+        from rag_core_app.segment_store import load_segments
+
+        index = load_segments(self.db_path, self.embeddings)
+        results = {}
+        for query in queries:
+            hits, _ = hybrid_search(index, query, self.embeddings.embed_query(query), k=3)
+            results[query] = [(doc.page_content, doc.metadata['source']) for doc, _, _ in hits]
+        return results
+
+    def test_compaction_preserves_search_results(self):
+        from rag_core_app.segment_store import append_segment, compact, read_manifest
+
+        for n in range(3):
+            texts = [f"upload {n} note {i} about topic{(n * 5 + i) % 7} and colour{i}" for i in range(5)]
+            append_segment(self.db_path, self.segment(texts, f"file{n}.txt"), sources=[f"file{n}.txt"])
+        self.assertEqual(len(read_manifest(self.db_path)['segments']), 3)
+
+        queries = ["topic3 colour1", "upload 2 note 4", "colour0"]
+        before = self.search(queries)
+        merged, signature = compact(self.db_path, self.embeddings)
+
+        manifest = read_manifest(self.db_path)
+        self.assertEqual(len(manifest['segments']), 1)
+        self.assertEqual(len(manifest['retired']), 3)
+        self.assertEqual(sorted(manifest['sources']), ['file0.txt', 'file1.txt', 'file2.txt'])
+        self.assertEqual(merged.store.index.ntotal, 15)
+        self.assertIsNotNone(signature)
+        self.assertEqual(self.search(queries), before)
+
+    def test_mapped_segments_are_searched_as_shards(self):
+        import faiss
+
+        from rag_core_app.chunk_store import LazyDocstore
+        from rag_core_app.retrieval import hybrid_search
+        from rag_core_app.segment_store import append_segment, load_segments
+
+        for n in range(3):
+            texts = [f"report {n} section {i} covers topic{(n + i) % 4}" for i in range(4)]
+            append_segment(self.db_path, self.segment(texts, f"report{n}.txt"), sources=[f"report{n}.txt"])
+
+        heap = load_segments(self.db_path, self.embeddings)
+        mapped = load_segments(self.db_path, self.embeddings, mmap=True)
+        self.assertIsInstance(mapped.store.index, faiss.IndexShards)
+        self.assertIsInstance(mapped.store.docstore, LazyDocstore)
+        self.assertEqual((mapped.store.index.ntotal, mapped.heap_vectors), (12, 0))
+        self.assertLess(mapped.estimated_bytes(), heap.estimated_bytes())
+        for query in ["report 2 section 3", "topic1", "covers topic0"]:
+            vector = self.embeddings.embed_query(query)
+            self.assertEqual(hybrid_search(mapped, query, vector)[0], hybrid_search(heap, query, vector)[0])
+        # The vectors of any chunk can still be read back across shards.
+        doc_ids = [mapped.store.index_to_docstore_id[i] for i in (0, 5, 11)]
+        self.assertEqual(mapped.vectors(doc_ids).tolist(), heap.vectors(doc_ids).tolist())
+
+    def test_merged_docstores_resolve_every_chunk(self):
+        from langchain_core.documents import Document
+        from rag_core_app.chunk_store import ChunkFile, LazyDocstore
+        from rag_core_app.retrieval import hybrid_search
+        from rag_core_app.segment_store import append_segment, load_segments, read_manifest
+
+        append_segment(self.db_path, self.segment(["alpha one", "alpha two"], "a.txt"), sources=["a.txt"])
+        append_segment(self.db_path, self.segment(["beta one"], "b.txt"), sources=["b.txt"])
+        first, second = (ChunkFile(os.path.join(self.db_path, segment))
+                         for segment in read_manifest(self.db_path)['segments'])
+        docstore = LazyDocstore([first])
+        other = LazyDocstore([second])
+        other.add({'fresh': Document(page_content="gamma one")})
+        docstore.merge(other)
+
+        self.assertEqual([docstore.search(doc_id).page_content for doc_id in first.ids + second.ids + ['fresh']],
+                         ["alpha one", "alpha two", "beta one", "gamma one"])
+        with self.assertRaises(KeyError):
+            docstore.search('no-such-id')
+
+        # A chunk the keyword index knows but the docstore lost is skipped, not returned as a string.
+        index = load_segments(self.db_path, self.embeddings)
+        index.keywords.add('lost', 'alpha alpha alpha')
+        hits, _ = hybrid_search(index, 'alpha', self.embeddings.embed_query('alpha'), k=3)
+        self.assertEqual(sorted(doc.page_content for doc, _, _ in hits), ["alpha one", "alpha two", "beta one"])
+
+
+class JobQueueTests(TransactionTestCase):
+    """Claiming ingestion jobs from several workers at once."""
+
+    def test_concurrent_claims_hand_a_job_to_one_worker(self):
+        from django.db import connection
+        from rag_core_app.jobs import claim_next_job, enqueue_ingestion
+        from rag_core_app.models import ChatSession, IngestionJob
+
+        user = User.objects.create_user('worker', password='pw-worker-1')
+        with mock.patch('rag_core_app.jobs.wake_workers'):
+            job = enqueue_ingestion(ChatSession.objects.create(user=user, title='Jobs'), [])
+
+        start = threading.Barrier(4)
+        claimed = []
+
+        def claim():
+            try:
+                start.wait()
+                result = claim_next_job()
+                if result is not None:
+                    claimed.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([c.id for c in claimed], [job.id])
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.STATUS_RUNNING)
+        self.assertEqual(job.worker_id, claimed[0].worker_id)
+        self.assertIsNotNone(job.lease_expires_at)
+
+    def test_failed_ingestion_is_reported_in_the_chat(self):
+        from rag_core_app.jobs import claim_next_job, enqueue_ingestion, run_job
+        from rag_core_app.models import ChatSession, IngestionJob
+
+        session = ChatSession.objects.create(user=User.objects.create_user('failing', password='pw-failing-1'), title='Jobs')
+        with mock.patch('rag_core_app.jobs.wake_workers'):
+            enqueue_ingestion(session, [('broken.pdf', '/nowhere/broken.pdf', None)])
+        with mock.patch('rag_core_app.rag_utils.process_files_bulk', return_value=False):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, IngestionJob.STATUS_FAILED)
+        self.assertEqual(job.files.get().status, 'Index Failed')
+        reply = session.messages.filter(is_user=False).get()
+        self.assertNotIn("Ask me anything", reply.text)
+
+
+class DiskLRUCacheTests(SimpleTestCase):
+    """The SQLite key/value store behind the embedding, OCR and URL caches."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def summed(self, cache):
+        return cache._conn().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def test_running_total_follows_writes_replacements_and_clears(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+
+        cache = DiskLRUCache(self.path, 1024 * 1024)
+        cache.set_many({'a': b'x' * 100, 'b': b'y' * 50})
+        cache.set('a', b'z' * 10)
+        self.assertEqual(cache.total_bytes(), 60)
+        self.assertEqual(cache.total_bytes(), self.summed(cache))
+        # Another handle on the same file (another worker) sees the same total.
+        self.assertEqual(DiskLRUCache(self.path, 1024 * 1024).total_bytes(), 60)
+        cache.clear()
+        self.assertEqual(cache.total_bytes(), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+
+        cache = DiskLRUCache(self.path, 1000)
+        for i in range(5):
+            cache.set(f'k{i}', bytes(200))
+            cache._conn().execute("UPDATE entries SET last_access = ? WHERE key = ?", (i, f'k{i}'))
+        cache.get('k0')  # long untouched, so the hit refreshes it
+        cache.set('k5', bytes(200))
+        self.assertEqual(sorted(cache.get_many([f'k{i}' for i in range(6)])), ['k0', 'k3', 'k4', 'k5'])
+        self.assertEqual(cache.total_bytes(), 800)
+        self.assertEqual(cache.total_bytes(), self.summed(cache))
+
+    def test_recent_hits_do_not_write(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+
+        cache = DiskLRUCache(self.path, 1024 * 1024)
+        cache.set('k', b'v')
+        conn = cache._conn()
+        writes = conn.total_changes
+        self.assertEqual(cache.get('k'), b'v')
+        self.assertEqual(conn.total_changes, writes)
+
+    def test_total_is_seeded_for_caches_written_without_it(self):
+        import sqlite3
+
+        from rag_core_app.disk_cache import DiskLRUCache
+
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                     "last_access REAL NOT NULL)")
+        conn.execute("INSERT INTO entries VALUES ('old', ?, 30, 0)", (bytes(30),))
+        conn.commit()
+        conn.close()
+        cache = DiskLRUCache(self.path, 1024 * 1024)
+        self.assertEqual(cache.total_bytes(), 30)
+        self.assertEqual(cache.get('old'), bytes(30))
+
+
+class SharedCacheTests(SimpleTestCase):
+    """Namespaced TTL caches shared by workers: web search, query embeddings, intents."""
+
+    def setUp(self):
+        from rag_core_app.cache_layer import SharedCache
+        from rag_core_app.disk_cache import DiskTTLCache
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = DiskTTLCache(os.path.join(directory.name, 'shared.sqlite3'), 1024 * 1024)
+        self.cache = SharedCache(self.store)
+        self.now = 1000.0
+        patch = mock.patch('time.time', lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_namespaces_are_isolated_and_expire_on_their_own_ttl(self):
+        short = self.cache.namespace('short', 10)
+        long = self.cache.namespace('long', 100)
+        disabled = self.cache.namespace('disabled', 0)
+        short.set('key', ['short'])
+        long.set('key', {'value': 'long'})
+        disabled.set('key', 'never stored')
+        self.assertEqual((short.get('key'), long.get('key'), disabled.get('key')), (['short'], {'value': 'long'}, None))
+
+        self.now += 50
+        self.assertIsNone(short.get('key'))
+        self.assertEqual(long.get('key'), {'value': 'long'})
+        self.assertEqual((short.stats()['hits'], short.stats()['misses']), (1, 1))
+        self.assertEqual(set(self.store.stats()), {'long'})
+
+    def test_expired_entries_are_evicted_first(self):
+        from rag_core_app.disk_cache import DiskTTLCache
+
+        store = DiskTTLCache(self.store.path.replace('shared', 'small'), 1000)
+        store.set('a', 'stale', bytes(400), ttl=5)
+        store.set('a', 'fresh', bytes(400), ttl=500)
+        self.now += 10
+        store.set('b', 'new', bytes(400), ttl=500)
+        self.assertIsNone(store.get('a', 'stale'))
+        self.assertIsNotNone(store.get('a', 'fresh'))
+        conn = store._conn()
+        self.assertEqual(conn.execute("SELECT total_bytes FROM meta").fetchone()[0], 800)
+        writes = conn.total_changes
+        store.get('b', 'new')
+        self.assertEqual(conn.total_changes, writes)
+
+    def test_repeated_query_is_embedded_once(self):
+        from rag_core_app.embedding_cache import CachedEmbeddings, bytes_to_vector, vector_to_bytes
+
+        model = mock.Mock(wraps=_WordEmbeddings())
+        embeddings = CachedEmbeddings(
+            model, 'words', mock.Mock(),
+            query_cache=self.cache.namespace('query_embedding', 60, dumps=vector_to_bytes, loads=bytes_to_vector),
+        )
+        first = embeddings.embed_query('what is in the report')
+        self.assertEqual(embeddings.embed_query('what is in the report'), first)
+        self.assertEqual(model.embed_query.call_count, 1)
+
+    def test_llm_intent_decisions_are_remembered(self):
+        from rag_core_app.intent_router import CHAT, IntentRouter
+
+        llm = mock.Mock(return_value=CHAT)
+        router = IntentRouter(lambda: None, llm_fallback=llm, cache=self.cache.namespace('intent', 60))
+        self.assertEqual(router.classify('the blue one please').method, 'llm')
+        decision = router.classify('the blue one please')
+        self.assertEqual((decision.label, decision.method), (CHAT, 'cache'))
+        self.assertEqual(llm.call_count, 1)
+
+        # Without a model or an LLM the router guesses QUERY, and doesn't remember the guess.
+        guessing = IntentRouter(lambda: None, cache=self.cache.namespace('intent_guess', 60))
+        self.assertEqual(guessing.classify('the red one please').method, 'default')
+        self.assertEqual(guessing.classify('the red one please').method, 'default')
+
+
+class SpreadsheetIngestionTests(SimpleTestCase):
+    """Streaming CSV/XLSX loaders and segment-by-segment writing of large uploads."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def write_csv(self, name, rows, encoding='utf-8'):
+        import csv
+
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding=encoding, newline='') as fh:
+            csv.writer(fh).writerows(rows)
+        return path
+
+    def test_csv_rows_are_grouped_under_the_header(self):
+        from rag_core_app.spreadsheet_loader import iter_csv_documents
+
+        rows = [['id', 'name', 'city']] + [[i, f'person {i}', 'Zürich', '', ''] for i in range(1, 201)]
+        rows.insert(50, [])
+        docs = list(iter_csv_documents(self.write_csv('people.csv', rows, encoding='utf-8-sig'), max_chars=300))
+
+        self.assertGreater(len(docs), 10)
+        covered = []
+        for doc in docs:
+            lines = doc.page_content.split('\n')
+            self.assertEqual(lines[0], 'id | name | city')
+            self.assertLessEqual(len(doc.page_content), 300)
+            covered += lines[1:]
+        # Every row exactly once, in order, without the blank row or trailing empty cells.
+        self.assertEqual(covered, [f'{i} | person {i} | Zürich' for i in range(1, 201)])
+        self.assertEqual((docs[0].metadata['row_start'], docs[-1].metadata['row_end']), (2, 202))
+
+    def test_csv_in_a_legacy_encoding_is_read(self):
+        from rag_core_app.spreadsheet_loader import iter_csv_documents
+
+        path = self.write_csv('legacy.csv', [['name'], ['Café Müller']], encoding='latin-1')
+        self.assertEqual([d.page_content for d in iter_csv_documents(path)], ['name\nCafé Müller'])
+
+    def test_every_sheet_gets_its_own_header(self):
+        import openpyxl
+
+        from rag_core_app.spreadsheet_loader import iter_xlsx_documents
+
+        wb = openpyxl.Workbook()
+        wb.active.title = 'Orders'
+        wb.active.append(['order', 'total'])
+        for i in range(40):
+            wb.active.append([f'A-{i}', i * 10])
+        wb.create_sheet('Empty')
+        refunds = wb.create_sheet('Refunds')
+        refunds.append(['order', 'reason'])
+        refunds.append(['A-3', 'damaged'])
+        path = os.path.join(self.dir, 'book.xlsx')
+        wb.save(path)
+
+        docs = list(iter_xlsx_documents(path, max_chars=200))
+        self.assertEqual({d.metadata['sheet'] for d in docs}, {'Orders', 'Refunds'})
+        for doc in docs:
+            self.assertTrue(doc.page_content.startswith(f"--- Sheet: {doc.metadata['sheet']} ---\n"))
+        self.assertEqual(sum(d.page_content.count('A-') for d in docs if d.metadata['sheet'] == 'Orders'), 40)
+        self.assertEqual(docs[-1].page_content, '--- Sheet: Refunds ---\norder | reason\nA-3 | damaged')
+
+    def test_large_upload_is_written_in_several_segments(self):
+        from django.test import override_settings
+
+        from rag_core_app import rag_utils
+        from rag_core_app.segment_store import indexed_sources, load_segments, read_manifest
+
+        big = self.write_csv('big.csv', [['id', 'note']] + [[i, f'note number {i} ' * 20] for i in range(300)])
+        small = self.write_csv('small.csv', [['id', 'note'], [1, 'a short file']])
+        db_path = os.path.join(self.dir, 'index')
+        embeddings = _WordEmbeddings()
+        with override_settings(INGESTION_SEGMENT_CHUNKS=1, EMBEDDING_BATCH_SIZE=8, EMBEDDING_WORKERS=0), \
+                mock.patch.object(rag_utils, 'get_embeddings', return_value=embeddings), \
+                mock.patch.object(rag_utils, 'get_db_path', return_value=db_path), \
+                mock.patch.object(rag_utils, '_schedule_compaction'):
+            self.assertTrue(rag_utils.process_files_bulk([big, small], 'segments-test'))
+        rag_utils.SESSION_INDEX_CACHE.invalidate('segments-test')
+
+        manifest = read_manifest(db_path)
+        self.assertGreater(len(manifest['segments']), 2)
+        self.assertEqual(indexed_sources(db_path), {big, small})
+        index = load_segments(db_path, embeddings)
+        hits = index.store.similarity_search('note', k=index.store.index.ntotal)
+        self.assertEqual(len(hits), index.store.index.ntotal)
+        self.assertEqual({d.metadata['source'] for d in hits}, {big, small})
+
+
+class PdfOcrTests(SimpleTestCase):
+    """OCR of PDF pages without a text layer, and the content-addressed OCR cache."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def options(self):
+        from rag_core_app.pdf_pipeline import OcrOptions
+
+        return OcrOptions(dpi=50, lang='eng', psm=3, min_text_chars=20, poppler_path=None, tesseract_cmd=None,
+                          cache_path=os.path.join(self.dir, 'ocr.sqlite3'), cache_max_bytes=1024 * 1024)
+
+    def test_pages_without_a_text_layer_are_ocred(self):
+        import pymupdf
+
+        from rag_core_app import pdf_pipeline
+
+        path = os.path.join(self.dir, 'mixed.pdf')
+        with pymupdf.open() as doc:
+            doc.new_page().insert_text((72, 72), 'This page has a proper text layer to extract.')
+            doc.new_page()  # a scan: no text at all
+            doc.save(path)
+
+        ocr = mock.Mock()
+        ocr.image_to_string.return_value = 'recognized text'
+        with mock.patch.object(pdf_pipeline, 'get_ocr', return_value=ocr), \
+                mock.patch.object(pdf_pipeline, '_render_page', return_value='image'):
+            pages = sorted(pdf_pipeline.iter_pdf_pages(path, self.options(), workers=0, pages_per_task=1))
+
+        self.assertIn('proper text layer', pages[0][1])
+        self.assertFalse(pages[0][2])
+        self.assertEqual(pages[1], (1, 'recognized text', True, 2))
+        ocr.image_to_string.assert_called_once_with('image', dpi=50)
+
+    def test_repeated_images_are_recognized_once(self):
+        from io import BytesIO
+
+        from PIL import Image
+
+        from rag_core_app.disk_cache import DiskLRUCache
+        from rag_core_app.ocr_cache import CachedOcr
+
+        store = DiskLRUCache(os.path.join(self.dir, 'ocr.sqlite3'), 1024 * 1024)
+        ocr = CachedOcr(store)
+        image = Image.new('RGB', (8, 8), 'white')
+        png = BytesIO()
+        image.save(png, format='PNG')
+        with mock.patch.object(CachedOcr, '_recognize', return_value='scanned words') as recognize:
+            self.assertEqual(ocr.image_bytes_to_string(png.getvalue()), 'scanned words')
+            self.assertEqual(ocr.image_bytes_to_string(png.getvalue()), 'scanned words')
+            # Another process with its own CachedOcr hits the shared file as well.
+            self.assertEqual(CachedOcr(store).image_bytes_to_string(png.getvalue()), 'scanned words')
+            ocr.image_to_string(image, dpi=300)
+            ocr.image_to_string(image, dpi=300)
+            ocr.image_to_string(image, dpi=150)  # a different rendering is a different key
+
+        self.assertEqual(recognize.call_count, 3)
+        self.assertEqual((ocr.stats()['hits'], ocr.stats()['misses']), (2, 3))
+
+
+class LazyModelTests(SimpleTestCase):
+    """Models are built on first use, once per process, and a failed build is retried."""
+
+    def setUp(self):
+        from rag_core_app import rag_utils
+
+        self.rag_utils = rag_utils
+        self.addCleanup(rag_utils._models.pop, 'test_model', None)
+
+    def test_concurrent_first_use_builds_once(self):
+        built = []
+
+        def factory():
+            time.sleep(0.05)
+            built.append(object())
+            return built[-1]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.rag_utils._get_model('test_model', factory)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(built), 1)
+        self.assertEqual(results, built * 8)
+
+    def test_failed_build_is_retried(self):
+        factory = mock.Mock(side_effect=[RuntimeError('model download failed'), 'model'])
+        self.assertIsNone(self.rag_utils._get_model('test_model', factory))
+        self.assertEqual(self.rag_utils._get_model('test_model', factory), 'model')
+        self.assertEqual(self.rag_utils._get_model('test_model', factory), 'model')
+        self.assertEqual(factory.call_count, 2)
+
+
+class SessionIndexCacheTests(SimpleTestCase):
+    """The per-process LRU of loaded session indexes: bounds, expiry and signatures."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patch = mock.patch('rag_core_app.index_cache.time.monotonic', lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        from rag_core_app.index_cache import SessionIndexCache
+
+        cache = SessionIndexCache(max_entries=2, max_bytes=100, ttl=0)
+        cache.put('a', 'A', 1, size=10)
+        cache.put('b', 'B', 1, size=10)
+        self.assertEqual(cache.get('a', 1), 'A')
+        cache.put('c', 'C', 1, size=10)  # over max_entries: evicts b, read less recently than a
+        self.assertEqual((cache.get('a', 1), cache.get('b', 1), cache.get('c', 1)), ('A', None, 'C'))
+        cache.put('d', 'D', 1, size=95)  # over max_bytes: evicts both others
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['bytes'], 95)
+        cache.put('e', 'E', 1, size=101)  # larger than the whole cache: not kept
+        self.assertIsNone(cache.get('e', 1))
+        self.assertEqual(cache.stats()['evictions'], 3)
+
+    def test_expired_or_rewritten_entries_are_dropped(self):
+        from rag_core_app.index_cache import SessionIndexCache
+
+        cache = SessionIndexCache(max_entries=4, max_bytes=100, ttl=60)
+        cache.put('a', 'A', 'v1', size=10)
+        cache.put('b', 'B', 'v1', size=10)
+        self.assertIsNone(cache.get('a', 'v2'))  # another worker rewrote the index
+        self.now += 61
+        self.assertIsNone(cache.get('b', 'v1'))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_peek_leaves_stats_and_recency_alone(self):
+        from rag_core_app.index_cache import SessionIndexCache
+
+        cache = SessionIndexCache(max_entries=2, max_bytes=100, ttl=0)
+        cache.put('a', 'A', 1, size=10)
+        cache.put('b', 'B', 1, size=10)
+        self.assertEqual(cache.peek('a', 1), 'A')
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (0, 0))
+        cache.put('c', 'C', 1, size=10)
+        # The peek didn't make a recently used, so it was evicted rather than b.
+        self.assertEqual((cache.peek('a', 1), cache.peek('b', 1)), (None, 'B'))
+        self.assertIsNone(cache.peek('b', 2))  # stale: dropped, as by get
+        self.assertEqual(cache.stats()['entries'], 1)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    """Content-addressed chunk embeddings and the batched embedding pipeline."""
+
+    def setUp(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+        from rag_core_app.embedding_cache import CachedEmbeddings
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.model = mock.Mock(wraps=_WordEmbeddings())
+        self.embeddings = CachedEmbeddings(
+            self.model, 'words', DiskLRUCache(os.path.join(directory.name, 'emb.sqlite3'), 1024 * 1024)
+        )
+
+    def embedded_texts(self):
+        return [text for call in self.model.embed_documents.call_args_list for text in call.args[0]]
+
+    def test_each_distinct_chunk_is_embedded_once(self):
+        first = self.embeddings.embed_documents(['red apple', 'green pear', 'red apple'])
+        second = self.embeddings.embed_documents(['green pear', 'blue plum'])
+
+        self.assertEqual(self.embedded_texts(), ['red apple', 'green pear', 'blue plum'])
+        self.assertEqual(first[0], first[2])
+        self.assertEqual(second[0], first[1])
+        self.assertEqual(second[1], _WordEmbeddings().embed_query('blue plum'))
+        self.assertEqual((self.embeddings.stats()['hits'], self.embeddings.stats()['misses']), (2, 3))
+
+    def test_unreadable_cache_falls_back_to_the_model(self):
+        self.embeddings.store = mock.Mock(get_many=mock.Mock(side_effect=OSError('disk I/O error')),
+                                          set_many=mock.Mock(side_effect=OSError('disk I/O error')))
+        self.assertEqual(self.embeddings.embed_documents(['red apple']), [_WordEmbeddings().embed_query('red apple')])
+
+    def test_batches_cover_every_text_and_skip_cached_ones(self):
+        from rag_core_app.embedding_pipeline import BatchEmbedder
+
+        self.embeddings.embed_documents(['text 3', 'text 4'])
+        texts = [f'text {i}' for i in range(10)]
+        embedder = BatchEmbedder(self.embeddings, batch_size=4)
+        batches = list(embedder.iter_batches(texts))
+
+        self.assertEqual([start for start, _ in batches], [0, 4, 8])
+        vectors = [vector.tolist() for _, batch in batches for vector in batch]
+        self.assertEqual(vectors, _WordEmbeddings().embed_documents(texts))
+        self.assertEqual((embedder.embedded, embedder.cached), (10, 2))
+        self.assertEqual(sorted(self.embedded_texts()), sorted(texts))
+
+    def test_broken_pool_finishes_remaining_batches_in_process(self):
+        from concurrent.futures.process import BrokenProcessPool
+
+        from rag_core_app.embedding_pipeline import BatchEmbedder
+
+        embedder = BatchEmbedder(self.embeddings, batch_size=2, workers=2)
+
+        def crashing_pool(batches):
+            start, batch = batches[1]
+            embedder._done = {start}
+            yield start, embedder._finish(*embedder._split(batch), self.model.embed_documents)
+            raise BrokenProcessPool('worker died')
+
+        texts = [f'text {i}' for i in range(6)]
+        with mock.patch.object(embedder, '_iter_pool', crashing_pool), \
+                mock.patch('rag_core_app.embedding_pipeline.shutdown_process_pool'):
+            starts = [start for start, _ in embedder.iter_batches(texts)]
+        self.assertEqual(starts, [2, 0, 4])
+        self.assertEqual(embedder.embedded, 6)
+
+
+class IntentRouterTests(SimpleTestCase):
+    """CHAT/QUERY routing: keyword fast paths, nearest centroid, and the LLM for close calls."""
+
+    def router(self, **kwargs):
+        from rag_core_app.intent_router import CHAT_EXAMPLES, IntentRouter
+
+        # Every CHAT example points one way and every QUERY example the other.
+        self.embeddings = mock.Mock()
+        self.embeddings.embed_documents.side_effect = lambda texts: [
+            [1.0, 0.0] if text in CHAT_EXAMPLES else [0.0, 1.0] for text in texts
+        ]
+        return IntentRouter(lambda: self.embeddings, **kwargs)
+
+    def test_obvious_inputs_are_decided_by_keywords(self):
+        from rag_core_app.intent_router import CHAT, QUERY, keyword_intent
+
+        for text in ['hi', 'Hello there!', 'thanks so much :)', 'good morning', '   ']:
+            self.assertEqual(keyword_intent(text), CHAT, text)
+        for text in ['summarize the report', 'what is RAG?', 'see https://example.com', 'x = [1, 2]',
+                     'one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen']:
+            self.assertEqual(keyword_intent(text), QUERY, text)
+        for text in ['the blue one please', 'hi, can you check my totals']:
+            self.assertIsNone(keyword_intent(text), text)
+
+    def test_keyword_decisions_skip_the_embedding(self):
+        from rag_core_app.intent_router import CHAT
+
+        router = self.router()
+        vector = mock.Mock()
+        decision = router.classify('hello', query_vector=vector)
+        self.assertEqual((decision.label, decision.method), (CHAT, 'keyword'))
+        vector.assert_not_called()
+        self.embeddings.embed_documents.assert_not_called()
+
+    def test_nearest_centroid_decides_clear_cases(self):
+        from rag_core_app.intent_router import CHAT, QUERY
+
+        llm = mock.Mock()
+        router = self.router(llm_fallback=llm)
+        chat = router.classify('the blue one please', query_vector=[0.9, 0.1])
+        query = router.classify('my totals for march', query_vector=lambda: [0.2, 0.8])
+        self.assertEqual((chat.label, chat.method), (CHAT, 'embedding'))
+        self.assertEqual((query.label, query.method), (QUERY, 'embedding'))
+        self.assertAlmostEqual(chat.confidence, 0.8 / (0.82 ** 0.5), places=5)
+        llm.assert_not_called()
+        self.assertEqual(self.embeddings.embed_documents.call_count, 2)  # centroids built once
+
+    def test_close_calls_go_to_the_llm_or_default_to_query(self):
+        from rag_core_app.intent_router import CHAT, QUERY
+
+        router = self.router(llm_fallback=mock.Mock(return_value=CHAT))
+        decision = router.classify('the blue one please', query_vector=[0.5, 0.51])
+        self.assertEqual((decision.label, decision.method), (CHAT, 'llm'))
+        decision = router.classify('the blue one please', query_vector=[0.5, 0.51], use_fallback=False)
+        self.assertEqual((decision.label, decision.method), (QUERY, 'default'))
+
+        router.llm_fallback.side_effect = RuntimeError('rate limited')
+        decision = router.classify('the red one please', query_vector=[0.5, 0.51])
+        self.assertEqual((decision.label, decision.method), (QUERY, 'default'))
+
+
+class ChatStageTests(SimpleTestCase):
+    """get_answer runs history, retrieval and routing side by side on the stage executor."""
+
+    def setUp(self):
+        from rag_core_app import rag_utils
+        from rag_core_app.context_packing import Candidate
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.rag_utils = rag_utils
+        self.candidates = [Candidate('The launch is on Friday.', None, 'notes.txt')]
+        self.prompts = []
+
+        def stream_answer(template, inputs, timings):
+            self.prompts.append((template, inputs))
+            yield 'answer'
+
+        patches = [
+            mock.patch.object(rag_utils, 'get_db_path', return_value=directory.name),
+            mock.patch.object(rag_utils, '_stream_answer', stream_answer),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def answer(self, fetch_history, retrieve_context, classify):
+        with mock.patch.object(self.rag_utils, '_fetch_history', fetch_history), \
+                mock.patch.object(self.rag_utils, '_retrieve_context', retrieve_context), \
+                mock.patch.object(self.rag_utils.INTENT_ROUTER, 'classify', classify):
+            return ''.join(self.rag_utils.get_answer('when is the launch', 1))
+
+    def test_stages_overlap_and_share_the_query_vector(self):
+        from rag_core_app.intent_router import QUERY, IntentDecision
+
+        # Each stage waits for the other two, so this only completes if they run concurrently.
+        barrier = threading.Barrier(3, timeout=5)
+        routed_with = []
+
+        def fetch_history(session_id, timings):
+            barrier.wait()
+            return ['User: hello']
+
+        def retrieve_context(query, session_id, query_vector, timings):
+            query_vector.set_result([0.5, 0.5])
+            barrier.wait()
+            return self.candidates, 'Uploaded Document'
+
+        def classify(query, query_vector=None):
+            barrier.wait()
+            routed_with.append(query_vector())
+            return IntentDecision(QUERY, 1.0, 'embedding', 0.0)
+
+        self.assertEqual(self.answer(fetch_history, retrieve_context, classify), 'answer')
+        self.assertEqual(routed_with, [[0.5, 0.5]])
+        template, inputs = self.prompts[0]
+        self.assertEqual(template, self.rag_utils.ANSWER_TEMPLATE)
+        self.assertIn('The launch is on Friday.', inputs['context'])
+        self.assertIn('User: hello', inputs['history'])
+
+    def test_chat_turns_discard_the_retrieval(self):
+        from rag_core_app.intent_router import CHAT, IntentDecision
+
+        def retrieve_context(query, session_id, query_vector, timings):
+            query_vector.set_result(None)
+            return self.candidates, 'Uploaded Document'
+
+        classify = mock.Mock(return_value=IntentDecision(CHAT, 1.0, 'keyword', 0.0))
+        self.answer(lambda session_id, timings: [], retrieve_context, classify)
+        template, inputs = self.prompts[0]
+        self.assertEqual(template, self.rag_utils.CHAT_TEMPLATE)
+        self.assertNotIn('context', inputs)
+
+    def test_routing_failure_answers_from_the_context(self):
+        classify = mock.Mock(side_effect=RuntimeError('router down'))
+
+        def retrieve_context(query, session_id, query_vector, timings):
+            query_vector.set_result(None)
+            return self.candidates, 'Uploaded Document'
+
+        self.answer(lambda session_id, timings: [], retrieve_context, classify)
+        template, inputs = self.prompts[0]
+        self.assertEqual(template, self.rag_utils.ANSWER_TEMPLATE)
+        self.assertEqual(inputs['source'], 'Uploaded Document')
+
+
+class HybridRetrievalTests(SimpleTestCase):
+    """BM25 keyword search fused with vector search by reciprocal rank."""
+
+    def test_codes_are_kept_whole_and_split(self):
+        from rag_core_app.keyword_index import tokenize
+
+        self.assertEqual(tokenize('Order AX-2291 of the v1.2 release'),
+                         ['order', 'ax-2291', 'ax', '2291', 'v1.2', 'v1', '2', 'release'])
+
+    def test_bm25_ranks_rare_exact_terms_first(self):
+        from rag_core_app.keyword_index import BM25Index
+
+        index = BM25Index()
+        index.add('a', 'the invoice total for march')
+        index.add('b', 'invoice AX-2291 was paid late')
+        index.add('c', 'every invoice lists a total and an invoice date')
+        self.assertEqual([doc_id for doc_id, _ in index.search('AX-2291 invoice')], ['b', 'c', 'a'])
+        self.assertEqual([doc_id for doc_id, _ in index.search('invoice', k=1)], ['c'])
+        self.assertEqual(index.search('unrelated words'), [])
+
+    def test_saved_and_merged_indexes_score_like_one_index(self):
+        from rag_core_app.keyword_index import BM25Index
+
+        texts = {f'd{i}': f'note {i} about topic{i % 3} and colour{i % 4}' for i in range(9)}
+        whole, first, second = BM25Index(), BM25Index(), BM25Index()
+        for number, (doc_id, text) in enumerate(texts.items()):
+            whole.add(doc_id, text)
+            (first if number < 5 else second).add(doc_id, text)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'keywords.json')
+        second.save(path)
+        merged = first.merge(BM25Index.load(path))
+        for query in ['topic1 colour2', 'note 7', 'colour0']:
+            self.assertEqual(merged.search(query), whole.search(query))
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        from rag_core_app.retrieval import reciprocal_rank_fusion
+
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'a']], k=60)
+        self.assertEqual([doc_id for doc_id, _ in fused], ['a', 'c', 'b'])
+        self.assertAlmostEqual(fused[0][1], 1 / 61 + 1 / 62)
+
+    def test_keyword_only_matches_reach_the_results(self):
+        from langchain_community.vectorstores import FAISS
+
+        from rag_core_app.retrieval import hybrid_search, vector_search
+        from rag_core_app.segment_store import SessionIndex
+
+        embeddings = _WordEmbeddings()
+        texts = [f'meeting notes from week {i} about hiring plans' for i in range(8)]
+        texts.append('ticket RX-77 blocks the release')
+        index = SessionIndex(FAISS.from_texts(texts, embeddings))
+
+        # A vector that only resembles the meeting notes: the ticket is found by BM25 alone.
+        vector = embeddings.embed_query('meeting notes hiring plans')
+        ticket = index.store.index_to_docstore_id[8]
+        self.assertNotIn(ticket, [doc_id for doc_id, _ in vector_search(index.store, vector, 3)])
+        results, timings = hybrid_search(index, 'RX-77', vector, k=3, candidates=3)
+        self.assertEqual(len(results), 3)
+        self.assertIn(ticket, [doc_id for _, _, doc_id in results[:2]])  # tied with the best vector hit
+        self.assertEqual(set(timings), {'vector_ms', 'keyword_ms', 'fusion_ms'})
+
+
+class OcrCacheTests(SimpleTestCase):
+    """The shared OCR cache: keys by content and settings, size-bounded, never fatal."""
+
+    def setUp(self):
+        from rag_core_app.disk_cache import DiskLRUCache
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        self.store = DiskLRUCache(os.path.join(directory.name, 'ocr.sqlite3'), 1024 * 1024)
+        patch = mock.patch('rag_core_app.ocr_cache.CachedOcr._recognize', return_value='scanned words')
+        self.recognize = patch.start()
+        self.addCleanup(patch.stop)
+
+    def png(self, colour='white'):
+        from io import BytesIO
+
+        from PIL import Image
+
+        data = BytesIO()
+        Image.new('RGB', (8, 8), colour).save(data, format='PNG')
+        return data.getvalue()
+
+    def test_ocr_settings_are_part_of_the_key(self):
+        from rag_core_app.ocr_cache import CachedOcr
+
+        image = self.png()
+        for ocr in [CachedOcr(self.store), CachedOcr(self.store, lang='deu'), CachedOcr(self.store, psm=6),
+                    CachedOcr(self.store)]:
+            ocr.image_bytes_to_string(image)
+        self.assertEqual(self.recognize.call_count, 3)
+        CachedOcr(self.store).image_bytes_to_string(self.png('black'))
+        self.assertEqual(self.recognize.call_count, 4)
+
+    def test_cache_failures_fall_back_to_tesseract(self):
+        from rag_core_app.ocr_cache import CachedOcr
+
+        broken = mock.Mock(get=mock.Mock(side_effect=OSError('locked')), set=mock.Mock(side_effect=OSError('full')))
+        ocr = CachedOcr(broken)
+        self.assertEqual(ocr.image_bytes_to_string(self.png()), 'scanned words')
+        self.assertEqual((ocr.stats()['hits'], ocr.stats()['misses']), (0, 1))
+
+    def test_uploaded_images_are_recognized_once_across_sessions(self):
+        from rag_core_app import rag_utils
+        from rag_core_app.ocr_cache import CachedOcr, ocr_metrics
+
+        ocr = CachedOcr(self.store)
+        paths = []
+        for session in ('one', 'two'):
+            paths.append(os.path.join(self.dir, f'{session}-scan.png'))
+            with open(paths[-1], 'wb') as fh:
+                fh.write(self.png())
+        with mock.patch.object(rag_utils, 'get_ocr', return_value=ocr):
+            docs = [rag_utils.load_single_file(path) for path in paths]
+
+        self.assertEqual([[d.page_content for d in loaded] for loaded in docs], [['scanned words']] * 2)
+        self.assertEqual(docs[1][0].metadata['source'], paths[1])
+        self.assertEqual(self.recognize.call_count, 1)
+        self.assertEqual(ocr_metrics([ocr])[3], [({'result': 'hit'}, 1), ({'result': 'miss'}, 1)])
+
+
+class AsyncAnswerTests(SimpleTestCase):
+    """aget_answer streams without blocking the event loop while stages run on threads."""
+
+    def setUp(self):
+        from rag_core_app import rag_utils
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.rag_utils = rag_utils
+        self.prompts = []
+
+        async def afetch_history(session_id, timings):
+            return ['User: earlier question']
+
+        async def astream_answer(template, inputs, timings):
+            self.prompts.append((template, inputs))
+            for token in ['An ', 'answer.']:
+                yield token
+
+        patches = [
+            mock.patch.object(rag_utils, 'get_db_path', return_value=directory.name),
+            mock.patch.object(rag_utils, '_afetch_history', afetch_history),
+            mock.patch.object(rag_utils, '_astream_answer', astream_answer),
+            mock.patch.object(rag_utils.INTENT_ROUTER, 'cached', return_value=None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def collect(self, query):
+        import asyncio
+
+        async def run():
+            return [chunk async for chunk in self.rag_utils.aget_answer(query, 1)]
+
+        return asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+    def test_retrieval_on_a_stage_thread_leaves_the_loop_free(self):
+        import asyncio
+
+        from rag_core_app.context_packing import Candidate
+        from rag_core_app.intent_router import QUERY, IntentDecision
+
+        loop_ran = threading.Event()
+        routed_with = []
+
+        def retrieve_context(query, session_id, query_vector, timings):
+            query_vector.set_result([0.1, 0.9])
+            # Only set by a coroutine, so this waits forever if the loop is blocked.
+            self.assertTrue(loop_ran.wait(timeout=5))
+            return [Candidate('Budget is 4000 EUR.', None, 'budget.pdf')], 'Uploaded Document'
+
+        def classify(query, query_vector=None):
+            routed_with.append(query_vector)
+            return IntentDecision(QUERY, 0.5, 'embedding', 0.0)
+
+        async def ticker():
+            await asyncio.sleep(0.01)
+            loop_ran.set()
+
+        async def run():
+            task = asyncio.ensure_future(ticker())
+            chunks = [chunk async for chunk in self.rag_utils.aget_answer('budget for the offsite', 1)]
+            await task
+            return chunks
+
+        with mock.patch.object(self.rag_utils, '_retrieve_context', retrieve_context), \
+                mock.patch.object(self.rag_utils.INTENT_ROUTER, 'classify', classify):
+            chunks = asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+        self.assertEqual(''.join(chunks), 'An answer.')
+        self.assertEqual(routed_with, [[0.1, 0.9]])
+        template, inputs = self.prompts[0]
+        self.assertEqual(template, self.rag_utils.ANSWER_TEMPLATE)
+        self.assertIn('Budget is 4000 EUR.', inputs['context'])
+        self.assertIn('User: earlier question', inputs['history'])
+
+    def test_small_talk_is_answered_without_the_query_vector(self):
+        def retrieve_context(query, session_id, query_vector, timings):
+            query_vector.set_result(None)
+            return [], 'Uploaded Document'
+
+        with mock.patch.object(self.rag_utils, '_retrieve_context', retrieve_context):
+            self.assertEqual(''.join(self.collect('thanks!')), 'An answer.')
+        self.rag_utils.INTENT_ROUTER.cached.assert_not_called()
+        self.assertEqual(self.prompts[0][0], self.rag_utils.CHAT_TEMPLATE)
+
+
+class IndexFactoryTests(SimpleTestCase):
+    """Flat, HNSW or IVF session indexes chosen by size, with optional quantization."""
+
+    def vectors(self, n, d=32, seed=0):
+        import numpy as np
+
+        return np.random.default_rng(seed).standard_normal((n, d)).astype('float32')
+
+    def test_index_type_follows_the_session_size(self):
+        from rag_core_app.index_factory import choose_spec
+
+        options = {'flat_max': 100, 'hnsw_max': 1000}
+        self.assertEqual(choose_spec(100, 384, **options), 'Flat')
+        self.assertEqual(choose_spec(101, 384, **options), 'HNSW32')
+        self.assertEqual(choose_spec(101, 384, quantization='sq8', **options), 'HNSW32_SQ8')
+        self.assertEqual(choose_spec(101, 384, quantization='pq', **options), 'HNSW32_SQ8')
+        self.assertEqual(choose_spec(10000, 384, **options), 'IVF256,Flat')
+        self.assertEqual(choose_spec(10000, 384, quantization='pq', **options), 'IVF256,PQ48')
+        self.assertEqual(choose_spec(2000, 30, quantization='sq8', **options), 'IVF51,SQ8')
+        with self.assertRaises(ValueError):
+            choose_spec(10, 384, quantization='int4')
+
+    def test_growing_index_is_rebuilt_with_the_same_ids(self):
+        import faiss
+
+        from rag_core_app.index_factory import fit_index, fits, index_kind, reconstruct
+
+        vectors = self.vectors(300)
+        flat = faiss.IndexFlatL2(32)
+        flat.add(vectors[:50])
+        options = {'flat_max': 100, 'hnsw_max': 200}
+        self.assertIs(fit_index(flat, **options), flat)
+        self.assertFalse(fits(flat, count=150, **options))
+
+        flat.add(vectors[50:150])
+        hnsw = fit_index(flat, **options)
+        self.assertEqual((index_kind(hnsw), hnsw.ntotal), ('IndexHNSWFlat', 150))
+        self.assertEqual(hnsw.search(vectors[[7, 120]], 1)[1].ravel().tolist(), [7, 120])
+        self.assertEqual(reconstruct(hnsw, [3]).tolist(), vectors[[3]].tolist())
+
+        hnsw.add(vectors[150:])
+        ivf = fit_index(hnsw, **options)
+        self.assertEqual((index_kind(ivf), ivf.ntotal), ('IndexIVFFlat', 300))
+        self.assertTrue(fits(ivf, **options))
+        self.assertEqual(ivf.search(vectors[[7, 250]], 1)[1].ravel().tolist(), [7, 250])
+        self.assertEqual(reconstruct(ivf, [250]).tolist(), vectors[[250]].tolist())
+
+    def test_quantized_ivf_keeps_recall(self):
+        from rag_core_app.index_factory import build_index, choose_spec, index_bytes
+
+        vectors = self.vectors(2000)
+        spec = choose_spec(len(vectors), 32, flat_max=100, hnsw_max=1000, quantization='sq8')
+        index = build_index(vectors, spec, nprobe=51)
+        queries = vectors[::100] + 0.01
+        found = index.search(queries, 1)[1].ravel().tolist()
+        self.assertGreaterEqual(sum(a == b for a, b in zip(found, range(0, 2000, 100))), 19)
+        self.assertLess(index_bytes(index), vectors.nbytes / 2)
+
+
+class MappedIndexTests(SimpleTestCase):
+    """Session indexes memory-mapped from their segments rather than read into the heap."""
+
+    def setUp(self):
+        from rag_core_app import rag_utils
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'session')
+        self.embeddings = _WordEmbeddings()
+        self.rag_utils = rag_utils
+        self.addCleanup(rag_utils.SESSION_INDEX_CACHE.invalidate, 'mapped-test')
+
+    def append(self, texts, source):
+        from langchain_community.vectorstores import FAISS
+        from rag_core_app.segment_store import SessionIndex, append_segment
+
+        store = FAISS.from_texts(texts, self.embeddings, metadatas=[{'source': source}] * len(texts))
+        append_segment(self.db_path, SessionIndex(store), sources=[source])
+
+    def test_only_the_chunks_of_hits_are_read(self):
+        from rag_core_app.chunk_store import ChunkFile
+        from rag_core_app.segment_store import load_segments
+
+        self.append([f'chapter {i} of the handbook covers rule{i}' for i in range(50)], 'handbook.pdf')
+        with mock.patch.object(ChunkFile, 'read', autospec=True, side_effect=ChunkFile.read) as read:
+            index = load_segments(self.db_path, self.embeddings, mmap=True)
+            self.assertEqual(read.call_count, 0)
+            hits = index.store.similarity_search('rule7', k=2)
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual(hits[0].page_content, 'chapter 7 of the handbook covers rule7')
+        self.assertEqual((index.mapped, index.heap_vectors), (True, 0))
+
+    def test_workers_map_the_session_and_drop_heap_merges(self):
+        import faiss
+
+        from rag_core_app.segment_store import index_signature
+
+        patches = [
+            mock.patch.object(self.rag_utils, 'FAISS_MMAP', True),
+            mock.patch.object(self.rag_utils, 'get_db_path', return_value=self.db_path),
+            mock.patch.object(self.rag_utils, 'get_embeddings', return_value=self.embeddings),
+            mock.patch.object(self.rag_utils, '_compaction_executor', mock.Mock(submit=lambda run: run())),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.append(['first upload about apples'], 'a.txt')
+        self.append(['second upload about pears'], 'b.txt')
+        index = self.rag_utils.load_session_index('mapped-test')
+        self.assertTrue(index.mapped)
+        self.assertIsInstance(index.store.index, faiss.IndexShards)
+        self.assertIs(self.rag_utils.load_session_index('mapped-test'), index)
+
+        self.rag_utils._schedule_compaction('mapped-test')
+        # The in-heap merge isn't cached; the next read maps the compacted segment.
+        self.assertIsNone(self.rag_utils.SESSION_INDEX_CACHE.peek('mapped-test', index_signature(self.db_path)))
+        compacted = self.rag_utils.load_session_index('mapped-test')
+        self.assertIsNot(compacted, index)
+        self.assertTrue(compacted.mapped)
+        self.assertNotIsInstance(compacted.store.index, faiss.IndexShards)
+        self.assertEqual(compacted.store.similarity_search('pears', k=1)[0].page_content, 'second upload about pears')
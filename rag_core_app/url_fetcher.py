@@ -0,0 +1,229 @@
+import concurrent.futures
+import io
+import json
+import re
+import threading
+import zipfile
+from collections import namedtuple
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Imported by the ingestion pipeline and its tests, so no Django here.
+
+FetchResult = namedtuple("FetchResult", "url status kind body content_type not_modified error")
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def sniff_kind(body, content_type="", url=""):
+    """The kind of document in `body`: 'pdf', 'image', 'docx', 'xlsx', 'pptx', 'csv', 'html' or 'text'.
+
+    Magic bytes win over the Content-Type header, which wins over the URL's extension;
+    None when the body is binary in some format we can't index.
+    """
+    head = body[:1024]
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith((b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a")) or (
+        head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+    ):
+        return "image"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            names = zipfile.ZipFile(io.BytesIO(body)).namelist()
+        except zipfile.BadZipFile:
+            return None
+        for prefix, kind in (("word/", "docx"), ("xl/", "xlsx"), ("ppt/", "pptx")):
+            if any(name.startswith(prefix) for name in names):
+                return kind
+        return None
+
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith((b"<!doctype html", b"<html")) or b"<head" in text or b"<body" in text:
+        return "html"
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/html", "application/xhtml+xml"):
+        return "html"
+    if content_type == "text/csv" or (not content_type.startswith("text/") and url.lower().endswith(".csv")):
+        return "csv"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed prefix is still text.
+        if e.start < len(head) - 3:
+            return None
+    return "text"
+
+
+class _HtmlText(HTMLParser):
+    """Visible text and title of an HTML page."""
+
+    SKIP = {"script", "style", "noscript", "template", "svg"}
+    BLOCK = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article", "pre", "td"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = ""
+        self.language = ""
+        self._skipping = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "html":
+            self.language = dict(attrs).get("lang") or ""
+        if tag == "title":
+            self._in_title = True
+        elif tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skipping:
+            self.parts.append(data)
+
+    def text(self):
+        lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in "".join(self.parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def decode_body(body, content_type=""):
+    """The body as text, in the Content-Type's charset if it names a known one, else UTF-8."""
+    charset = re.search(r"charset=[\"']?([\w.:-]+)", content_type or "")
+    try:
+        return body.decode(charset.group(1) if charset else "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def html_to_text(html):
+    """Returns `(text, title, language)` of an HTML document."""
+    parser = _HtmlText()
+    parser.feed(html)
+    parser.close()
+    return parser.text(), parser.title.strip(), parser.language
+
+
+class UrlFetcher:
+    """Fetches URLs over one pooled HTTP session.
+
+    At most `per_host` requests run against any one host at a time, bodies are
+    streamed and abandoned once they exceed `max_bytes`, and when `store` (a
+    `DiskLRUCache`) is given, bodies served with an ETag or Last-Modified are kept so
+    the next fetch of the URL is a conditional request and a 304 reuses them.
+    """
+
+    def __init__(self, store=None, max_bytes=20 * 1024 * 1024, timeout=15, per_host=4, pool_size=16, headers=None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.per_host = per_host
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.not_modified = 0
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _cached(self, url):
+        if self.store is None:
+            return None
+        try:
+            data = self.store.get(url)
+        except Exception as e:
+            print(f"[WARN] URL cache read failed: {e}")
+            return None
+        if data is None:
+            return None
+        header, _, body = data.partition(b"\0")
+        return json.loads(header.decode("utf-8")), body
+
+    def _remember(self, url, response, body):
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type", ""),
+        }
+        if self.store is None or not (validators["etag"] or validators["last_modified"]):
+            return
+        try:
+            self.store.set(url, json.dumps(validators).encode("utf-8") + b"\0" + body)
+        except Exception as e:
+            print(f"[WARN] URL cache write failed: {e}")
+
+    def fetch(self, url):
+        """Fetches one URL; failures are returned in `error` rather than raised."""
+        cached = self._cached(url)
+        headers = {}
+        if cached:
+            if cached[0].get("etag"):
+                headers["If-None-Match"] = cached[0]["etag"]
+            if cached[0].get("last_modified"):
+                headers["If-Modified-Since"] = cached[0]["last_modified"]
+        try:
+            with self._host_slot(url):
+                with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and cached:
+                        with self._stats_lock:
+                            self.not_modified += 1
+                        validators, body = cached
+                        content_type = validators.get("content_type", "")
+                        return FetchResult(url, 304, sniff_kind(body, content_type, url), body, content_type, True, None)
+                    response.raise_for_status()
+                    body = self._read(response)
+        except Exception as e:
+            return FetchResult(url, None, None, None, "", False, str(e))
+
+        content_type = response.headers.get("Content-Type", "")
+        self._remember(url, response, body)
+        return FetchResult(url, response.status_code, sniff_kind(body, content_type, url), body, content_type, False, None)
+
+    def _read(self, response):
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ResponseTooLarge(f"{int(length) / 1024 / 1024:.1f}MB exceeds the {self.max_bytes / 1024 / 1024:.0f}MB limit")
+        chunks, size = [], 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ResponseTooLarge(f"body exceeds the {self.max_bytes / 1024 / 1024:.0f}MB limit")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def fetch_many(self, urls):
+        """Fetches `urls` concurrently (within the per-host limit); yields results as they finish."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.pool_size, len(urls))) as executor:
+            for future in concurrent.futures.as_completed([executor.submit(self.fetch, url) for url in urls]):
+                yield future.result()
@@ -1,17 +1,33 @@
 import os
 import json
+import asyncio
+import base64
+from datetime import datetime
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, StreamingHttpResponse
-from django.core.cache import cache
-from .rag_utils import get_answer, process_files_bulk, clear_data, generate_chat_title
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import Q
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import add_never_cache_headers
 from .forms import SignUpForm, UserUpdateForm, UserLoginForm, DocumentForm
-from .models import Document, ChatSession, ChatMessage
+from .models import Document, ChatSession, ChatMessage, IngestionJob
+from .chat_tasks import heuristic_title, retitle_later
+from .jobs import enqueue_ingestion
+from .metrics import REGISTRY, Timings
+from .rate_limit import check as rate_limit_check
 
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10 MB
+MAX_URLS_PER_UPLOAD = getattr(settings, 'MAX_URLS_PER_UPLOAD', 20)
+SESSIONS_PAGE_SIZE = 30
+MESSAGES_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
 
 
 def landing(request):
@@ -50,23 +66,81 @@ def user_logout(request):
     return redirect('landing')
 
 
-def rate_limit_user(max_calls=15, period=60):
+def rate_limit(scope):
+    """Rejects requests over `scope`'s limit in `rate_limit.RATE_LIMITS` with a 429 and `Retry-After`."""
+    def limited(retry_after):
+        response = JsonResponse({
+            'status': 'error',
+            'error': f'Rate limit exceeded. Try again in {retry_after} seconds.',
+            'message': f'Rate limit exceeded. Try again in {retry_after} seconds.',
+        }, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
     def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            async def wrapped_async_view(request, *args, **kwargs):
+                user = await _aget_user(request)
+                retry_after = await sync_to_async(rate_limit_check, thread_sensitive=False)(scope, user)
+                if retry_after:
+                    return limited(retry_after)
+                return await view_func(request, *args, **kwargs)
+            return wrapped_async_view
+
         def wrapped_view(request, *args, **kwargs):
-            if request.user.is_authenticated:
-                key = f"rate_limit_chat_{request.user.id}"
-                calls = cache.get(key, 0)
-                if calls >= max_calls:
-                    return JsonResponse(
-                        {'error': f'Rate limit exceeded. Max {max_calls} messages per minute.'},
-                        status=429
-                    )
-                cache.set(key, calls + 1, period)
+            retry_after = rate_limit_check(scope, request.user)
+            if retry_after:
+                return limited(retry_after)
             return view_func(request, *args, **kwargs)
         return wrapped_view
     return decorator
 
 
+async def _aget_user(request):
+    """Resolves `request.user` without touching the database from the event loop."""
+    if hasattr(request, 'auser'):
+        return await request.auser()
+
+    def resolve():
+        request.user.is_authenticated  # evaluates the lazy user on a sync thread
+        return request.user
+    return await sync_to_async(resolve)()
+
+
+def _encode_cursor(obj, field):
+    value = f"{getattr(obj, field).isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    moment, pk = value.rsplit('|', 1)
+    return datetime.fromisoformat(moment), int(pk)
+
+
+def _keyset_page(queryset, field, cursor=None, limit=30):
+    """Newest-first page of `queryset` ordered by (`field`, pk), starting after `cursor`.
+
+    Returns `(items, next_cursor)`; `next_cursor` is None on the last page. Keyset
+    pagination keeps deep pages as cheap as the first, unlike OFFSET.
+    """
+    if cursor:
+        moment, pk = _decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': moment}) | Q(**{field: moment, 'pk__lt': pk}))
+    items = list(queryset.order_by(f'-{field}', '-pk')[:limit + 1])
+    next_cursor = _encode_cursor(items[limit - 1], field) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+
+def _page_args(request, default):
+    """`(cursor, limit)` from the query string; raises ValueError when malformed."""
+    cursor = request.GET.get('cursor') or None
+    if cursor:
+        _decode_cursor(cursor)
+    limit = min(max(int(request.GET.get('limit', default)), 1), MAX_PAGE_SIZE)
+    return cursor, limit
+
+
 @login_required
 @never_cache
 def home(request):
@@ -77,11 +151,66 @@ def home(request):
             current_session = ChatSession.objects.get(id=session_id, user=request.user)
         except ChatSession.DoesNotExist:
             current_session = None
-    sessions = ChatSession.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'home.html', {'sessions': sessions, 'current_session': current_session})
+    # Only the newest page of sessions and messages is rendered; the dashboard fetches
+    # older ones from the paginated APIs as the user scrolls.
+    sessions, sessions_cursor = _keyset_page(
+        ChatSession.objects.filter(user=request.user), 'created_at', limit=SESSIONS_PAGE_SIZE
+    )
+    chat_messages, messages_cursor = [], None
+    if current_session:
+        chat_messages, messages_cursor = _keyset_page(
+            current_session.messages.all(), 'timestamp', limit=MESSAGES_PAGE_SIZE
+        )
+        chat_messages.reverse()
+    return render(request, 'home.html', {
+        'sessions': sessions,
+        'sessions_cursor': sessions_cursor,
+        'current_session': current_session,
+        'chat_messages': chat_messages,
+        'messages_cursor': messages_cursor,
+    })
+
+
+@login_required
+@never_cache
+def sessions_api(request):
+    """The user's chat sessions, newest first, one page per request."""
+    try:
+        cursor, limit = _page_args(request, SESSIONS_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+    sessions, next_cursor = _keyset_page(
+        ChatSession.objects.filter(user=request.user), 'created_at', cursor, limit
+    )
+    return JsonResponse({
+        'sessions': [
+            {'id': s.id, 'title': s.title, 'created_at': s.created_at.isoformat()} for s in sessions
+        ],
+        'next_cursor': next_cursor,
+    })
 
 
 @login_required
+@never_cache
+def session_messages_api(request, session_id):
+    """A session's messages, newest first, one page per request."""
+    session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+    try:
+        cursor, limit = _page_args(request, MESSAGES_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+    messages, next_cursor = _keyset_page(session.messages.all(), 'timestamp', cursor, limit)
+    return JsonResponse({
+        'messages': [
+            {'id': m.id, 'is_user': m.is_user, 'text': m.text, 'timestamp': m.timestamp.isoformat()}
+            for m in messages
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+@rate_limit('upload')
 def upload_api(request):
     if request.method == 'POST':
         session_id = request.POST.get('session_id')
@@ -107,32 +236,32 @@ def upload_api(request):
                 doc.size = f"{f.size/1024:.2f} KB"
                 doc.session = session
                 doc.save()
-                process_queue.append(doc.file.path)
+                process_queue.append((f.name, doc.file.path, doc))
                 results.append({'name': f.name, 'status': 'Uploaded'})
             else:
                 results.append({'name': f.name, 'status': 'Invalid Type'})
 
-        input_url = request.POST.get('url')
-        if input_url:
-            process_queue.append(input_url)
-            results.append({'name': input_url, 'status': 'URL Queued'})
+        # Any number of URLs, as repeated `url` fields and/or separated by whitespace.
+        urls = list(dict.fromkeys(
+            url for value in request.POST.getlist('url') for url in value.split()
+        ))
+        for position, input_url in enumerate(urls):
+            if urlsplit(input_url).scheme not in ('http', 'https') or not urlsplit(input_url).netloc:
+                results.append({'name': input_url, 'status': 'Invalid URL'})
+            elif position >= MAX_URLS_PER_UPLOAD:
+                results.append({'name': input_url, 'status': f'Rejected: over {MAX_URLS_PER_UPLOAD} URLs'})
+            else:
+                process_queue.append((input_url, input_url, None))
+                results.append({'name': input_url, 'status': 'URL Queued'})
 
         if process_queue:
-            success = process_files_bulk(process_queue, session.id)
-            final_status = 'Indexed' if success else 'Index Failed'
-            for res in results:
-                if res['status'] in ['Uploaded', 'URL Queued']:
-                    res['status'] = final_status
-
-            ChatMessage.objects.create(
-                session=session, is_user=True,
-                text=f"Uploaded {len(process_queue)} source(s)."
-            )
-            ChatMessage.objects.create(
-                session=session, is_user=False,
-                text="I have analyzed these sources. Ask me anything!"
-            )
-            return JsonResponse({'status': 'success', 'files': results, 'session_id': session.id})
+            job = enqueue_ingestion(session, process_queue)
+            return JsonResponse({
+                'status': 'success',
+                'job_id': job.id,
+                'files': results,
+                'session_id': session.id
+            }, status=202)
 
         if results:
             return JsonResponse({
@@ -148,7 +277,24 @@ def upload_api(request):
 
 @login_required
 @never_cache
-@rate_limit_user(max_calls=15, period=60)
+def upload_status_api(request, job_id):
+    job = get_object_or_404(IngestionJob, id=job_id, session__user=request.user)
+    files = [{'name': f.name, 'status': f.status} for f in job.files.order_by('id')]
+    return JsonResponse({
+        'job_id': job.id,
+        'session_id': job.session_id,
+        'status': job.status,
+        'done': job.is_finished,
+        'indexed': sum(1 for f in files if f['status'] == 'Indexed'),
+        'total': len(files),
+        'files': files,
+        'error': job.error,
+    })
+
+
+@login_required
+@never_cache
+@rate_limit('chat')
 def chat_api(request):
     if request.method != "POST":
         return JsonResponse({'error': 'Invalid request method'}, status=405)
@@ -159,43 +305,126 @@ def chat_api(request):
     if not user_msg:
         return JsonResponse({'error': 'Message cannot be empty'}, status=400)
 
-    if not session_id or session_id == 'null':
-        session = ChatSession.objects.create(user=request.user, title=user_msg[:30])
-        session_id = session.id
-        is_new_session = True
-    else:
-        session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-        is_new_session = False
+    timings = Timings("chat")
+    with timings.span("session"):
+        if not session_id or session_id == 'null':
+            session = ChatSession.objects.create(user=request.user, title=heuristic_title(user_msg))
+            session_id = session.id
+            is_new_session = True
+        else:
+            session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+            is_new_session = False
 
-    ChatMessage.objects.create(session=session, is_user=True, text=user_msg)
+        ChatMessage.objects.create(session=session, is_user=True, text=user_msg)
+
+    # Imported lazily so URL loading (and every manage.py command) doesn't pull in LangChain.
+    from .rag_utils import get_answer
 
     def event_stream():
         full_response = ""
+        meta = {'session_id': str(session.id)}
         try:
-            for chunk in get_answer(user_msg, session.id):
+            for chunk in get_answer(user_msg, session.id, timings):
                 full_response += chunk
                 yield chunk
 
-            ChatMessage.objects.create(session=session, is_user=False, text=full_response)
-
+            # Saved before the stream ends, so the next question's history includes it;
+            # only the LLM title waits for the background pool.
+            with timings.span("save"):
+                ChatMessage.objects.create(session=session, is_user=False, text=full_response)
             if is_new_session:
-                new_title = generate_chat_title(user_msg, full_response[:300])
-                session.title = new_title
-                session.save()
-                yield f"\n__META__:{json.dumps({'session_id': str(session.id), 'title': new_title})}"
+                retitle_later(session.id, user_msg, full_response, session.title)
+                meta['title'] = session.title
 
         except Exception as e:
             err = f"Error: {str(e)}"
             ChatMessage.objects.create(session=session, is_user=False, text=err)
             yield err
+        yield _meta_event(meta, timings)
 
     response = StreamingHttpResponse(event_stream(), content_type='text/plain')
     response['X-Session-ID'] = str(session.id)
     if is_new_session:
         response['X-Session-Title'] = session.title
+    # Headers go out before the answer is generated, so they can only report the time
+    # until streaming starts; the per-stage breakdown arrives in the trailing __META__ event.
+    response['Server-Timing'] = timings.elapsed_timing("prestream", "Before streaming")
     return response
 
 
+def _meta_event(meta, timings):
+    """The trailing stream event: session metadata, per-stage timings in ms and prompt token figures."""
+    return f"\n__META__:{json.dumps({**meta, 'timings': timings.as_dict(), 'context': timings.notes()})}"
+
+
+@rate_limit('chat')
+async def achat_api(request):
+    """ASGI variant of `chat_api`: the answer is streamed from an async generator, so an
+    in-flight chat waits on the event loop instead of occupying a worker thread."""
+    user = await _aget_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if request.method != "POST":
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    user_msg = request.POST.get('message', '').strip()
+    session_id = request.POST.get('session_id')
+
+    if not user_msg:
+        return JsonResponse({'error': 'Message cannot be empty'}, status=400)
+
+    timings = Timings("chat")
+    with timings.span("session"):
+        if not session_id or session_id == 'null':
+            session = await ChatSession.objects.acreate(user=user, title=heuristic_title(user_msg))
+            is_new_session = True
+        else:
+            try:
+                session = await ChatSession.objects.aget(id=session_id, user=user)
+            except ChatSession.DoesNotExist:
+                raise Http404("No ChatSession matches the given query.")
+            is_new_session = False
+
+        await ChatMessage.objects.acreate(session=session, is_user=True, text=user_msg)
+
+    from .rag_utils import aget_answer
+
+    async def event_stream():
+        full_response = ""
+        meta = {'session_id': str(session.id)}
+        try:
+            async for chunk in aget_answer(user_msg, session.id, timings):
+                full_response += chunk
+                yield chunk
+
+            with timings.span("save"):
+                await ChatMessage.objects.acreate(session=session, is_user=False, text=full_response)
+            if is_new_session:
+                retitle_later(session.id, user_msg, full_response, session.title)
+                meta['title'] = session.title
+
+        except Exception as e:
+            err = f"Error: {str(e)}"
+            await ChatMessage.objects.acreate(session=session, is_user=False, text=err)
+            yield err
+        yield _meta_event(meta, timings)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/plain')
+    response['X-Session-ID'] = str(session.id)
+    if is_new_session:
+        response['X-Session-Title'] = session.title
+    response['Server-Timing'] = timings.elapsed_timing("prestream", "Before streaming")
+    add_never_cache_headers(response)
+    return response
+
+
+@staff_member_required
+@never_cache
+def metrics_api(request):
+    """Stage latency histograms and cache counters of this worker process, for Prometheus."""
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def delete_chat_session(request, session_id):
     if request.method == "POST":
@@ -206,6 +435,7 @@ def delete_chat_session(request, session_id):
                     os.remove(doc.file.path)
                 except OSError:
                     pass
+        from .rag_utils import clear_data
         clear_data(session.id)
         session.delete()
     return redirect('home')
@@ -7,6 +7,10 @@ if (typeof currentSessionId === 'undefined') {
     var currentSessionId = 'null';
 }
 
+const BOT_AVATAR = `<div class="msg-avatar bot-avatar"><svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 10V3L4 14h7v7l9-11h-7z"></path></svg></div>`;
+const USER_AVATAR = `<div class="msg-avatar user-avatar"><svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z"></path></svg></div>`;
+const FILE_ICON = `<svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M9 12h6m-6 4h6m2 5H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z"></path></svg>`;
+
 document.addEventListener("DOMContentLoaded", function () {
     document.querySelectorAll('[data-markdown="true"] .msg-content').forEach(el => {
         if (window.marked && window.DOMPurify) {
@@ -14,154 +18,188 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     });
     scrollToBottom();
+    setupInfiniteScroll();
 });
 
-async function sendMessage() {
-    const message = userInput.value.trim();
-    if (!message) return;
-
-    appendMessage('user', message);
-    userInput.value = '';
-    userInput.disabled = true;
-
-    const botMessageDiv = appendMessage('bot', '<span class="typing-indicator">Thinking...</span>');
-    const botContentDiv = botMessageDiv.querySelector('.msg-content');
-
-    try {
-        const chatUrl = document.getElementById('urls').dataset.chat;
-        const formData = new FormData();
-        formData.append('message', message);
-        formData.append('session_id', currentSessionId);
-        if (csrfToken) formData.append('csrfmiddlewaretoken', csrfToken);
-
-        const response = await fetch(chatUrl, { method: 'POST', body: formData });
-        if (!response.body) throw new Error("No response stream");
-
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let fullText = "";
-
-        botContentDiv.innerHTML = "";
-
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-
-            fullText += decoder.decode(value, { stream: true });
-            const displayText = fullText.replace(/__META__:.*/, '');
-
-            if (window.marked && window.DOMPurify) {
-                botContentDiv.innerHTML = DOMPurify.sanitize(marked.parse(displayText));
-            } else {
-                botContentDiv.innerText = displayText;
-            }
-            scrollToBottom();
+// Sessions and messages arrive in pages (newest first): older sessions are appended to
+// the sidebar as it scrolls down, older messages prepended as the chat scrolls up.
+function setupInfiniteScroll() {
+    const historyList = document.getElementById('history-list');
+    const sessionsUrl = document.getElementById('urls').dataset.sessions;
+    let loadingSessions = false;
+    let loadingMessages = false;
+
+    async function loadSessions() {
+        const cursor = historyList.dataset.cursor;
+        if (!cursor || loadingSessions) return;
+        loadingSessions = true;
+        try {
+            const response = await fetch(`${sessionsUrl}?cursor=${encodeURIComponent(cursor)}`);
+            const page = await response.json();
+            page.sessions.forEach(session => historyList.appendChild(renderSessionItem(session)));
+            historyList.dataset.cursor = page.next_cursor || '';
+        } catch (error) {
+            console.error("Session list error:", error);
+            return;
+        } finally {
+            loadingSessions = false;
         }
+        // Keep going until the list overflows, so there is something to scroll.
+        if (historyList.scrollHeight <= historyList.clientHeight) loadSessions();
+    }
 
-        const metaMatch = fullText.match(/__META__:(\{.*?\})/);
-        if (metaMatch) {
-            try {
-                const meta = JSON.parse(metaMatch[1]);
-                fullText = fullText.replace(/__META__:.*/, '').trim();
-                currentSessionId = meta.session_id;
-                window.history.pushState({}, '', `?session_id=${meta.session_id}`);
-                const titleEl = document.querySelector('.chat-title');
-                if (titleEl && meta.title) titleEl.innerText = meta.title;
-                if (meta.title) location.reload();
-            } catch(e) { console.warn('Meta parse error', e); }
-        }
-
-        if (window.marked && window.DOMPurify) {
-            botContentDiv.innerHTML = DOMPurify.sanitize(marked.parse(fullText));
-        } else {
-            botContentDiv.innerText = fullText;
-        }
-
-        const newSessionId = response.headers.get('X-Session-ID');
-        const newTitle = response.headers.get('X-Session-Title');
-
-        if (newSessionId && currentSessionId === 'null') {
-            currentSessionId = newSessionId;
-            window.history.pushState({}, '', `?session_id=${newSessionId}`);
-            const titleEl = document.querySelector('.chat-title');
-            if (titleEl && newTitle) titleEl.innerText = newTitle;
+    async function loadOlderMessages() {
+        const cursor = chatBox.dataset.cursor;
+        if (!cursor || loadingMessages) return;
+        loadingMessages = true;
+        try {
+            const response = await fetch(`${chatBox.dataset.messages}?cursor=${encodeURIComponent(cursor)}`);
+            const page = await response.json();
+            const previousHeight = chatBox.scrollHeight;
+            page.messages.forEach(msg => chatBox.insertBefore(renderHistoryMessage(msg), chatBox.firstChild));
+            chatBox.scrollTop += chatBox.scrollHeight - previousHeight;
+            chatBox.dataset.cursor = page.next_cursor || '';
+        } catch (error) {
+            console.error("Message history error:", error);
+        } finally {
+            loadingMessages = false;
         }
+    }
 
-    } catch (error) {
-        console.error("Chat Error:", error);
-        botContentDiv.innerHTML = `<span style="color:var(--danger)">Error: ${error.message}</span>`;
-    } finally {
-        userInput.disabled = false;
-        userInput.focus();
-        scrollToBottom();
+    if (historyList) {
+        historyList.addEventListener('scroll', () => {
+            if (historyList.scrollTop + historyList.clientHeight >= historyList.scrollHeight - 100) loadSessions();
+        });
+        if (historyList.scrollHeight <= historyList.clientHeight) loadSessions();
+    }
+    if (chatBox && chatBox.dataset.messages) {
+        chatBox.addEventListener('scroll', () => {
+            if (chatBox.scrollTop < 100) loadOlderMessages();
+        });
+        if (chatBox.scrollHeight <= chatBox.clientHeight) loadOlderMessages();
     }
 }
 
-async function uploadFiles(files) {
-    if (files.length === 0) return;
+// URLs of per-object endpoints are reversed in the template with a placeholder id of 0.
+function urlFor(name, id) {
+    return document.getElementById('urls').dataset[name].replace(/\/0\/$/, `/${id}/`);
+}
 
-    const statusDiv = document.getElementById('upload-progress');
-    const uploadUrl = document.getElementById('urls').dataset.upload;
+function renderSessionItem(session) {
+    const item = document.createElement('div');
+    item.className = 'history-item' + (String(session.id) === String(currentSessionId) ? ' active' : '');
+    item.onclick = () => { location.href = `${document.getElementById('urls').dataset.home}?session_id=${session.id}`; };
+    item.innerHTML = `
+        <span style="white-space: nowrap; overflow: hidden; text-overflow: ellipsis; flex: 1; font-size: 0.95rem;"></span>
+        <div style="display: flex; gap: 5px;">
+            <button class="action-btn" title="Rename">
+                <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15.232 5.232l3.536 3.536m-2.036-5.036a2.5 2.5 0 113.536 3.536L6.5 21.036H3v-3.572L16.732 3.732z"></path></svg>
+            </button>
+            <form action="${urlFor('deleteSession', session.id)}" method="POST" style="margin:0;" onclick="event.stopPropagation();">
+                <input type="hidden" name="csrfmiddlewaretoken">
+                <button class="action-btn" style="color: #ef4444;" title="Delete">
+                    <svg width="14" height="14" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M19 7l-.867 12.142A2 2 0 0116.138 21H7.862a2 2 0 01-1.995-1.858L5 7m5 4v6m4-6v6m1-10V4a1 1 0 00-1-1h-4a1 1 0 00-1 1v3M4 7h16"></path></svg>
+                </button>
+            </form>
+        </div>`;
+    item.querySelector('span').textContent = session.title;
+    item.querySelector('input[name=csrfmiddlewaretoken]').value = csrfToken;
+    item.querySelector('button[title=Rename]').onclick = (e) => openRenameModal(e, session.id, session.title);
+    return item;
+}
 
-    statusDiv.style.display = 'block';
-    statusDiv.innerText = `Uploading ${files.length} file(s)...`;
+// A new chat starts with a quick local title; the reply is saved and the chat retitled
+// in the background after the stream ends, so add it to the sidebar here and poll for
+// the final title instead of reloading the page.
+function showNewSession(sessionId, title) {
+    const historyList = document.getElementById('history-list');
+    const titleEl = document.querySelector('.chat-title');
+    if (titleEl) titleEl.innerText = title;
+    if (!historyList) return;
+    historyList.querySelectorAll('.history-item.active').forEach(item => item.classList.remove('active'));
+    if (!historyList.querySelector('.history-item')) historyList.innerHTML = '';
+    const item = renderSessionItem({ id: sessionId, title: title });
+    historyList.insertBefore(item, historyList.firstChild);
+
+    waitForTitle(sessionId, title).then(session => {
+        if (!session || !item.isConnected) return;
+        historyList.replaceChild(renderSessionItem(session), item);
+        if (titleEl && String(currentSessionId) === String(sessionId)) titleEl.innerText = session.title;
+    });
+}
 
-    const formData = new FormData();
-    for (let i = 0; i < files.length; i++) {
-        formData.append('files', files[i]);
-    }
-    formData.append('session_id', currentSessionId);
-    if (csrfToken) formData.append('csrfmiddlewaretoken', csrfToken);
-
-    try {
-        const response = await fetch(uploadUrl, { method: 'POST', body: formData });
-        const data = await response.json();
-
-        if (data.status === 'success') {
-            statusDiv.innerText = "Indexing Complete!";
-            handleNewSession(data.session_id);
-        } else {
-            statusDiv.innerText = "Error: " + data.message;
-            setTimeout(() => statusDiv.style.display = 'none', 3000);
+const TITLE_MAX_WAIT_MS = 60 * 1000;
+const TITLE_MAX_ERRORS = 3;
+
+// Polls the newest sessions until this one's title differs from `title`, backing off
+// from 1.5s to 10s between polls, like waitForIngestion. Returns the retitled session,
+// or null when the session is gone, the endpoint keeps failing or TITLE_MAX_WAIT_MS passes.
+async function waitForTitle(sessionId, title) {
+    const deadline = Date.now() + TITLE_MAX_WAIT_MS;
+    let delay = 1500;
+    let errors = 0;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, delay));
+        delay = Math.min(delay * 1.5, 10000);
+        try {
+            const response = await fetch(`${document.getElementById('urls').dataset.sessions}?limit=5`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const page = await response.json();
+            const session = page.sessions.find(s => String(s.id) === String(sessionId));
+            if (!session) return null;
+            if (session.title !== title) return session;
+            errors = 0;
+        } catch (error) {
+            console.error("Session title refresh error:", error);
+            if (++errors >= TITLE_MAX_ERRORS) return null;
         }
-    } catch (error) {
-        statusDiv.innerText = "Upload Failed";
-        setTimeout(() => statusDiv.style.display = 'none', 3000);
     }
+    return null;
 }
 
-async function uploadUrl() {
-    const url = document.getElementById('urlInput').value.trim();
-    if (!url) return alert("Please enter a URL");
-
-    const statusDiv = document.getElementById('upload-progress');
-    const uploadEndpoint = document.getElementById('urls').dataset.upload;
-
-    statusDiv.style.display = 'block';
-    statusDiv.innerText = "Scanning URL...";
-
-    const formData = new FormData();
-    formData.append('url', url);
-    formData.append('session_id', currentSessionId);
-    if (csrfToken) formData.append('csrfmiddlewaretoken', csrfToken);
-
-    try {
-        const response = await fetch(uploadEndpoint, { method: 'POST', body: formData });
-        const data = await response.json();
-
-        if (data.status === 'success') {
-            statusDiv.innerText = "URL Indexed!";
-            document.getElementById('urlInput').value = "";
-            handleNewSession(data.session_id);
-        } else {
-            statusDiv.innerText = "Error: " + data.message;
+// Polls the job until it finishes, backing off from 1s to 10s between polls. Gives up
+// (returning a job with status 'failed' and no job_id) when the job is gone, the
+// status endpoint keeps failing, or the job outlasts INGESTION_MAX_WAIT_MS.
+async function waitForIngestion(jobId, statusDiv) {
+    const deadline = Date.now() + INGESTION_MAX_WAIT_MS;
+    let delay = 1000;
+    let errors = 0;
+    while (Date.now() < deadline) {
+        let response = null;
+        try {
+            response = await fetch(urlFor('uploadStatus', jobId));
+        } catch (error) {
+            console.error(error);
+        }
+        if (response && response.status === 404) {
+            return { status: 'failed', done: true, error: 'Upload job not found' };
+        }
+        if (response && response.ok) {
+            const job = await response.json();
+            if (job.done) return job;
+            errors = 0;
+            statusDiv.innerText = `Indexing ${job.indexed}/${job.total} source(s)...`;
+        } else if (++errors >= INGESTION_MAX_ERRORS) {
+            return { status: 'failed', done: true, error: 'Lost contact with the server' };
         }
-    } catch (error) {
-        statusDiv.innerText = "Network Error";
-        console.error(error);
+        await new Promise(resolve => setTimeout(resolve, delay));
+        delay = Math.min(delay * 1.5, 10000);
     }
+    return { status: 'failed', done: true, error: 'Still indexing, check back later' };
+}
 
-    setTimeout(() => { statusDiv.style.display = 'none'; }, 3000);
+// Reports a finished ingestion job; reloads into the session unless polling gave up.
+function finishIngestion(job, statusDiv, sessionId, successText) {
+    if (job.status === 'done') {
+        statusDiv.innerText = successText;
+    } else {
+        statusDiv.innerText = job.error ? `Indexing Failed: ${job.error}` : "Indexing Failed";
+    }
+    if (job.job_id) {
+        handleNewSession(sessionId);
+    } else {
+        setTimeout(() => statusDiv.style.display = 'none', 5000);
+    }
 }
 
 function handleNewSession(sessionId) {
@@ -177,14 +215,11 @@ function appendMessage(sender, htmlContent) {
     const div = document.createElement('div');
     div.className = `msg-container msg-container-${sender}`;
 
-    const botAvatar = `<div class="msg-avatar bot-avatar"><svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M13 10V3L4 14h7v7l9-11h-7z"></path></svg></div>`;
-    const userAvatar = `<div class="msg-avatar user-avatar"><svg width="20" height="20" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z"></path></svg></div>`;
-
-    div.innerHTML = `${sender === 'bot' ? botAvatar : ''}
+    div.innerHTML = `${sender === 'bot' ? BOT_AVATAR : ''}
                      <div class="msg msg-${sender}">
                          <div class="msg-content">${htmlContent}</div>
                      </div>
-                     ${sender === 'user' ? userAvatar : ''}`;
+                     ${sender === 'user' ? USER_AVATAR : ''}`;
     chatBox.appendChild(div);
     scrollToBottom();
     return div;